@@ -0,0 +1,220 @@
+"""
+Throughput, per-packet latency and peak memory of the packet ingest pipeline.
+
+Synthetic TEXT_MESSAGE_APP, TELEMETRY_APP, POSITION_APP and ADMIN_APP traffic is pushed through
+- wrappers:     Message / TextMsg / TelemetryMsg / AdminMsg / NodeParser, no app involved
+- update_nodes: PacketIngest.update_nodes with one node event per packet
+- text_rx:      PacketIngest.text_rx with text packets only
+- rx_packet:    meshChatApp.rx_packet with the full portnum mix
+- bridge:       the same mix published from a reader thread through the receive bridge. Latency is what the
+                reader thread pays per packet, throughput is until the event loop has handled every packet.
+for every combination of --packets and --nodes. The app runs headless with an in-memory database, and the writer
+is flushed at the end of each run so batched commits are counted in the throughput.
+
+Results are written as JSON so runs on different versions can be compared:
+
+    python benchmarks/bench_ingest.py -p 1000 -p 10000 -p 100000 -n 10 -n 500 -n 5000 -o before.json
+    python benchmarks/bench_ingest.py -o after.json --compare before.json
+"""
+# Standard library imports
+import asyncio
+import datetime
+import json
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import threading
+from time import perf_counter
+import tracemalloc
+
+# Installed 3rd party modules
+import click
+from rich.console import Console
+from rich.table import Table
+
+from common import REPO_ROOT, fake_node, fake_traffic, new_bench_app
+
+from meshChatLib.utils import AdminMsg, Message, NodeParser, TelemetryMsg, TextMsg
+
+SCENARIOS = ("wrappers", "update_nodes", "text_rx", "rx_packet", "bridge")
+RESULTS_VERSION = 1
+
+
+def parse_packet(packet: dict, node: dict) -> None:
+    """
+    Everything the wrappers get asked for on the receive path
+    """
+    msg = Message(packet)
+    portnum = msg.portnum
+    msg.msg_id, msg.from_radio_id, msg.to_radio_id, msg.from_radio_num
+    if portnum == "TEXT_MESSAGE_APP":
+        txt = TextMsg(raw_msg=packet)
+        txt.text, txt.rxSnr, txt.rxRssi, txt.rxTime
+    elif portnum == "TELEMETRY_APP":
+        tel = TelemetryMsg(raw_msg=packet)
+        tel.airUtilTx, tel.timestamp
+    elif portnum == "ADMIN_APP":
+        AdminMsg(raw_msg=packet)
+    NodeParser(node).as_dict()
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def drive(scenario: str, packets: list, node_count: int) -> tuple:
+    """
+    Push the packets through one scenario. Returns the per-packet latencies and the wall clock time.
+    """
+    latencies = list()
+    nodes = [fake_node(num) for num in range(node_count)]
+
+    if scenario == "wrappers":
+        start = perf_counter()
+        for counter, packet in enumerate(packets):
+            node = nodes[counter % node_count]
+            packet_start = perf_counter()
+            parse_packet(packet, node)
+            latencies.append(perf_counter() - packet_start)
+        return latencies, perf_counter() - start
+
+    app = new_bench_app()
+    async with app.run_test() as pilot:
+        await pilot.pause()
+        # Every sender is known before traffic starts, like after the radio's initial node dump
+        for node in nodes:
+            app.ingest.update_nodes(node, interface=None)
+        app.writer.flush()
+        app.node_listview_table_update(full=True)
+
+        if scenario == "text_rx":
+            packets = [TextMsg(raw_msg=packet) for packet in packets
+                       if packet["decoded"]["portnum"] == "TEXT_MESSAGE_APP"]
+
+        if scenario == "bridge":
+            listener = app.bridge.listener(app.rx_packet)
+
+            def reader():
+                for packet in packets:
+                    packet_start = perf_counter()
+                    listener(packet=packet, interface=app.interface)
+                    latencies.append(perf_counter() - packet_start)
+
+            start = perf_counter()
+            reader_thread = threading.Thread(target=reader)
+            reader_thread.start()
+            while reader_thread.is_alive() or app.bridge.depth:
+                await asyncio.sleep(0.001)
+            app.writer.flush()
+            wall = perf_counter() - start
+            app.writer.close()
+            app.exit()
+            return latencies, wall
+
+        start = perf_counter()
+        for counter, packet in enumerate(packets):
+            packet_start = perf_counter()
+            if scenario == "update_nodes":
+                node = nodes[counter % node_count]
+                node["snr"] = counter
+                app.ingest.update_nodes(node, interface=None)
+            elif scenario == "text_rx":
+                app.ingest.text_rx(txt_msg=packet)
+            else:
+                app.rx_packet(packet, interface=app.interface)
+            latencies.append(perf_counter() - packet_start)
+        app.writer.flush()
+        wall = perf_counter() - start
+
+        app.writer.close()
+        app.exit()
+    return latencies, wall
+
+
+def run_case(scenario: str, packet_count: int, node_count: int, memory: bool) -> dict:
+    packets = fake_traffic(packet_count, node_count)
+    latencies, wall = asyncio.run(drive(scenario, packets, node_count))
+    latencies.sort()
+
+    peak_kib = None
+    if memory:
+        # Separate pass, tracemalloc would skew the timings
+        packets = fake_traffic(packet_count, node_count)
+        tracemalloc.start()
+        asyncio.run(drive(scenario, packets, node_count))
+        peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    return {"scenario": scenario, "packets": packet_count, "nodes": node_count,
+            "processed": len(latencies),
+            "throughput_pps": len(latencies) / wall if wall else 0.0,
+            "p50_us": percentile(latencies, 0.50) * 1e6,
+            "p99_us": percentile(latencies, 0.99) * 1e6,
+            "peak_mem_kib": peak_kib}
+
+
+def run_metadata() -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {"version": RESULTS_VERSION, "revision": revision, "python": platform.python_version(),
+            "platform": platform.platform(), "when": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+@click.command()
+@click.option("--packets", "-p", multiple=True, type=int, default=[1000, 10000], show_default=True,
+              help="Packet counts to run")
+@click.option("--nodes", "-n", multiple=True, type=int, default=[10, 500], show_default=True,
+              help="Node counts to run")
+@click.option("--scenario", "-s", multiple=True, type=click.Choice(SCENARIOS), default=SCENARIOS,
+              show_default=True, help="Pipeline stages to run")
+@click.option("--memory/--no-memory", default=True, show_default=True,
+              help="Measure peak memory with tracemalloc in a second pass")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default="bench_results.json",
+              show_default=True, help="Where to write the JSON results")
+@click.option("--compare", "-c", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Earlier results file to compare throughput against")
+def main(packets, nodes, scenario, memory, output, compare):
+    console = Console()
+    results = list()
+    for scenario_name in scenario:
+        for node_count in nodes:
+            for packet_count in packets:
+                console.log(f"{scenario_name}: {packet_count} packets, {node_count} nodes")
+                results.append(run_case(scenario_name, packet_count, node_count, memory))
+
+    Path(output).write_text(json.dumps({"meta": run_metadata(), "results": results}, indent=2))
+    console.log(f"Results written to {output}")
+
+    baseline = dict()
+    if compare:
+        for result in json.loads(Path(compare).read_text())["results"]:
+            baseline[(result["scenario"], result["packets"], result["nodes"])] = result
+
+    table = Table(title="Packet ingest")
+    for column in ("Scenario", "Packets", "Nodes", "Packets/s", "p50 (µs)", "p99 (µs)", "Peak mem (KiB)"):
+        table.add_column(column, justify="left" if column == "Scenario" else "right")
+    if compare:
+        table.add_column("vs baseline", justify="right")
+    for result in results:
+        row = [result["scenario"], str(result["packets"]), str(result["nodes"]),
+               f"{result['throughput_pps']:,.0f}", f"{result['p50_us']:.1f}", f"{result['p99_us']:.1f}",
+               f"{result['peak_mem_kib']:,.0f}" if result["peak_mem_kib"] is not None else "-"]
+        if compare:
+            old = baseline.get((result["scenario"], result["packets"], result["nodes"]))
+            if old and old["throughput_pps"]:
+                change = (result["throughput_pps"] / old["throughput_pps"] - 1) * 100
+                row.append(f"[{'green' if change >= 0 else 'red'}]{change:+.1f}%[/]")
+            else:
+                row.append("-")
+        table.add_row(*row)
+    console.print(table)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Per-packet cost of the node sidebar update as the node count grows.
+
+Each simulated packet feeds one node update through update_nodes and then runs node_listview_table_update, which is
+what rx_packet does. The full rebuild the sidebar used to do on every packet is timed alongside for comparison.
+
+    python benchmarks/bench_node_list.py -s 10 -s 100 -s 500 -s 2000 --packets 200
+"""
+# Standard library imports
+import asyncio
+import random
+import statistics
+from time import perf_counter
+
+# Installed 3rd party modules
+import click
+from rich.console import Console
+from rich.table import Table
+from textual.widgets import OptionList
+
+from common import fake_node, new_bench_app
+
+
+async def run_size(node_count: int, packets: int) -> dict:
+    app = new_bench_app()
+    async with app.run_test() as pilot:
+        await pilot.pause()
+        for num in range(node_count):
+            app.ingest.update_nodes(fake_node(num), interface=None)
+        app.node_listview_table_update(full=True)
+
+        incremental = list()
+        full = list()
+        for packet in range(packets):
+            num = random.randrange(node_count)
+            # Rename the node so the sidebar row really changes
+            node = fake_node(num, snr=packet)
+            node["user"]["longName"] = f"Node {num} #{packet}"
+            app.ingest.update_nodes(node, interface=None)
+
+            start = perf_counter()
+            app.node_listview_table_update()
+            incremental.append(perf_counter() - start)
+
+        # The old behaviour: throw every option away and rebuild them all
+        for packet in range(min(packets, 5)):
+            start = perf_counter()
+            app.screen.query_one("#nodes", OptionList).clear_options()
+            app.node_option_rows.clear()
+            app.node_listview_table_update(full=True)
+            full.append(perf_counter() - start)
+        app.writer.close()
+        app.exit()
+
+    return {"nodes": node_count,
+            "incremental_ms": statistics.median(incremental) * 1000,
+            "full_ms": statistics.median(full) * 1000}
+
+
+@click.command()
+@click.option("--sizes", "-s", multiple=True, type=int, default=[10, 100, 500, 1000, 2000], show_default=True,
+              help="Node counts to benchmark")
+@click.option("--packets", "-p", type=int, default=200, show_default=True, help="Simulated packets per size")
+def main(sizes, packets):
+    console = Console()
+    table = Table(title="Node sidebar update, median per packet")
+    table.add_column("Nodes", justify="right")
+    table.add_column("Incremental (ms)", justify="right")
+    table.add_column("Full rebuild (ms)", justify="right")
+    for node_count in sizes:
+        result = asyncio.run(run_size(node_count, packets))
+        table.add_row(str(result["nodes"]), f"{result['incremental_ms']:.3f}", f"{result['full_ms']:.3f}")
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Message search latency on a large history.
+
+Fills a throwaway database with synthetic chat, indexed by the same triggers text_rx's inserts go through, then times
+the kinds of queries the search screen runs.
+
+    python benchmarks/bench_search.py --rows 1000000
+"""
+# Standard library imports
+import datetime
+from pathlib import Path
+import random
+import statistics
+import tempfile
+from time import perf_counter
+
+# Installed 3rd party modules
+import click
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import insert
+
+import common  # noqa: F401, puts the repo on sys.path
+from meshChatLib.models import ChannelHistory
+from meshChatLib.search import HistorySearch
+from meshChatLib.storage import open_engine
+
+WORDS = ("net check weather report tonight relay battery solar antenna repeater node mesh hello copy roger "
+         "north south ridge trail camp water signal range hike summit base").split()
+QUERIES = ("relay", "rel*", '"net check"', "battery solar", "from:!00000007 summit",
+           "channel:!dm antenna", "since:2026-06-01 until:2026-06-02 water")
+
+
+def fill(engine, rows: int, senders: int = 200, batch: int = 10000) -> None:
+    rng = random.Random(0)
+    start = datetime.datetime(2026, 1, 1)
+    with engine.begin() as connection:
+        for first in range(0, rows, batch):
+            connection.execute(insert(ChannelHistory), [
+                {"from_radio_id": f"!{rng.randrange(senders):08x}",
+                 "to_channel": "!dm" if rng.random() < 0.1 else "^all",
+                 "msg_text": " ".join(rng.choices(WORDS, k=rng.randint(3, 10))),
+                 "time_rx": start + datetime.timedelta(seconds=row * 15)}
+                for row in range(first, min(first + batch, rows))])
+
+
+@click.command()
+@click.option("--rows", "-r", type=int, default=1000000, show_default=True, help="Messages in the history")
+@click.option("--repeat", "-n", type=int, default=20, show_default=True, help="Runs per query")
+def main(rows, repeat):
+    console = Console()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = open_engine(Path(tmp) / "bench_search.db")
+        start = perf_counter()
+        fill(engine, rows)
+        console.print(f"Inserted and indexed {rows:,} messages in {perf_counter() - start:.1f} s")
+
+        search = HistorySearch(engine)
+        table = Table(title=f"Search latency over {rows:,} messages")
+        table.add_column("Query")
+        table.add_column("Results", justify="right")
+        table.add_column("Median (ms)", justify="right")
+        table.add_column("Max (ms)", justify="right")
+        for query in QUERIES:
+            timings = list()
+            for _ in range(repeat):
+                results = search.search(query)
+                timings.append(search.last_search_ms)
+            table.add_row(query, str(len(results)), f"{statistics.median(timings):.2f}", f"{max(timings):.2f}")
+        console.print(table)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Cold start times, checked against a budget.
+
+- help:      `meshLibTest.py --help`, which shouldn't load anything but click
+- frame:     process start until the app's first frame is up (Textual's Ready)
+- connected: process start until the local radio's meshtastic.connection.established has been handled
+
+Every run is a fresh interpreter. Without --radio the app replays a one-event journal, so connected measures the
+app's own work rather than the radio's config download. Exits with status 1 when a median is over its budget:
+
+    python benchmarks/bench_startup.py -n 10 --budget-frame 1.0
+"""
+# Standard library imports
+import gzip
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, time
+
+# Installed 3rd party modules
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PHASES = ("help", "frame", "connected")
+LOCAL_USER = {"id": "!0000beef", "longName": "Startup bench", "shortName": "SB", "macaddr": "be:ef:00:00:be:ef",
+              "hwModel": "TBEAM"}
+
+
+def write_journal(journal_path: Path) -> None:
+    """
+    A journal with nothing in it but the local radio connecting
+    """
+    with gzip.open(journal_path, "wt", encoding="utf-8") as journal:
+        journal.write(json.dumps({"meshChatJournal": 1, "started": time()}) + "\n")
+        journal.write(json.dumps([0, "meshtastic.connection.established", {"my_user": LOCAL_USER}]) + "\n")
+
+
+def time_help() -> float:
+    start = perf_counter()
+    subprocess.run([sys.executable, str(REPO_ROOT / "meshLibTest.py"), "--help"], check=True,
+                   stdout=subprocess.DEVNULL)
+    return perf_counter() - start
+
+
+def time_app(journal_path: Path | None, radio: str | None) -> dict:
+    """
+    Seconds from spawning the app until each of its startup marks
+    """
+    command = [sys.executable, __file__, "--child"]
+    if radio is not None:
+        command += ["--radio", radio]
+    else:
+        command += ["--journal", str(journal_path)]
+    start = perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    marks = dict()
+    for line in child.stdout:
+        mark = line.strip()
+        if mark in PHASES:
+            marks[mark] = perf_counter() - start
+    child.wait()
+    if child.returncode != 0 or set(marks) != {"frame", "connected"}:
+        raise click.ClickException(f"Startup run failed with status {child.returncode}, marks {marks}")
+    return marks
+
+
+def run_child(journal: str | None, radio: str | None) -> None:
+    """
+    The app under test, printing a line at every startup mark
+    """
+    sys.path.insert(0, str(REPO_ROOT))
+    from meshChatLib.app import meshChatApp
+
+    class StartupApp(meshChatApp):
+        CSS_PATH = str(REPO_ROOT / "meshChatLib" / meshChatApp.CSS_PATH)
+
+        def on_ready(self) -> None:
+            # Runs before meshChatApp.on_ready opens the radio
+            print("frame", flush=True)
+
+        def on_local_connection(self, interface):
+            super().on_local_connection(interface)
+            print("connected", flush=True)
+            self.exit()
+
+    app = StartupApp(radio_paths=[radio or "/dev/null"], database_path=":memory:", db_in_memory=True,
+                     replay_path=journal, replay_speed=0)
+    app.run(headless=True)
+    app.radios.close()
+    app.writer.close()
+
+
+@click.command()
+@click.option("--repeat", "-n", type=int, default=5, show_default=True, help="Cold starts per phase")
+@click.option("--radio", "-r", default=None, help="Connect to this radio instead of replaying a journal")
+@click.option("--budget-help", type=float, default=0.3, show_default=True, help="Seconds allowed for --help")
+@click.option("--budget-frame", type=float, default=1.5, show_default=True,
+              help="Seconds allowed until the first frame")
+@click.option("--budget-connected", type=float, default=2.0, show_default=True,
+              help="Seconds allowed until the radio is connected")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Also write the results here as JSON")
+@click.option("--child", is_flag=True, hidden=True)
+@click.option("--journal", default=None, hidden=True)
+def main(repeat, radio, budget_help, budget_frame, budget_connected, output, child, journal):
+    if child:
+        run_child(journal, radio)
+        return
+
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    timings = {phase: list() for phase in PHASES}
+    with tempfile.TemporaryDirectory() as tmp:
+        journal_path = Path(tmp) / "startup.jsonl.gz"
+        write_journal(journal_path)
+        for run in range(repeat):
+            timings["help"].append(time_help())
+            marks = time_app(journal_path, radio)
+            timings["frame"].append(marks["frame"])
+            timings["connected"].append(marks["connected"])
+
+    budgets = {"help": budget_help, "frame": budget_frame, "connected": budget_connected}
+    results = {phase: {"median_s": statistics.median(values), "max_s": max(values), "budget_s": budgets[phase]}
+               for phase, values in timings.items()}
+
+    table = Table(title=f"Cold start, {repeat} runs")
+    for column in ("Phase", "Median (ms)", "Max (ms)", "Budget (ms)", ""):
+        table.add_column(column, justify="left" if column == "Phase" else "right")
+    over = list()
+    for phase, result in results.items():
+        ok = result["median_s"] <= result["budget_s"]
+        if not ok:
+            over.append(phase)
+        table.add_row(phase, f"{result['median_s'] * 1000:.0f}", f"{result['max_s'] * 1000:.0f}",
+                      f"{result['budget_s'] * 1000:.0f}", "[green]ok[/]" if ok else "[red]over[/]")
+    console.print(table)
+
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+    if over:
+        console.print(f"[red]Over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
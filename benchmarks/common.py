@@ -0,0 +1,82 @@
+"""
+Shared pieces for the benchmark scripts: a radio-less meshChatApp and synthetic mesh traffic.
+"""
+# Standard library imports
+from pathlib import Path
+import random
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from meshChatLib.app import meshChatApp
+from meshChatLib.replay import ReplayInterface
+
+BROADCAST_NUM = 0xFFFFFFFF
+# Rough shape of a busy mesh: mostly chat and telemetry
+PORTNUM_MIX = {"TEXT_MESSAGE_APP": 40, "TELEMETRY_APP": 30, "POSITION_APP": 20, "ADMIN_APP": 10}
+
+
+class BenchApp(meshChatApp):
+    """meshChatApp with an idle fake radio instead of the serial interface"""
+    # Textual resolves a relative CSS_PATH against the subclass' module
+    CSS_PATH = str(REPO_ROOT / "meshChatLib" / meshChatApp.CSS_PATH)
+
+    def on_ready(self, event) -> None:
+        # Skip meshChatApp.on_ready, which opens the radio
+        event.prevent_default()
+        for link in self.radios:
+            link.attach(ReplayInterface(None, devPath=str(link.path)))
+
+
+def new_bench_app() -> BenchApp:
+    return BenchApp(radio_paths=["/dev/null"], database_path=":memory:", db_in_memory=True)
+
+
+def fake_node(num: int, snr: float = 0.0) -> dict:
+    """
+    A node dict shaped like the ones meshtastic publishes on meshtastic.node.updated
+    """
+    return {"num": num, "snr": snr, "lastHeard": 1700000000 + num,
+            "user": {"id": f"!{num:08x}", "longName": f"Node {num}", "shortName": f"N{num % 1000}",
+                     "macaddr": f"mac-{num:08x}", "hwModel": "TBEAM", "role": "CLIENT"},
+            "deviceMetrics": {"batteryLevel": 80, "voltage": 3.9, "channelUtilization": 12.5, "airUtilTx": 1.5},
+            "position": {"latitudeI": 400000000 + num, "longitudeI": -740000000 - num, "altitude": 10,
+                         "time": 1700000000, "latitude": 40.0, "longitude": -74.0}}
+
+
+def fake_packet(portnum: str, packet_id: int, from_num: int, rx_time: int) -> dict:
+    """
+    A decoded packet dict shaped like the ones meshtastic publishes on meshtastic.receive.*
+    """
+    packet = {"from": from_num, "to": BROADCAST_NUM, "fromId": f"!{from_num:08x}", "toId": "^all",
+              "id": packet_id, "rxTime": rx_time, "rxSnr": 6.25, "rxRssi": -40, "hopLimit": 3,
+              "priority": "BACKGROUND", "channel": 0}
+    if portnum == "TEXT_MESSAGE_APP":
+        text = f"Test message {packet_id}"
+        decoded = {"portnum": portnum, "payload": text.encode(), "text": text}
+    elif portnum == "TELEMETRY_APP":
+        decoded = {"portnum": portnum, "payload": b"",
+                   "telemetry": {"time": rx_time,
+                                 "deviceMetrics": {"batteryLevel": 50 + packet_id % 50, "voltage": 3.7,
+                                                   "channelUtilization": 10.0 + packet_id % 20,
+                                                   "airUtilTx": 1.0 + packet_id % 5}}}
+    elif portnum == "POSITION_APP":
+        decoded = {"portnum": portnum, "payload": b"",
+                   "position": {"latitudeI": 400000000 + packet_id, "longitudeI": -740000000 - packet_id,
+                                "altitude": 10, "time": rx_time, "latitude": 40.0 + packet_id * 1e-7,
+                                "longitude": -74.0 - packet_id * 1e-7}}
+    else:
+        decoded = {"portnum": portnum, "payload": b"", "admin": {"getChannelRequest": 1}}
+    packet["decoded"] = decoded
+    return packet
+
+
+def fake_traffic(packet_count: int, node_count: int, seed: int = 0, mix: dict = PORTNUM_MIX) -> list:
+    """
+    packet_count packets from node_count senders, with the portnums weighted by mix
+    """
+    rng = random.Random(seed)
+    portnums = rng.choices(list(mix), weights=list(mix.values()), k=packet_count)
+    return [fake_packet(portnum, packet_id, rng.randrange(node_count), 1700000000 + packet_id)
+            for packet_id, portnum in enumerate(portnums)]
@@ -2,29 +2,27 @@
 
 import meshtastic
 import meshtastic.serial_interface
+from pathlib import Path
 from pubsub import pub
 # from pprint import pprint
+import sys
 import time
 
+from meshChatLib.dispatch import PortnumDispatcher
+from meshChatLib.replay import open_interface
+
 
 def on_receive(packet, interface, ):
     # print(packet)
     print("-" * 80)
     print({packet.get("decoded").get("portnum")})  # there are ADMIN_APP and TELEMETRY_APP messages
     whoToWho(packet)
-    if packet.get("decoded").get("portnum") == "TEXT_MESSAGE_APP":
-        text_message_app(packet)
-
-    elif packet.get('decoded').get('portnum') == 'ADMIN_APP':
-        adminApp(packet)
+    dispatcher.dispatch(packet, interface)
 
-    elif packet.get('decoded').get('portnum') == 'TELEMETRY_APP':
-        telemetryApp(packet)
 
-    else:
-        print("Warning New app" * 30)
-        print(packet)
-        pass
+def new_app(packet, interface):  # anything nobody subscribed to
+    print("Warning New app" * 30)
+    print(packet)
 
 
 def whoToWho(packet):  # displays from and to information
@@ -33,7 +31,7 @@ def whoToWho(packet):  # displays from and to information
     return
 
 
-def text_message_app(packet):  # displays messages sent over the mesh
+def text_message_app(packet, interface):  # displays messages sent over the mesh
     print("Message" * 10)
     print(
         f"Message from {str(packet.get('from'))}, To {str(packet.get('to'))} {str(packet.get('decoded').get('text'))}"
@@ -43,7 +41,7 @@ def text_message_app(packet):  # displays messages sent over the mesh
     return
 
 
-def adminApp(packet):  # manages the ADMIN_APP packet
+def adminApp(packet, interface):  # manages the ADMIN_APP packet
     from_packet = str(packet.get('fromId'))
     to_packet = str(packet.get('toId'))
     if from_packet == to_packet:
@@ -57,18 +55,31 @@ def adminApp(packet):  # manages the ADMIN_APP packet
     return
 
 
-def telemetryApp(packet):  # manages the TELEMETRY_APP packet
+def telemetryApp(packet, interface):  # manages the TELEMETRY_APP packet
     print("telemetryApp function:")
     print(f"TELEMETRY_APP telemetry notes were: {str(packet.get('decoded').get('telemetry'))}")
     return
 
 
+# portnum -> handler, add new apps here
+dispatcher = PortnumDispatcher(default=new_app)
+dispatcher.subscribe("TEXT_MESSAGE_APP", text_message_app)
+dispatcher.subscribe("ADMIN_APP", adminApp)
+dispatcher.subscribe("TELEMETRY_APP", telemetryApp)
+
+
 def main():
     # Subscribe to the given message type This should display received text
     # the below doesn't display telemetry data
     pub.subscribe(on_receive, "meshtastic.receive")
     # By default, will try to find a meshtastic device, otherwise provide a device path like /dev/ttyUSB0
-    interface = meshtastic.serial_interface.SerialInterface()
+    # Pass a recorded journal as the first argument to replay it instead of using a radio, or the socket of a
+    # running meshBroker.py to share its radio
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+    if source is not None and source.is_socket():
+        interface = open_interface(source)
+    else:
+        interface = open_interface(None, replay=source)
 
     # Main application "logic" - This holds the program open to maintain a connection with the radio. This function
     # will continue to print "..." to the screen unless it receives a message, both status and messages
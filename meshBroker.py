@@ -0,0 +1,38 @@
+# Standard library imports
+import logging
+import sys
+
+# Installed 3rd party modules
+import click
+
+from meshChatLib.broker import DEFAULT_BROKER_SOCKET, PacketBroker
+
+
+@click.command("meshBroker")
+@click.option("-r", "--radio", help="Local path to the radio to share", default="/dev/ttyACM0", show_default=True,
+              type=click.Path(exists=False, resolve_path=True))
+@click.option("--socket", "socket_path", help="Unix socket clients connect to", default=str(DEFAULT_BROKER_SOCKET),
+              type=click.Path(dir_okay=False, resolve_path=True), show_default=True)
+@click.option("--max-buffer", help="KiB a slow client may fall behind by before its packets are dropped",
+              default=1024, type=click.IntRange(min=1), show_default=True)
+@click.option("--replay", help="Share a recorded journal instead of a radio", default=None,
+              type=click.Path(exists=True, dir_okay=False, readable=True, resolve_path=True))
+@click.option("--replay-speed", help="Replay speed multiplier, 0 replays as fast as possible", default=1.0,
+              type=click.FloatRange(min=0), show_default=True)
+def main(radio, socket_path, max_buffer, replay, replay_speed):
+    """
+    Share one radio with any number of local clients.
+
+    Point meshLibTest.py --radio, main.py or meshchat_msg_test.py at the socket instead of the radio.
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        broker = PacketBroker(radio, socket_path=socket_path, replay=replay, replay_speed=replay_speed,
+                              max_buffer=max_buffer * 1024)
+        sys.exit(broker.run())
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+
+
+if __name__ == "__main__":
+    main()
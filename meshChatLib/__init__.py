@@ -1,13 +1,5 @@
-# Standard library imports
-import datetime
-from pathlib import Path
-from pprint import pprint
-import sys
-from time import strftime, localtime, sleep
-
-import meshtastic
-from meshtastic.serial_interface import SerialInterface
-from pubsub import pub
+# Status symbols only. Anything importing meshChatLib pays for this module, so it must not import meshtastic,
+# textual or SQLAlchemy, the submodules that need them import them.
 
 # Action succeeded
 info_green_splat = f"[white][bold][[green]*[white]][/white][/bold][/green][/]"
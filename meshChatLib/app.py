@@ -0,0 +1,540 @@
+# Standard library imports
+import datetime
+import functools
+import logging
+from pathlib import Path
+import threading
+
+# Installed 3rd party modules
+from pubsub import pub
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from textual.app import App
+from textual.binding import Binding
+from textual.widgets import Button, RichLog, Input, OptionList
+from textual.widgets.option_list import Option
+
+import meshChatLib.utils
+from meshChatLib.bridge import ReceiveBridge
+from meshChatLib.dedupe import PacketDeduper
+from meshChatLib.devwatch import DeviceWatcher
+from meshChatLib.ingest import PacketIngest
+from meshChatLib.models import ChannelHistory
+from meshChatLib.meshScreens import MainChatScreen, QuitScreen, PollingForRadioScreen, StatsScreen
+from meshChatLib.metrics import Metrics
+from meshChatLib.positions import PositionStore
+from meshChatLib.radios import RadioSet
+from meshChatLib.registry import NodeRegistry
+from meshChatLib.reltime import AgeLabels
+from meshChatLib.replay import PacketRecorder
+from meshChatLib.search import HistorySearch
+from meshChatLib.storage import StorageProfile, open_engine, open_readonly
+from meshChatLib.telemetry import TelemetryStore
+from meshChatLib.widgets import AsciiMap, ChatLog, TelemetryPanel
+from meshChatLib.writer import BatchedWriter
+
+
+class meshChatApp(App):
+    """Starting meshChat client"""
+    TITLE = "meshChat"
+    SUB_TITLE = "The finest off grid chat application"
+    CSS_PATH = "meshLibTest.tcss"
+
+    BINDINGS = [
+        ("ctrl+d", "toggle_dark", "Dark Mode"),
+        ("ctrl+r", "next_radio_view", "Radio"),
+        ("ctrl+q", "request_quit", "Quit"),
+        # Not in the footer, it's for chasing down lag
+        Binding("ctrl+t", "show_stats", "Stats", show=False),
+    ]
+
+    MODES = {
+        "meshchat": MainChatScreen,
+        "radiocheck": PollingForRadioScreen,
+    }
+
+    def __init__(self, radio_paths: list, database_path: str, reset_node_db: bool = False,
+                 db_in_memory: bool = False, record_path: str | None = None, replay_path: str | None = None,
+                 replay_speed: float = 1.0, chat_max_messages: int = 500,
+                 chat_max_age: datetime.timedelta | None = None, storage_profile: StorageProfile | None = None,
+                 map_radius_km: float | None = None, dedupe_window: float = 600.0,
+                 dedupe_bloom_window: float | None = 6 * 3600, metrics: Metrics | None = None,
+                 profiler=None, profile_interval: float | None = None, read_only: bool = False) -> None:
+        super().__init__()
+        console = Console()
+        logger = logging.getLogger()
+        logger.setLevel(logging.ERROR)
+        self.radio_paths = [Path(radio_path) for radio_path in radio_paths]
+        self.db_path = Path(database_path)
+
+        ### Set up database###
+        # reset_node_db True: drop all tables and reset the radio's nodeDB to start fresh
+        self.reset_node_db = reset_node_db
+
+        # Tables are created, or upgraded in place, by open_engine. A read only app (AttachedApp) shows a database
+        # another process writes, it mustn't migrate it or write to it.
+        if read_only and not db_in_memory:
+            self.engine = open_readonly(self.db_path)
+        else:
+            self.engine = open_engine(None if db_in_memory else self.db_path, profile=storage_profile)
+
+        Session = sessionmaker(bind=self.engine)
+        session = Session()
+        self.session = session
+        # --- Metrics ---
+        # Component stats are only read when the metrics are, the hot paths are only timed when they're enabled
+        self.metrics = metrics or Metrics(enabled=False)
+        timed = self.metrics.timed
+        # meshChatLib.profiling.SessionProfiler started by --profile, snapshots every profile_interval seconds
+        self.profiler = profiler
+        self.profile_interval = profile_interval
+
+        # New messages and node updates are committed in batches off the receive path, a read only app has no writer
+        self.writer = None
+        if not read_only:
+            self.writer = BatchedWriter(self.engine, flush_time=self.metrics.histogram("db_flush_seconds")
+                                        if self.metrics.enabled else None)
+        # Node lookups on the receive path are answered from memory, the writer keeps the table in step
+        self.nodes = NodeRegistry()
+        self.nodes.warm(self.session)
+        # Recent telemetry per node in memory, closed minute and hour rollups go to the database
+        self.telemetry = TelemetryStore(on_rollup=self.writer.add_rollup if self.writer is not None else None)
+        self.telemetry.warm(self.session)
+        # Position tracks of every node, with a grid index for the map and proximity queries
+        self.positions = PositionStore(on_fix=self.writer.add_position if self.writer is not None else None)
+        self.positions.warm(self.session, since=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+                            - datetime.timedelta(days=1))
+        # The map shows this far around the local radio, or every known node when None
+        self.map_radius_km = map_radius_km
+        # End the read transaction the warm ups started, under WAL it would keep seeing the database as it is now
+        self.session.commit()
+
+        # --- Node sidebar ---
+        # Last rendered row per macaddr, so unchanged nodes aren't rebuilt
+        self.node_option_rows = dict()
+        # Macaddrs changed since the last sidebar update
+        self.dirty_nodes = set()
+        self.dirty_nodes_lock = threading.Lock()
+        # "Last seen" text per macaddr, only worked out again when it would read differently
+        self.age_labels = AgeLabels()
+
+        # --- Chat log ---
+        # Messages kept on screen, older ones are paged back in from channel_history when scrolled to
+        self.chat_max_messages = chat_max_messages
+        self.chat_max_age = chat_max_age
+
+        # --- Search ---
+        self.history_search = HistorySearch(self.engine, resolve_sender=self.radio_id_for_name)
+
+        # --- Radios ---
+        # Every local radio gets its own interface and send queue, they share everything else
+        self.radios = RadioSet.from_paths(self.radio_paths, replay=replay_path, replay_speed=replay_speed)
+        # Label of the radio the chat and sidebar are showing, None shows every radio merged
+        self.radio_view = None
+        # Wakes the reconnect of a lost radio as soon as its device node is back
+        self.device_watcher = DeviceWatcher(self.radios.device_paths, on_added=self.radios.device_added)
+
+        # --- Packet handlers ---
+        # Shared with the headless daemon, the app only renders what the ingest reports
+        self.ingest = PacketIngest(self.radios, self.nodes, self.writer, self.telemetry, self.positions, self.session,
+                                   metrics=self.metrics, on_message=self.show_stored_message,
+                                   on_node=lambda row, macaddrs: self.mark_nodes_dirty(macaddrs))
+
+        # --- Database ---
+        ### Set up Meshtastic radio ###
+        # The callbacks arrive on meshtastic's reader thread, the bridge runs them on the app's event loop
+        self.bridge = ReceiveBridge(self)
+        # Rebroadcast and replayed copies of a packet are dropped on the reader thread, before any SQL or rendering
+        self.dedupe = PacketDeduper(window=dedupe_window, bloom_window=dedupe_bloom_window)
+        self.dedupe.warm(self.session)
+        self.session.commit()
+        pub.subscribe(self.bridge.listener(self.metrics.receive(self.rx_packet), accept=self.dedupe.accept),
+                      "meshtastic.receive")
+        pub.subscribe(self.bridge.listener(self.on_local_connection), "meshtastic.connection.established")
+        pub.subscribe(self.bridge.listener(timed("handler_seconds", self.ingest.update_nodes, handler="update_nodes")),
+                      "meshtastic.node.updated")
+        pub.subscribe(self.bridge.listener(self.disconnect_radio), "meshtastic.connection.lost")
+        # Replay a recorded journal instead of opening the radio
+        self.replay_path = replay_path
+        self.replay_speed = replay_speed
+        # Journal every packet and connection event to disk
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = PacketRecorder(record_path)
+        if self.metrics.enabled:
+            self.node_listview_table_update = timed("node_list_refresh_seconds", self.node_listview_table_update)
+        for name, component in (("writer", self.writer), ("bridge", self.bridge), ("dedupe", self.dedupe),
+                                ("nodes", self.nodes), ("age_labels", self.age_labels)):
+            if component is not None:
+                self.metrics.collect(name, functools.partial(getattr, component, "stats"))
+        # The rest of Meshtastic setup happens in on_ready
+        # --- Meshtastic ---
+        return None
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        text_log = self.screen.query_one(RichLog)
+        # Temporary add button on the main screen
+        if event.button.id == "add_node":
+            # node_listview = self.query_one("#nodes", ListView)
+            # #
+            # node_listview.mount(OptionList(*[self.colony(*row) for row in self.COLONIES]))
+            # self.notify("Button Pushed", title="Guess what!")
+
+            text_log.write("Btn")
+            self.node_listview_table_update()
+        else:
+            text_log.write(f"Unknown Button Pressed. ID: {event.button.id}")
+
+
+    def on_mount(self) -> None:
+        self.bridge.start()
+        self.switch_mode("meshchat")
+
+    def action_request_quit(self) -> None:
+        """Action to display the quit dialog."""
+
+        def check_quit(quit: bool) -> None:
+            """Called when QuitScreen is dismissed."""
+            if quit:
+                # Disable the local node on exit
+                self.disable_local_radio()
+                self.exit(result=0)
+
+        self.push_screen(QuitScreen(), check_quit)
+
+    def on_ready(self):
+
+        # Start the Meshtatic interfaces when the UI is ready
+        self.start_radios()
+        self.time_frames()
+
+        # Build the node list once, after that only changed nodes are touched
+        self.node_listview_table_update(full=True)
+        # The one timer behind the sidebar's "last seen" labels
+        self.set_interval(1.0, self.refresh_node_ages)
+        if self.profiler is not None and self.profile_interval:
+            self.set_interval(self.profile_interval, functools.partial(self.profile_snapshot, "periodic"))
+
+    def time_frames(self) -> None:
+        """
+        Time how long the main screen takes to render and write each frame, when metrics are enabled
+        """
+        # Textual has no public per-frame hook, _compositor_refresh is where a screen renders and writes its update
+        screen = self.screen
+        if self.metrics.enabled and hasattr(screen, "_compositor_refresh"):
+            screen._compositor_refresh = self.metrics.timed("ui_frame_seconds", screen._compositor_refresh)
+
+    def action_show_stats(self) -> None:
+        self.push_screen(StatsScreen())
+
+    def profile_snapshot(self, label: str = "manual") -> None:
+        """
+        Write out the CPU profile and memory snapshot of the session so far, when running with --profile
+        """
+        if self.profiler is None:
+            return
+        written = self.profiler.snapshot(label)
+        if label == "manual":
+            self.notify(f"Profile written to {written[0].parent}", title="Profile")
+
+    def start_radios(self) -> None:
+        """
+        Open the local radios, or in AttachedApp, the connection to the daemon that has them
+        """
+        self.radios.open_all()
+        if self.radios.device_paths:
+            self.device_watcher.start()
+
+    @property
+    def interface(self):
+        """
+        Interface of the primary radio
+        """
+        return self.radios.primary.interface
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """
+        Queue what was typed in the chat box to the primary channel, of the radio in view
+        """
+        if event.input.id != "main_chat_text_input":
+            return
+        msg_text = event.value.strip()
+        event.input.clear()
+        if not msg_text:
+            return
+        link = self.radios.get(self.radio_view) or self.radios.primary
+        link.outbound.queue(msg_text, on_sent=functools.partial(self.on_text_sent, link),
+                            on_failed=self.on_text_failed)
+        if link.outbound.depth > 1:
+            self.notify(f"{link.outbound.depth - 1} messages ahead, sending when the channel allows")
+
+    def on_text_sent(self, link, message, packet) -> None:
+        # Back from the scheduler thread to the event loop
+        self.call_from_thread(self.show_sent_text, link, message, packet)
+
+    def show_sent_text(self, link, message, packet) -> None:
+        # Stored and then shown through show_stored_message
+        self.ingest.sent_text(link, message, packet)
+
+    def on_text_failed(self, message, error) -> None:
+        self.call_from_thread(self.notify, f"Could not send \"{message.text}\": {error}", severity="error")
+
+    def on_click(self):
+        text_log = self.screen.query_one(RichLog)
+        text_log.write(f"Click!")
+
+    def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
+        """
+        Selected when the user clicks on or hits enter on the keyboard.
+        Just highlighting isn't enough
+        """
+        if event.option_list.id != "nodes":
+            return
+        # Node options are keyed by macaddr
+        node_option_mac = event.option.id
+        self.screen.query_one(RichLog).write(node_option_mac)
+        node = self.nodes.get_by_macaddr(node_option_mac)
+        if node is not None:
+            # Get the data for each node here
+            self.screen.query_one(TelemetryPanel).select(node.get("radio_id"))
+            # Load the chat
+
+
+
+    def on_local_connection(self, interface):
+        link = self.ingest.on_local_connection(interface)
+        if link.connects > 1:
+            self.notify(f"Radio {link.label} reconnected")
+        if link is self.radios.primary:
+            # The primary radio is "me" for the map and for distances
+            self.radio_id = link.radio_id
+            self.longName = link.longName
+            self.shortName = link.shortName
+            self.hwModel = (self.nodes.get_by_macaddr(link.macaddr) or {}).get("hwModel")
+            self.macaddr = link.macaddr
+            self.screen.query_one(AsciiMap).set_home(self.radio_id)
+
+    def show_stored_message(self, values: dict) -> None:
+        """
+        Render a message the ingest stored, received or sent
+        """
+        self.show_chat_message(values["time_rx"], values["from_radio_id"], values["msg_text"], values["rx_radio"])
+
+    def nodes_near_me(self, radius_km: float) -> list:
+        """
+        (distance in km, node row) of every node within radius_km of the local radio, nearest first
+        """
+        return [(distance, self.nodes.get_by_radio_id(radio_id))
+                for distance, radio_id in self.positions.near(self.radio_id, radius_km)]
+
+    def node_short_name(self, radio_id: str) -> str | None:
+        node = self.nodes.get_by_radio_id(radio_id)
+        return node.get("shortName") if node is not None else None
+
+    def chat_line(self, time_rx: datetime.datetime, from_radio_id: str, msg_text: str,
+                  rx_radio: str | None = None) -> str:
+        """
+        Render one chat message the way it's shown in the chat log.
+        The radio it came in on is shown when several radios are merged into one view.
+        """
+        node = self.nodes.get_by_radio_id(from_radio_id)
+        sender_name = node["longName"] if node is not None else from_radio_id
+        radio_tag = ""
+        if rx_radio is not None and len(self.radios) > 1 and self.radio_view is None:
+            radio_tag = f"[dim]{rx_radio}[/] "
+        return f"{meshChatLib.utils.Utils.time_prefix(time_rx)}[white bold]|[/]{radio_tag}[red bold]{sender_name}[/][white bold]>[/] {msg_text}"
+
+    def show_chat_message(self, time_rx: datetime.datetime, from_radio_id: str, msg_text: str,
+                          rx_radio: str | None) -> None:
+        """
+        Add a new message to the chat log, if it's from the radio in view
+        """
+        if self.radio_view is not None and rx_radio != self.radio_view:
+            return
+        self.screen.query_one(ChatLog).add_message(time_rx, self.chat_line(time_rx, from_radio_id, msg_text,
+                                                                            rx_radio))
+
+    def action_next_radio_view(self) -> None:
+        """
+        Cycle the chat and node list through every radio merged, then each radio on its own
+        """
+        views = [None] + self.radios.labels
+        self.radio_view = views[(views.index(self.radio_view) + 1) % len(views)]
+        self.sub_title = f"Radio {self.radio_view}" if self.radio_view is not None else self.SUB_TITLE
+        self.screen.query_one(ChatLog).load_latest()
+        self.node_listview_table_update(full=True)
+
+    def node_in_view(self, node: dict) -> bool:
+        return self.radio_view is None or node.get("rx_radio") == self.radio_view
+
+    def radio_id_for_name(self, name: str) -> str | None:
+        """
+        Radio id of the node with this long or short name
+        """
+        for node in self.nodes.all():
+            if name in (node.get("longName"), node.get("shortName")):
+                return node.get("radio_id")
+        return None
+
+    def chat_history(self, before: datetime.datetime | None = None, after: datetime.datetime | None = None,
+                     limit: int = 100) -> list:
+        """
+        One page of stored messages for the chat log, oldest first, as (time received, rendered line).
+        Without after it's the newest page before `before`, with after the oldest page after it.
+        """
+        query = select(ChannelHistory.time_rx, ChannelHistory.from_radio_id, ChannelHistory.msg_text,
+                       ChannelHistory.rx_radio)
+        if self.radio_view is not None:
+            query = query.where(ChannelHistory.rx_radio == self.radio_view)
+        if before is not None:
+            query = query.where(ChannelHistory.time_rx < before)
+        if after is not None:
+            query = query.where(ChannelHistory.time_rx > after).order_by(ChannelHistory.time_rx.asc())
+        else:
+            query = query.order_by(ChannelHistory.time_rx.desc())
+        with self.engine.connect() as connection:
+            rows = [tuple(row) for row in connection.execute(query.limit(limit))]
+        # Messages still queued in the writer belong in the page too. They're merged in rather than flushed, which
+        # would commit on the UI thread.
+        stored = set(rows)
+        for values in self.writer.pending("message") if self.writer is not None else ():
+            row = (values.get("time_rx"), values.get("from_radio_id"), values.get("msg_text"), values.get("rx_radio"))
+            time_rx = row[0]
+            if time_rx is None or row in stored:
+                continue
+            if self.radio_view is not None and row[3] != self.radio_view:
+                continue
+            if (before is not None and time_rx >= before) or (after is not None and time_rx <= after):
+                continue
+            rows.append(row)
+        rows.sort(key=lambda row: row[0])
+        rows = rows[:limit] if after is not None else rows[-limit:]
+        return [(time_rx, self.chat_line(time_rx, from_radio_id, msg_text, rx_radio))
+                for time_rx, from_radio_id, msg_text, rx_radio in rows]
+
+    def rx_packet(self, packet, interface):
+        """
+        Called when any packet is received from Meshtastic
+        """
+        # Handlers for each portnum are registered on the ingest's dispatcher
+        self.ingest.rx_packet(packet, interface)
+        # Update the view
+        self.node_listview_table_update()
+
+    def disconnect_radio(self, interface):
+        """
+        Called when a radio disconnect event is received.
+        A radio is reopened in the background while the node list, chat and database carry on as they are. Only a
+        replay that ends quits, once no other radio is left.
+        """
+        outcome, link = self.ingest.disconnect_radio(interface)
+        if outcome == "lost":
+            self.notify(f"Radio {link.label} lost, reconnecting", severity="warning")
+        elif outcome == "disconnected":
+            # The other radios carry on
+            self.notify(f"Radio {link.label} disconnected", severity="warning")
+        elif outcome == "gone":
+            # Remove local radio from SQL, this also flushes anything still queued
+            self.disable_local_radio()
+            self.exit(result=1)
+
+    def mark_nodes_dirty(self, macaddrs: list) -> None:
+        """
+        Queue nodes for the next sidebar update
+        """
+        with self.dirty_nodes_lock:
+            self.dirty_nodes.update(macaddrs)
+
+    def refresh_node_ages(self) -> None:
+        """
+        Re-render the nodes whose "last seen" label has moved on, and pick up node updates that arrived without a
+        following packet
+        """
+        self.mark_nodes_dirty(self.age_labels.expired())
+        self.node_listview_table_update()
+
+    def node_listview_table_update(self, full: bool = False):
+        """
+        Bring the node sidebar up to date.
+        Only nodes marked dirty since the last call are re-rendered, unless full is set.
+        The options are keyed by macaddr.
+        """
+        with self.dirty_nodes_lock:
+            dirty, self.dirty_nodes = self.dirty_nodes, set()
+        if not dirty and not full:
+            return
+
+        node_option_list = self.screen.query_one("#nodes", OptionList)
+
+        # Create the table for the sidebar
+        if full:
+            result = self.nodes.all()
+        else:
+            result = [node for node in map(self.nodes.get_by_macaddr, dirty) if node is not None]
+
+        seen = set()
+        for node in result:
+            macaddr = node["macaddr"]
+            if not self.node_in_view(node):
+                # Heard on another radio, dropped from the list below
+                continue
+            seen.add(macaddr)
+            # Mark the local radio instead of last seen time
+            if node["local_radio"]:
+                last_seen_text = "Local Node" if len(self.radios) == 1 else f"Local Node {node.get('rx_radio')}"
+            else:
+                last_seen_text = self.age_labels.label(macaddr, self.last_heard_epoch(node))
+
+            row = (node["longName"], node["shortName"], last_seen_text)
+            if self.node_option_rows.get(macaddr) == row:
+                continue
+
+            node_listview_table = Table()
+            node_listview_table.add_column("LongName")
+            node_listview_table.add_column("ShortName")
+            node_listview_table.add_column("LastSeen")
+            node_listview_table.add_row(*row)
+
+            if macaddr in self.node_option_rows:
+                node_option_list.replace_option_prompt(macaddr, node_listview_table)
+            else:
+                node_option_list.add_option(Option(node_listview_table, id=macaddr))
+            self.node_option_rows[macaddr] = row
+
+        # Anything we looked for that is no longer in the table goes away
+        if full:
+            gone = set(self.node_option_rows) - seen
+        else:
+            gone = dirty - seen
+        for macaddr in gone:
+            if macaddr in self.node_option_rows:
+                node_option_list.remove_option(macaddr)
+                del self.node_option_rows[macaddr]
+                self.age_labels.discard(macaddr)
+
+    def disable_local_radio(self):
+        # Disable the local node on exit
+        self.device_watcher.stop()
+        self.ingest.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.exit()
+
+    @staticmethod
+    def last_heard_epoch(node: dict) -> int:
+        """
+        Epoch seconds a node was last heard at. lastHeard comes from the radio, nodes that don't report it fall back
+        on when the node table last saw them, which is naive UTC.
+        """
+        if node["lastHeard"] is not None:
+            return int(node["lastHeard"])
+        last_seen = node["last_seen"]
+        if last_seen is None:
+            return 0
+        if last_seen.tzinfo is None:
+            last_seen = last_seen.replace(tzinfo=datetime.timezone.utc)
+        return int(last_seen.timestamp())
+
+    # async def update_weather(self) -> None:
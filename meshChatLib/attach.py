@@ -0,0 +1,159 @@
+# Standard library imports
+import asyncio
+import datetime
+from pathlib import Path
+import socket
+
+# Installed 3rd party modules
+from textual.widgets import Input
+
+from meshChatLib.app import meshChatApp
+from meshChatLib.daemon import MAX_LINE, PROTOCOL_VERSION, decode_event, encode_event
+from meshChatLib.radios import RadioLink, RadioSet
+from meshChatLib.widgets import AsciiMap, ChatLog
+
+
+def connect(socket_path: Path) -> tuple:
+    """
+    Connect to a headless daemon and read its hello. Returns (socket, hello), AttachedApp takes the socket over.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+        # The daemon sends nothing after the hello until it's asked for a snapshot, so the buffered reader can't
+        # swallow anything the app would need
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+        if not line:
+            raise ConnectionError("the daemon closed the connection")
+        hello = decode_event(line)
+        if hello.get("type") != "hello" or hello.get("version") != PROTOCOL_VERSION:
+            raise ConnectionError(f"unexpected greeting from the daemon: {hello}")
+    except Exception:
+        sock.close()
+        raise
+    return sock, hello
+
+
+def _decode_node(node: dict) -> dict:
+    if isinstance(node.get("last_seen"), str):
+        node["last_seen"] = datetime.datetime.fromisoformat(node["last_seen"])
+    return node
+
+
+class AttachedApp(meshChatApp):
+    """
+    The TUI on top of a headless daemon instead of its own radios.
+
+    History, telemetry trends and tracks are read from the daemon's database, opened read only so it's never
+    migrated or locked from here. The radios and nodes come from the daemon's snapshot and everything after that from
+    its deltas. There's no writer, and what's typed is handed to the daemon to send. Quitting only detaches, the
+    daemon keeps logging.
+    """
+
+    def __init__(self, sock: socket.socket, hello: dict, **kwargs) -> None:
+        database = hello.get("database")
+        super().__init__(radio_paths=[radio["path"] for radio in hello["radios"]],
+                         database_path=database or ":memory:", db_in_memory=database is None, read_only=True,
+                         **kwargs)
+        self.sock = sock
+        self.daemon_writer = None
+        # Same labels as the daemon's, which may have been made unique
+        self.radios = RadioSet([RadioLink(radio["path"], label=radio["label"]) for radio in hello["radios"]])
+
+    def start_radios(self) -> None:
+        self.run_worker(self.follow_daemon(), name="daemon", group="daemon", exclusive=True)
+
+    async def follow_daemon(self) -> None:
+        reader, self.daemon_writer = await asyncio.open_unix_connection(sock=self.sock, limit=MAX_LINE)
+        self.daemon_writer.write(encode_event({"type": "subscribe"}))
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            event = decode_event(line)
+            handler = getattr(self, f"daemon_{event.get('type')}", None)
+            if handler is not None:
+                handler(event)
+        self.exit(result=1, message="The meshChat daemon went away")
+
+    # --- Events from the daemon ---
+    def daemon_snapshot(self, event: dict) -> None:
+        for state in event["radios"]:
+            self.apply_radio_state(state)
+        for node in event["nodes"]:
+            self.nodes.upsert(_decode_node(node))
+        self.node_listview_table_update(full=True)
+        # The daemon flushed its writer before the snapshot, the database now has everything before the deltas
+        self.screen.query_one(ChatLog).load_latest()
+
+    def daemon_message(self, event: dict) -> None:
+        self.show_chat_message(datetime.datetime.fromisoformat(event["time_rx"]), event["from_radio_id"],
+                               event["msg_text"], event.get("rx_radio"))
+
+    def daemon_node(self, event: dict) -> None:
+        node = _decode_node(event["node"])
+        # The same node under a new macaddr replaces the old entry, in the registry and in the sidebar
+        previous = self.nodes.get_by_radio_id(node.get("radio_id")) if node.get("radio_id") is not None else None
+        row, changed = self.nodes.upsert(node)
+        if previous is not None and previous["macaddr"] != row["macaddr"]:
+            self.mark_nodes_dirty([previous["macaddr"]])
+            changed = True
+        if changed:
+            self.mark_nodes_dirty([row["macaddr"]])
+            self.node_listview_table_update()
+
+    def daemon_radio(self, event: dict) -> None:
+        state = event["radio"]
+        self.apply_radio_state(state)
+        if state["reconnecting"]:
+            self.notify(f"Radio {state['label']} lost, reconnecting", severity="warning")
+        elif not state["connected"]:
+            self.notify(f"Radio {state['label']} disconnected", severity="warning")
+
+    def daemon_position(self, event: dict) -> None:
+        self.positions.add(event["radio_id"], event["timestamp"], event["latitude"], event["longitude"],
+                           event["altitude"], persist=False)
+
+    def daemon_telemetry(self, event: dict) -> None:
+        self.telemetry.add(event["radio_id"], event["timestamp"], event["sample"])
+
+    def daemon_error(self, event: dict) -> None:
+        self.notify(event["text"], severity="error")
+
+    def apply_radio_state(self, state: dict) -> None:
+        link = self.radios.get(state["label"])
+        if link is None:
+            return
+        link.radio_id = state["radio_id"]
+        link.macaddr = state["macaddr"]
+        link.longName = state["longName"]
+        link.shortName = state["shortName"]
+        link.connected = state["connected"]
+        link.reconnecting = state["reconnecting"]
+        if link is self.radios.primary and link.radio_id is not None:
+            self.radio_id = link.radio_id
+            self.longName = link.longName
+            self.shortName = link.shortName
+            self.macaddr = link.macaddr
+            self.screen.query_one(AsciiMap).set_home(self.radio_id)
+        self.mark_nodes_dirty(self.nodes.set_local_radios(self.radios.local_macaddrs))
+
+    # --- Overrides of the app's own radio handling ---
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input.id != "main_chat_text_input":
+            return
+        # meshChatApp's handler would queue on a radio this process doesn't have
+        event.prevent_default()
+        msg_text = event.value.strip()
+        event.input.clear()
+        if not msg_text or self.daemon_writer is None:
+            return
+        # Echoed back as a message delta once it's on air
+        self.daemon_writer.write(encode_event({"type": "send", "text": msg_text, "radio": self.radio_view}))
+
+    def disable_local_radio(self):
+        # Detach, the daemon keeps the radios and the database
+        if self.daemon_writer is not None:
+            self.daemon_writer.close()
+        self.exit()
@@ -0,0 +1,137 @@
+# Standard library imports
+import asyncio
+from collections import Counter, deque
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiveBridge(object):
+    """
+    Moves meshtastic pubsub callbacks off the radio reader thread and onto the Textual event loop, or with no app,
+    onto whatever asyncio loop start() is called from, like the headless daemon's.
+
+    The listeners made by listener() only append the call to a bounded queue, so the reader never waits on
+    rendering or SQL. A worker on the app's loop drains the queue in batches and runs the real handlers there.
+    When the queue is full new events are dropped and counted instead of blocking the reader.
+    """
+
+    def __init__(self, app, max_pending: int = 10000, batch_size: int = 200) -> None:
+        self.app = app
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        # True while a drain has been asked for and hasn't emptied the queue yet
+        self._scheduled = False
+        # pubsub only keeps weak references to listeners
+        self._listeners = list()
+
+        # --- Counters ---
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        # Calls an accept filter turned away, e.g. duplicate packets
+        self.rejected = 0
+        self.dropped_by_handler = Counter()
+        self.max_depth = 0
+
+    def listener(self, handler, accept=None):
+        """
+        Wrap a handler into a pubsub listener that queues the call for the event loop.
+        The wrapper keeps the handler's signature, which pubsub checks against the topic.
+        accept, when given, is called with the same arguments on the reader thread and the call is only queued
+        if it returns True.
+        """
+        @functools.wraps(handler)
+        def enqueue(*args, **kwargs):
+            if accept is not None and not accept(*args, **kwargs):
+                with self._lock:
+                    self.rejected += 1
+                return
+            self.put(handler, args, kwargs)
+
+        self._listeners.append(enqueue)
+        return enqueue
+
+    def put(self, handler, args: tuple = (), kwargs: dict | None = None) -> bool:
+        """
+        Queue a handler call from any thread. Returns False if it was dropped.
+        """
+        with self._lock:
+            self.received += 1
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                self.dropped_by_handler[handler.__name__] += 1
+                return False
+            self._pending.append((handler, args, kwargs or {}))
+            depth = len(self._pending)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            wake = not self._scheduled
+            self._scheduled = True
+        if wake and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def start(self) -> None:
+        """
+        Start draining on the running event loop, call from the app's on_mount
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        with self._lock:
+            if self._pending:
+                self._wakeup.set()
+        if self.app is not None:
+            self.app.run_worker(self._drain(), name="receive-bridge", group="bridge", exclusive=True)
+        else:
+            self._task = self._loop.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.drain_once():
+                # Give Textual a chance to render between batches
+                await asyncio.sleep(0)
+
+    def drain_once(self) -> int:
+        """
+        Run up to batch_size queued handler calls on the calling thread. Returns how many ran.
+        """
+        batch = list()
+        with self._lock:
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popleft())
+            if not self._pending:
+                self._scheduled = False
+        for handler, args, kwargs in batch:
+            try:
+                handler(*args, **kwargs)
+            except Exception:
+                logger.exception(f"{handler.__name__} failed")
+        self.delivered += len(batch)
+        return len(batch)
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": len(self._pending),
+                "max_depth": self.max_depth,
+                "received": self.received,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "dropped_by_handler": dict(self.dropped_by_handler),
+            }
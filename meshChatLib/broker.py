@@ -0,0 +1,424 @@
+# Standard library imports
+import asyncio
+from collections import deque
+import logging
+import os
+from pathlib import Path
+import signal
+import socket
+import tempfile
+import threading
+
+from pubsub import pub
+
+from meshChatLib.bridge import ReceiveBridge
+from meshChatLib.devwatch import DeviceWatcher
+from meshChatLib.radios import RadioLink
+from meshChatLib.replay import RECORDED_TOPICS
+from meshChatLib.wire import (FRAME_DROPPED, FRAME_ERROR, FRAME_EVENT, FRAME_HELLO, FRAME_SEND, FRAME_SUBSCRIBE,
+                              frame, pack, read_frame, read_frame_async)
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+# Where meshBroker.py listens, private to the user
+DEFAULT_BROKER_SOCKET = (Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir())
+                         / f"meshChat-broker-{os.getuid()}.sock")
+
+
+class PacketFilter(object):
+    """
+    What a subscriber wants. None means no filter, otherwise only packets with one of these portnums, on one of
+    these channels, or from or to one of these nodes are sent. Nodes are radio ids ("!a1b2c3d4") or numbers.
+    """
+    __slots__ = ("portnums", "channels", "nodes")
+
+    def __init__(self, portnums=None, channels=None, nodes=None) -> None:
+        self.portnums = frozenset(portnums) if portnums is not None else None
+        self.channels = frozenset(channels) if channels is not None else None
+        self.nodes = frozenset(nodes) if nodes is not None else None
+
+    @classmethod
+    def from_dict(cls, spec: dict | None):
+        spec = spec or {}
+        return cls(spec.get("portnums"), spec.get("channels"), spec.get("nodes"))
+
+    def as_dict(self) -> dict:
+        return {name: sorted(getattr(self, name), key=str) if getattr(self, name) is not None else None
+                for name in self.__slots__}
+
+    def wants(self, topic: str, data: dict) -> bool:
+        packet = data.get("packet")
+        if packet is not None:
+            if self.portnums is not None and (packet.get("decoded") or {}).get("portnum") not in self.portnums:
+                return False
+            if self.channels is not None and packet.get("channel", 0) not in self.channels:
+                return False
+            if self.nodes is not None and not self.nodes.intersection(
+                    (packet.get("fromId"), packet.get("toId"), packet.get("from"), packet.get("to"))):
+                return False
+            return True
+        node = data.get("node")
+        if node is not None and self.nodes is not None:
+            return bool(self.nodes.intersection(((node.get("user") or {}).get("id"), node.get("num"))))
+        # Connection events go to everyone
+        return True
+
+
+class BrokerSubscriber(object):
+    """
+    One client of the broker, with its own bounded send buffer.
+
+    Frames wait in the buffer until the client's socket takes them. When the buffer is full new frames are dropped
+    and counted rather than buffered without bound, and the client is told how many it missed just before the next
+    frame it does get. A slow client never holds up the radio or the other clients.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, name: str, max_buffer: int) -> None:
+        self.writer = writer
+        self.name = name
+        self.max_buffer = max_buffer
+        self.filter = None
+        self._frames = deque()
+        self._buffered = 0
+        self._wakeup = asyncio.Event()
+
+        # --- Counters ---
+        self.sent = 0
+        self.dropped = 0
+        # Dropped since the last drop notification
+        self._missed = 0
+
+    def offer(self, data: bytes) -> bool:
+        """
+        Buffer a frame unless the buffer is full. Returns False if it was dropped.
+        """
+        if self._buffered + len(data) > self.max_buffer:
+            self.dropped += 1
+            self._missed += 1
+            return False
+        if self._missed:
+            # Right where the gap is, ahead of the first frame after it
+            notice = frame(FRAME_DROPPED, {"dropped": self._missed, "total": self.dropped})
+            self._frames.append(notice)
+            self._buffered += len(notice)
+            self._missed = 0
+        self._frames.append(data)
+        self._buffered += len(data)
+        self._wakeup.set()
+        return True
+
+    async def pump(self) -> None:
+        """
+        Write buffered frames out as fast as the client reads them
+        """
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._frames:
+                data = self._frames.popleft()
+                self._buffered -= len(data)
+                self.writer.write(data)
+                self.sent += 1
+                await self.writer.drain()
+
+    @property
+    def stats(self) -> dict:
+        return {"name": self.name, "sent": self.sent, "dropped": self.dropped, "buffered": self._buffered,
+                "filter": self.filter.as_dict() if self.filter is not None else None}
+
+
+class PacketBroker(object):
+    """
+    Owns one radio and shares it with any number of local clients over a Unix socket.
+
+    A serial radio can only be opened by one process. The broker opens it, and every meshtastic event it publishes
+    is packed once and offered to each subscriber whose filter wants it. Clients send text through the broker, so
+    they all share the radio's send queue and airtime budget. A lost radio is reopened like in the app, the clients
+    stay connected meanwhile.
+    """
+
+    def __init__(self, radio_path, socket_path=DEFAULT_BROKER_SOCKET, replay: Path | None = None,
+                 replay_speed: float = 1.0, max_buffer: int = 1024 * 1024) -> None:
+        self.socket_path = Path(socket_path)
+        # Bytes each subscriber may fall behind by before its frames are dropped
+        self.max_buffer = max_buffer
+        self.link = RadioLink(radio_path, replay=replay, replay_speed=replay_speed)
+        self.device_watcher = DeviceWatcher([self.link.path] if replay is None else [],
+                                            on_added=lambda path: self.link.device_added())
+        # Events reach the loop through the same bounded bridge the app uses
+        self.bridge = ReceiveBridge(None)
+        # Listen on the root topic like the journal recorder, every sub topic is delivered to it
+        pub.subscribe(self.bridge.listener(self.on_event), "meshtastic")
+        self.subscribers = set()
+        self._serving = set()
+        # The interface that last connected and who its radio is, for the hello of clients connecting later
+        self.interface = None
+        self.my_user = None
+        # Interfaces reported lost, kept so their ids aren't reused while late events from them are still queued
+        self._lost_interfaces = dict()
+        self._loop = None
+        self._stopped = None
+        self.exit_code = 0
+
+        # --- Counters ---
+        self.events = 0
+        self.clients = 0
+
+    # --- Running ---
+    def run(self) -> int:
+        """
+        Serve until stop(), SIGINT or SIGTERM. Returns the exit code.
+        """
+        return asyncio.run(self._main())
+
+    async def _main(self) -> int:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, self.stop)
+        self.bridge.start()
+        self._claim_socket()
+        server = await asyncio.start_unix_server(self._serve, path=str(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Sharing {self.link.path} on {self.socket_path}")
+        try:
+            await self._loop.run_in_executor(None, self.link.open)
+        except Exception as error:
+            logger.error(f"Could not open the radio {self.link.path}: {error}")
+            self.stop(1)
+        if self.link.replay is None:
+            self.device_watcher.start()
+
+        await self._stopped.wait()
+        server.close()
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+        # Let every client's handler see its connection close and finish
+        await asyncio.gather(*self._serving, return_exceptions=True)
+        await server.wait_closed()
+        self.device_watcher.stop()
+        self.link.close()
+        if self.link.interface is not None:
+            self.link.interface.close()
+        self.socket_path.unlink(missing_ok=True)
+        return self.exit_code
+
+    def _claim_socket(self) -> None:
+        """
+        Remove a socket left behind by a broker that died, refuse to start next to one that's still running
+        """
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            self.socket_path.unlink(missing_ok=True)
+        else:
+            raise RuntimeError(f"A broker is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def stop(self, exit_code: int | None = None) -> None:
+        if exit_code is not None:
+            self.exit_code = exit_code
+        if self._stopped is not None:
+            self._stopped.set()
+
+    # --- Radio side, on the loop ---
+    def on_event(self, interface, topic=pub.AUTO_TOPIC, **data) -> None:
+        topic_name = topic.getName()
+        if not topic_name.startswith(RECORDED_TOPICS):
+            return
+        if id(interface) in self._lost_interfaces:
+            # A late event from an interface a reconnect replaced, e.g. the lost event closing it sends again
+            return
+        # The serial interface publishes its node DB and connection.established before its constructor returns,
+        # so events are matched on the interface they come from rather than on self.link.interface
+        if topic_name == "meshtastic.connection.established":
+            self.interface = interface
+            self.my_user = interface.getMyUser() or {}
+            # Clients need to know who the radio is, same as a replayed journal
+            data = dict(data, my_user=self.my_user)
+            logger.info(f"Radio {self.link.label} is {self.my_user.get('id')} ({self.my_user.get('longName')})")
+        elif topic_name == "meshtastic.connection.lost":
+            self._lost_interfaces[id(interface)] = interface
+            if interface is self.interface:
+                self.interface = None
+            if self.link.lost():
+                logger.warning(f"Radio {self.link.label} lost, reconnecting")
+            else:
+                logger.error("The replay ended")
+                self.stop(1)
+        self.publish(topic_name, data)
+
+    def publish(self, topic_name: str, data: dict) -> int:
+        """
+        Offer an event to every subscriber that wants it. Returns how many took it.
+        """
+        self.events += 1
+        data = dict(data, topic=topic_name)
+        body = None
+        taken = 0
+        for subscriber in self.subscribers:
+            if subscriber.filter is None or not subscriber.filter.wants(topic_name, data):
+                continue
+            if body is None:
+                # Packed once, however many subscribers get it
+                body = frame(FRAME_EVENT, body=pack(data))
+            taken += subscriber.offer(body)
+        return taken
+
+    # --- Client side ---
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._serving.add(asyncio.current_task())
+        self.clients += 1
+        subscriber = BrokerSubscriber(writer, f"client-{self.clients}", self.max_buffer)
+        self.subscribers.add(subscriber)
+        logger.info(f"{subscriber.name} connected")
+        interface = self.interface
+        connected = interface is not None
+        # Written straight out, the hello carries the node DB and mustn't be dropped. Nothing else is offered until
+        # the client subscribes.
+        writer.write(frame(FRAME_HELLO, {
+            "version": PROTOCOL_VERSION, "path": str(self.link.path), "connected": connected,
+            "my_user": self.my_user if connected else None,
+            # The node DB a radio sends at connect, which a client that connects later would miss
+            "nodes": list((getattr(interface, "nodes", None) or {}).values()) if connected else list()}))
+        pump = asyncio.create_task(subscriber.pump())
+        try:
+            while True:
+                kind, value = await read_frame_async(reader)
+                if kind is None:
+                    break
+                self.handle_frame(subscriber, kind, value)
+        except (ConnectionError, ValueError) as error:
+            logger.info(f"{subscriber.name} dropped: {error}")
+        finally:
+            self.subscribers.discard(subscriber)
+            self._serving.discard(asyncio.current_task())
+            pump.cancel()
+            writer.close()
+            logger.info(f"{subscriber.name} disconnected, {subscriber.dropped} frames dropped")
+
+    def handle_frame(self, subscriber: BrokerSubscriber, kind: int, value) -> None:
+        if kind == FRAME_SUBSCRIBE:
+            subscriber.filter = PacketFilter.from_dict(value)
+        elif kind == FRAME_SEND:
+            self.link.outbound.queue(value["text"], destination=value.get("destinationId", "^all"),
+                                     channel_index=value.get("channelIndex", 0),
+                                     on_failed=lambda message, error: self._loop.call_soon_threadsafe(
+                                         subscriber.offer, frame(FRAME_ERROR, {
+                                             "text": f"Could not send \"{message.text}\": {error}"})))
+        else:
+            logger.warning(f"{subscriber.name} sent an unknown frame kind {kind}")
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "clients": self.clients,
+            "subscribers": [subscriber.stats for subscriber in self.subscribers],
+            "outbound": self.link.outbound.stats,
+            "bridge": self.bridge.stats,
+        }
+
+
+class BrokerInterface(object):
+    """
+    Stand-in for SerialInterface that gets its events from a PacketBroker.
+
+    The broker's events are published into this process' meshtastic pubsub topics like the radio's own would be,
+    starting with the node DB and connection.established when the radio is already up. open_interface() returns
+    one when the radio path is a broker socket, so the client, main.py and the other scripts share a radio without
+    knowing it. Filters are applied by the broker, so unwanted packets never cross the socket.
+    """
+
+    def __init__(self, socket_path, portnums=None, channels=None, nodes=None) -> None:
+        self.devPath = str(socket_path)
+        self.filter = PacketFilter(portnums, channels, nodes)
+        self.nodes = dict()
+        self.myInfo = None
+        self._my_user = dict()
+        self._send_lock = threading.Lock()
+        self._closing = False
+
+        # --- Counters ---
+        self.received = 0
+        self.dropped = 0
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(self.devPath)
+        self._stream = self._sock.makefile("rb")
+        kind, hello = read_frame(self._stream)
+        if kind != FRAME_HELLO or hello.get("version") != PROTOCOL_VERSION:
+            self._sock.close()
+            raise ConnectionError(f"unexpected greeting from the broker: {hello}")
+        self._sock.sendall(frame(FRAME_SUBSCRIBE, self.filter.as_dict()))
+        self._thread = threading.Thread(target=self._run, args=(hello,), name="meshChat-broker-client",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, hello: dict) -> None:
+        if hello["connected"]:
+            for node in hello["nodes"]:
+                self._publish("meshtastic.node.updated", {"node": node})
+            self._publish("meshtastic.connection.established", {"my_user": hello["my_user"]})
+        try:
+            while True:
+                kind, value = read_frame(self._stream)
+                if kind is None:
+                    break
+                if kind == FRAME_EVENT:
+                    self._publish(value.pop("topic"), value)
+                elif kind == FRAME_DROPPED:
+                    self.dropped = value["total"]
+                    logger.warning(f"The broker dropped {value['dropped']} events, this client is too slow")
+                elif kind == FRAME_ERROR:
+                    logger.error(value["text"])
+        except (OSError, ValueError) as error:
+            if not self._closing:
+                logger.error(f"Lost the broker at {self.devPath}: {error}")
+        if not self._closing:
+            # Same as a serial radio going away, the client's reconnect takes it from here
+            pub.sendMessage("meshtastic.connection.lost", interface=self)
+
+    def _publish(self, topic: str, data: dict) -> None:
+        if topic == "meshtastic.connection.established":
+            self._my_user = data.pop("my_user", None) or self._my_user
+        elif topic == "meshtastic.node.updated":
+            node = data.get("node", {})
+            if node.get("user", {}).get("id"):
+                self.nodes[node["user"]["id"]] = node
+        pub.sendMessage(topic, interface=self, **data)
+        self.received += 1
+
+    # --- The parts of the SerialInterface API the client uses ---
+    def getMyUser(self) -> dict:
+        return self._my_user
+
+    def getMyNodeInfo(self) -> dict | None:
+        return self.nodes.get(self._my_user.get("id"))
+
+    def getNode(self, nodeId: str, *args, **kwargs) -> dict | None:
+        return self.nodes.get(nodeId)
+
+    def sendText(self, text: str, destinationId="^all", wantAck: bool = False, wantResponse: bool = False,
+                 onResponse=None, channelIndex: int = 0, *args, **kwargs) -> None:
+        """
+        Queue text on the broker's radio. The broker paces the sends, so nothing is known about the packet here.
+        """
+        with self._send_lock:
+            self._sock.sendall(frame(FRAME_SEND, {"text": text, "destinationId": destinationId,
+                                                  "channelIndex": channelIndex}))
+
+    def close(self) -> None:
+        self._closing = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
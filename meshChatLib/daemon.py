@@ -0,0 +1,381 @@
+# Standard library imports
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import socket
+
+# Installed 3rd party modules
+from pubsub import pub
+from sqlalchemy.orm import sessionmaker
+
+from meshChatLib.bridge import ReceiveBridge
+from meshChatLib.dedupe import PacketDeduper
+from meshChatLib.devwatch import DeviceWatcher
+from meshChatLib.ingest import PacketIngest
+from meshChatLib.metrics import Metrics
+from meshChatLib.positions import PositionStore
+from meshChatLib.radios import RadioSet
+from meshChatLib.registry import NodeRegistry
+from meshChatLib.replay import PacketRecorder
+from meshChatLib.storage import StorageProfile, open_engine
+from meshChatLib.telemetry import TelemetryStore
+from meshChatLib.writer import BatchedWriter
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+# A snapshot of a big mesh is one long line
+MAX_LINE = 16 * 1024 * 1024
+
+
+# --- Wire format: one JSON object per line, datetimes as ISO 8601 ---
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_event(event: dict) -> bytes:
+    return json.dumps(event, separators=(",", ":"), default=_json_default).encode() + b"\n"
+
+
+def decode_event(line: bytes) -> dict:
+    return json.loads(line)
+
+
+class Subscriber(object):
+    """
+    One attached TUI
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, name: str) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        # Deltas are only sent once the snapshot went out
+        self.live = False
+        self.sent = 0
+
+    @property
+    def buffered(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+
+class IngestDaemon(object):
+    """
+    meshChat without the TUI: the radio readers, packet dispatch and the batched writer, nothing that renders.
+
+    Packets are handled on an asyncio loop through the same ReceiveBridge the app uses. Textual isn't imported, the
+    in-memory telemetry and position stores only keep what persisting needs, and everything else lives in the
+    database. A TUI can attach over a Unix socket at any time. It gets the radios and nodes as a snapshot, reads
+    history from the database itself, then follows live deltas until it detaches.
+    """
+
+    def __init__(self, radio_paths: list, database_path: str | None, socket_path: str,
+                 record_path: str | None = None, replay_path: str | None = None, replay_speed: float = 1.0,
+                 storage_profile: StorageProfile | None = None, dedupe_window: float = 600.0,
+                 dedupe_bloom_window: float | None = 6 * 3600, max_client_buffer: int = 1024 * 1024,
+                 metrics: Metrics | None = None, profiler=None, profile_interval: float | None = None) -> None:
+        self.database_path = Path(database_path) if database_path is not None else None
+        self.socket_path = Path(socket_path)
+        # Bytes an attached TUI may fall behind by before it's dropped, it can attach again for a fresh snapshot
+        self.max_client_buffer = max_client_buffer
+
+        # --- Metrics ---
+        self.metrics = metrics or Metrics(enabled=False)
+        timed = self.metrics.timed
+        # meshChatLib.profiling.SessionProfiler started by --profile, SIGUSR1 writes a snapshot
+        self.profiler = profiler
+        self.profile_interval = profile_interval
+
+        # --- Database ---
+        self.engine = open_engine(self.database_path, profile=storage_profile)
+        self.session = sessionmaker(bind=self.engine)()
+        self.writer = BatchedWriter(self.engine, flush_time=self.metrics.histogram("db_flush_seconds")
+                                    if self.metrics.enabled else None)
+        self.nodes = NodeRegistry()
+        self.nodes.warm(self.session)
+        # Only the open buckets and the last fix matter here, an attached TUI reads trends and tracks from the
+        # database
+        self.telemetry = TelemetryStore(capacity=1, history=1, on_rollup=self.writer.add_rollup)
+        self.positions = PositionStore(track_length=1, on_fix=self.writer.add_position)
+        self.dedupe = PacketDeduper(window=dedupe_window, bloom_window=dedupe_bloom_window)
+        self.dedupe.warm(self.session)
+        self.session.commit()
+
+        # --- Radios ---
+        self.radios = RadioSet.from_paths(radio_paths, replay=replay_path, replay_speed=replay_speed)
+        self.device_watcher = DeviceWatcher(self.radios.device_paths, on_added=self.radios.device_added)
+        # Radios open off the loop, one can report its connection before open_all() has handed its interface over
+        self._opening = False
+        self._early_connections = list()
+
+        # --- Packet handlers ---
+        # Shared with the app, the daemon publishes what the ingest reports to the attached TUIs
+        self.ingest = PacketIngest(self.radios, self.nodes, self.writer, self.telemetry, self.positions, self.session,
+                                   metrics=self.metrics, on_message=self.publish_message, on_node=self.publish_nodes,
+                                   on_telemetry=self.publish_telemetry, on_position=self.publish_position)
+        self.bridge = ReceiveBridge(None)
+        pub.subscribe(self.bridge.listener(self.metrics.receive(self.ingest.rx_packet), accept=self.dedupe.accept),
+                      "meshtastic.receive")
+        pub.subscribe(self.bridge.listener(self.on_local_connection), "meshtastic.connection.established")
+        pub.subscribe(self.bridge.listener(timed("handler_seconds", self.ingest.update_nodes,
+                                                 handler="update_nodes")),
+                      "meshtastic.node.updated")
+        pub.subscribe(self.bridge.listener(self.disconnect_radio), "meshtastic.connection.lost")
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = PacketRecorder(record_path)
+
+        # --- Attached TUIs ---
+        self.subscribers = set()
+        self._loop = None
+        self._stopped = None
+        self.exit_code = 0
+
+        # --- Counters ---
+        self.attaches = 0
+        self.dropped_subscribers = 0
+        for name, component in (("writer", self.writer), ("bridge", self.bridge), ("dedupe", self.dedupe),
+                                ("nodes", self.nodes)):
+            self.metrics.collect(name, functools.partial(getattr, component, "stats"))
+        self.metrics.collect("daemon", lambda: {"subscribers": len(self.subscribers), "attaches": self.attaches,
+                                                "dropped_subscribers": self.dropped_subscribers})
+
+    # --- Running ---
+    def run(self) -> int:
+        """
+        Serve until stop(), SIGINT or SIGTERM. Returns the exit code.
+        """
+        return asyncio.run(self._main())
+
+    async def _main(self) -> int:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, self.stop)
+        if self.profiler is not None:
+            self._loop.add_signal_handler(signal.SIGUSR1, self.profiler.snapshot, "signal")
+            if self.profile_interval:
+                self._loop.call_later(self.profile_interval, self._profile_periodically)
+        self.bridge.start()
+        self._claim_socket()
+        server = await asyncio.start_unix_server(self._serve, path=str(self.socket_path), limit=MAX_LINE)
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Listening on {self.socket_path}")
+        self._opening = True
+        try:
+            # Connecting takes a few seconds of config download, the socket already answers meanwhile
+            await self._loop.run_in_executor(None, self.radios.open_all)
+        except Exception as error:
+            logger.error(f"No radio could be opened: {error}")
+            self.stop(1)
+        self._opening = False
+        for interface in self._early_connections:
+            self.on_local_connection(interface)
+        self._early_connections.clear()
+        if self.radios.device_paths:
+            self.device_watcher.start()
+
+        await self._stopped.wait()
+        server.close()
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+        await server.wait_closed()
+        self.shutdown()
+        return self.exit_code
+
+    def _profile_periodically(self) -> None:
+        self.profiler.snapshot("periodic")
+        self._loop.call_later(self.profile_interval, self._profile_periodically)
+
+    def _claim_socket(self) -> None:
+        """
+        Remove a socket left behind by a daemon that died, refuse to start next to one that's still running
+        """
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            self.socket_path.unlink(missing_ok=True)
+        else:
+            raise RuntimeError(f"A meshChat daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def stop(self, exit_code: int | None = None) -> None:
+        if exit_code is not None:
+            self.exit_code = exit_code
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def shutdown(self) -> None:
+        """
+        Clear the local radio flags, close the radios and write out everything still queued
+        """
+        self.device_watcher.stop()
+        self.ingest.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.socket_path.unlink(missing_ok=True)
+
+    # --- Attached TUIs ---
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.attaches += 1
+        subscriber = Subscriber(reader, writer, f"tui-{self.attaches}")
+        self.subscribers.add(subscriber)
+        logger.info(f"{subscriber.name} attached")
+        try:
+            writer.write(encode_event({"type": "hello", "version": PROTOCOL_VERSION,
+                                       "database": str(self.database_path) if self.database_path else None,
+                                       "radios": self.radio_states()}))
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    command = decode_event(line)
+                except ValueError as error:
+                    self.reject(subscriber, f"Not a JSON command: {error}")
+                    continue
+                await self.handle_command(subscriber, command)
+        except (ConnectionError, ValueError) as error:
+            logger.info(f"{subscriber.name} dropped: {error}")
+        finally:
+            self.subscribers.discard(subscriber)
+            writer.close()
+            logger.info(f"{subscriber.name} detached")
+
+    async def handle_command(self, subscriber: Subscriber, command: dict) -> None:
+        """
+        Act on one command from a TUI. A malformed one is answered with an error event, the TUI stays attached.
+        """
+        if not isinstance(command, dict):
+            self.reject(subscriber, "A command has to be a JSON object")
+            return
+        kind = command.get("type")
+        if kind == "subscribe":
+            # The TUI reads history from the database next, so it has to hold everything heard until now. Flushed
+            # on the loop, so no packet is handled between the flush and the snapshot going live.
+            self.writer.flush()
+            subscriber.writer.write(encode_event({"type": "snapshot", "radios": self.radio_states(),
+                                                  "nodes": self.nodes.all()}))
+            subscriber.live = True
+            await subscriber.writer.drain()
+        elif kind == "send":
+            text = command.get("text")
+            if not isinstance(text, str) or not text:
+                self.reject(subscriber, "A send command needs the text to send")
+                return
+            link = self.radios.get(command.get("radio")) or (self.radios.primary if len(self.radios) else None)
+            if link is None:
+                self.reject(subscriber, f"Could not send \"{text}\": no radio")
+                return
+            link.outbound.queue(text, destination=command.get("destination", "^all"),
+                                channel_index=command.get("channel", 0),
+                                on_sent=functools.partial(self.on_text_sent, link), on_failed=self.on_text_failed)
+        else:
+            logger.warning(f"{subscriber.name} sent an unknown command: {kind}")
+
+    def reject(self, subscriber: Subscriber, text: str) -> None:
+        logger.warning(f"{subscriber.name}: {text}")
+        subscriber.writer.write(encode_event({"type": "error", "text": text}))
+
+    def publish(self, event: dict) -> None:
+        """
+        Send a delta to every live TUI. One that has fallen too far behind is dropped rather than buffered.
+        """
+        if not self.subscribers:
+            return
+        line = encode_event(event)
+        for subscriber in list(self.subscribers):
+            if not subscriber.live:
+                continue
+            if subscriber.buffered > self.max_client_buffer:
+                logger.warning(f"{subscriber.name} is {subscriber.buffered} bytes behind, dropping it")
+                self.subscribers.discard(subscriber)
+                subscriber.writer.close()
+                self.dropped_subscribers += 1
+                continue
+            subscriber.writer.write(line)
+            subscriber.sent += 1
+
+    def radio_states(self) -> list:
+        return [self.radio_state(link) for link in self.radios]
+
+    @staticmethod
+    def radio_state(link) -> dict:
+        return {"label": link.label, "path": str(link.path), "radio_id": link.radio_id, "macaddr": link.macaddr,
+                "longName": link.longName, "shortName": link.shortName, "connected": link.connected,
+                "reconnecting": link.reconnecting}
+
+    # --- Sending ---
+    def on_text_sent(self, link, message, packet) -> None:
+        # Back from the scheduler thread to the loop
+        self._loop.call_soon_threadsafe(self.sent_text, link, message, packet)
+
+    def sent_text(self, link, message, packet) -> None:
+        self.ingest.sent_text(link, message, packet)
+
+    def on_text_failed(self, message, error) -> None:
+        self._loop.call_soon_threadsafe(self.publish, {"type": "error",
+                                                       "text": f"Could not send \"{message.text}\": {error}"})
+
+    # --- What the ingest reports, on the loop ---
+    def publish_message(self, values: dict) -> None:
+        self.publish(dict(values, type="message"))
+
+    def publish_nodes(self, row: dict, macaddrs: list) -> None:
+        for macaddr in macaddrs:
+            node = row if macaddr == row["macaddr"] else self.nodes.get_by_macaddr(macaddr)
+            if node is not None:
+                self.publish({"type": "node", "node": node})
+
+    def publish_telemetry(self, radio_id: str, timestamp: float, sample: dict) -> None:
+        self.publish({"type": "telemetry", "radio_id": radio_id, "timestamp": timestamp, "sample": sample})
+
+    def publish_position(self, radio_id: str, timestamp: float, lat: float, lon: float, alt: float | None) -> None:
+        self.publish({"type": "position", "radio_id": radio_id, "timestamp": timestamp, "latitude": lat,
+                      "longitude": lon, "altitude": alt})
+
+    # --- Radios, on the loop ---
+    def on_local_connection(self, interface):
+        if self.radios.for_interface(interface) is None and self._opening:
+            self._early_connections.append(interface)
+            return
+        link = self.ingest.on_local_connection(interface)
+        logger.info(f"Radio {link.label} is {link.radio_id} ({link.longName})")
+        self.publish({"type": "radio", "radio": self.radio_state(link)})
+
+    def disconnect_radio(self, interface):
+        """
+        Same as the app: reopen a lost radio in the background, stop once no radio is left
+        """
+        outcome, link = self.ingest.disconnect_radio(interface)
+        if outcome == "lost":
+            logger.warning(f"Radio {link.label} lost, reconnecting")
+        elif outcome == "disconnected":
+            logger.warning(f"Radio {link.label} disconnected")
+        elif outcome == "gone":
+            logger.error("No radio left")
+            self.stop(1)
+            return
+        if outcome != "ignored":
+            self.publish({"type": "radio", "radio": self.radio_state(link)})
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "attaches": self.attaches,
+            "dropped_subscribers": self.dropped_subscribers,
+            "bridge": self.bridge.stats,
+            "writer": self.writer.stats,
+        }
@@ -0,0 +1,184 @@
+# Standard library imports
+from collections import OrderedDict
+import datetime
+import hashlib
+import math
+import threading
+from time import monotonic, time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from meshChatLib.models import ChannelHistory
+from meshChatLib.utils import sender_id
+
+
+class BloomFilter(object):
+    """
+    Fixed size Bloom filter over strings, sized for `capacity` items at `error_rate` false positives
+    """
+    __slots__ = ("size", "hashes", "bits", "count")
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing, k positions out of two hashes
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class LinkStats(object):
+    """
+    What one sender's packets looked like when they reached us, copies included
+    """
+    __slots__ = ("packets", "duplicates", "last_snr", "best_snr", "last_rssi", "most_hops_left")
+
+    def __init__(self) -> None:
+        self.packets = 0
+        self.duplicates = 0
+        self.last_snr = None
+        self.best_snr = None
+        self.last_rssi = None
+        # Most hops left on any copy, i.e. the copy that took the shortest path
+        self.most_hops_left = None
+
+    def record(self, packet: dict, duplicate: bool) -> None:
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.packets += 1
+        snr = packet.get("rxSnr")
+        if snr is not None:
+            self.last_snr = snr
+            if self.best_snr is None or snr > self.best_snr:
+                self.best_snr = snr
+        if packet.get("rxRssi") is not None:
+            self.last_rssi = packet["rxRssi"]
+        hops_left = packet.get("hopLimit")
+        if hops_left is not None and (self.most_hops_left is None or hops_left > self.most_hops_left):
+            self.most_hops_left = hops_left
+
+    @property
+    def duplicate_ratio(self) -> float:
+        heard = self.packets + self.duplicates
+        return self.duplicates / heard if heard else 0.0
+
+
+class PacketDeduper(object):
+    """
+    Drops packets already seen, keyed on (sender, packet id).
+
+    Seen keys are kept in insertion order and expire after `window` seconds, or earliest first once there are
+    `max_entries` of them. With `bloom_window` set, expired keys are also remembered in a pair of rotating Bloom
+    filters for that many seconds, which catches late replays in far less memory at a small false positive rate.
+    Every copy still counts towards the sender's LinkStats.
+    """
+
+    def __init__(self, window: float = 600.0, max_entries: int = 20000, bloom_window: float | None = None,
+                 bloom_capacity: int = 100000, bloom_error_rate: float = 0.001) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Two generations, each covering half the bloom window. The older one is dropped on rotation.
+        self.bloom_window = bloom_window
+        self._bloom_args = (bloom_capacity, bloom_error_rate)
+        self._blooms = [BloomFilter(*self._bloom_args), BloomFilter(*self._bloom_args)] if bloom_window else None
+        self._bloom_rotated = monotonic()
+
+        # radio_id -> LinkStats
+        self.link_stats = dict()
+
+        # --- Counters ---
+        self.checked = 0
+        self.duplicates = 0
+        self.bloom_hits = 0
+
+    def accept(self, packet: dict, interface=None, now: float | None = None) -> bool:
+        """
+        True for the first copy of a packet, False for a duplicate. Packets without an id are always accepted.
+        """
+        now = monotonic() if now is None else now
+        sender = sender_id(packet)
+        packet_id = packet.get("id")
+        with self._lock:
+            self.checked += 1
+            duplicate = False
+            if packet_id and sender is not None:
+                duplicate = self._check(f"{sender}/{packet_id}", now)
+            if sender is not None:
+                stats = self.link_stats.get(sender)
+                if stats is None:
+                    stats = self.link_stats[sender] = LinkStats()
+                stats.record(packet, duplicate)
+            if duplicate:
+                self.duplicates += 1
+        return not duplicate
+
+    def _check(self, key: str, now: float) -> bool:
+        self._expire(now)
+        if key in self._seen:
+            return True
+        if self._blooms is not None and (key in self._blooms[0] or key in self._blooms[1]):
+            self.bloom_hits += 1
+            return True
+        self._seen[key] = now
+        return False
+
+    def _expire(self, now: float) -> None:
+        seen = self._seen
+        cutoff = now - self.window
+        while seen:
+            key, first_seen = next(iter(seen.items()))
+            if first_seen > cutoff and len(seen) < self.max_entries:
+                break
+            seen.popitem(last=False)
+            if self._blooms is not None:
+                self._blooms[1].add(key)
+        if self._blooms is not None and now - self._bloom_rotated > self.bloom_window / 2:
+            self._blooms = [self._blooms[1], BloomFilter(*self._bloom_args)]
+            self._bloom_rotated = now
+
+    def warm(self, session: Session) -> int:
+        """
+        Remember the messages stored in the last window, so a radio replaying its queue after a restart doesn't
+        show them twice. Returns the keys loaded.
+        """
+        since = datetime.datetime.fromtimestamp(time() - self.window, datetime.timezone.utc).replace(tzinfo=None)
+        result = session.execute(select(ChannelHistory.from_radio_id, ChannelHistory.packet_id, ChannelHistory.time_rx)
+                                 .where(ChannelHistory.packet_id.is_not(None), ChannelHistory.time_rx >= since)
+                                 .order_by(ChannelHistory.time_rx))
+        now = monotonic()
+        loaded = 0
+        with self._lock:
+            for row in result:
+                age = time() - row.time_rx.replace(tzinfo=datetime.timezone.utc).timestamp()
+                self._seen[f"{row.from_radio_id}/{row.packet_id}"] = now - max(age, 0.0)
+                loaded += 1
+        return loaded
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "bloom_hits": self.bloom_hits,
+                "tracked": len(self._seen),
+                "duplicate_ratio": self.duplicates / self.checked if self.checked else 0.0,
+            }
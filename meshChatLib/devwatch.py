@@ -0,0 +1,201 @@
+# Standard library imports
+import ctypes
+import ctypes.util
+import errno
+import glob
+import logging
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Serial devices meshtastic radios show up as
+DEFAULT_PATTERNS = ("/dev/ttyACM*", "/dev/ttyUSB*")
+
+# --- inotify, from <sys/inotify.h> ---
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+# Device nodes appearing and going, and udev fixing up their permissions after they appear
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """
+    Minimal inotify through ctypes, Linux only. Raises OSError when it isn't available.
+    """
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is Linux only")
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError) as error:
+            raise OSError(errno.ENOSYS, f"inotify is not available: {error}")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+    def add_watch(self, directory: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"{directory}: {os.strerror(code)}")
+        return wd
+
+    def read(self) -> list:
+        """
+        (watch descriptor, mask, name) of every event waiting, empty when there are none
+        """
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return list()
+        events = list()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class DeviceWatcher(object):
+    """
+    Tells when serial devices matching any of `patterns` appear or go away.
+
+    inotify on the directories the patterns live in wakes the watcher as soon as a device node is created or
+    removed. Where inotify isn't available, or a directory doesn't exist yet (e.g. /dev/serial/by-id with nothing
+    plugged in), it falls back to globbing every `poll_interval` seconds. Either way the callbacks are called with
+    the device path, from the watcher's thread.
+    """
+
+    def __init__(self, patterns=DEFAULT_PATTERNS, on_added=None, on_removed=None, poll_interval: float = 1.0,
+                 rescan_interval: float = 30.0) -> None:
+        self.patterns = [str(pattern) for pattern in patterns]
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.poll_interval = poll_interval
+        # Even with inotify, glob now and then in case an event was missed
+        self.rescan_interval = rescan_interval
+        self.present = self._scan()
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self.mode = "poll"
+
+        # --- Counters ---
+        self.added = 0
+        self.removed = 0
+        self.scans = 0
+
+    def start(self) -> "DeviceWatcher":
+        if self._thread is not None:
+            return self
+        try:
+            inotify = Inotify()
+            try:
+                for directory in sorted({str(Path(pattern).parent) for pattern in self.patterns}):
+                    inotify.add_watch(directory)
+            except OSError:
+                inotify.close()
+                raise
+            self._inotify = inotify
+            self.mode = "inotify"
+        except OSError as error:
+            logger.info(f"Polling for devices every {self.poll_interval} s: {error}")
+        self._thread = threading.Thread(target=self._run, name="meshChat-devwatch", daemon=True)
+        self._thread.start()
+        return self
+
+    def _scan(self) -> set:
+        found = set()
+        for pattern in self.patterns:
+            found.update(glob.glob(pattern))
+        return found
+
+    def _run(self) -> None:
+        last_scan = monotonic()
+        while not self._stop.is_set():
+            if self._inotify is not None:
+                # Wake at least once a second to notice stop()
+                ready, _, _ = select.select([self._inotify], [], [], 1.0)
+                events = self._inotify.read() if ready else list()
+                if not events and monotonic() - last_scan < self.rescan_interval:
+                    continue
+            else:
+                if self._stop.wait(self.poll_interval):
+                    break
+            self.rescan()
+            last_scan = monotonic()
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def rescan(self) -> None:
+        """
+        Glob the patterns and report what changed since last time
+        """
+        current = self._scan()
+        with self._changed:
+            added = current - self.present
+            removed = self.present - current
+            self.present = current
+            self.scans += 1
+            self.added += len(added)
+            self.removed += len(removed)
+            if added or removed:
+                self._changed.notify_all()
+        for path in sorted(added):
+            if self.on_added is not None:
+                self.on_added(path)
+        for path in sorted(removed):
+            if self.on_removed is not None:
+                self.on_removed(path)
+
+    def wait_for(self, path, timeout: float | None = None) -> bool:
+        """
+        Block until path exists or timeout seconds have passed. Returns whether it exists.
+        """
+        path = str(path)
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._changed:
+            while not os.path.exists(path):
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Capped, so a path outside the watched patterns is still noticed
+                self._changed.wait(min(remaining, self.poll_interval) if remaining is not None
+                                   else self.poll_interval)
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def __enter__(self) -> "DeviceWatcher":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
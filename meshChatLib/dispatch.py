@@ -0,0 +1,113 @@
+# Standard library imports
+import logging
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription(object):
+    """
+    One handler subscribed to a portnum, with its optional sender/channel filter and timing counters
+    """
+    __slots__ = ("handler", "from_ids", "channels", "calls", "total_time", "max_time")
+
+    def __init__(self, handler, from_ids=None, channels=None):
+        self.handler = handler
+        # None means no filter, otherwise only packets from these radio ids / on these channels are passed on
+        self.from_ids = frozenset(from_ids) if from_ids is not None else None
+        self.channels = frozenset(channels) if channels is not None else None
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def wants(self, packet: dict) -> bool:
+        if self.from_ids is not None and packet.get("fromId") not in self.from_ids:
+            return False
+        if self.channels is not None and packet.get("channel", 0) not in self.channels:
+            return False
+        return True
+
+    @property
+    def name(self) -> str:
+        return getattr(self.handler, "__qualname__", repr(self.handler))
+
+
+class PortnumDispatcher(object):
+    """
+    Routes received packets to the handlers subscribed to their portnum.
+
+    Handlers are called as handler(packet, interface), in the order they subscribed.
+    Packets whose portnum has no subscribers go to `default`, if one is set.
+    """
+
+    def __init__(self, default=None) -> None:
+        self._subscriptions = dict()
+        self.default = default
+        self.unhandled = 0
+
+    def subscribe(self, portnum: str, handler, from_ids=None, channels=None):
+        """
+        Call handler for every packet with this portnum, optionally only from some senders or channels.
+        Returns the handler so this can be used as a decorator through on().
+        """
+        self._subscriptions.setdefault(portnum, list()).append(Subscription(handler, from_ids, channels))
+        return handler
+
+    def on(self, portnum: str, from_ids=None, channels=None):
+        """
+        Decorator form of subscribe()
+        """
+        def decorator(handler):
+            return self.subscribe(portnum, handler, from_ids=from_ids, channels=channels)
+        return decorator
+
+    def unsubscribe(self, portnum: str, handler) -> None:
+        subscriptions = [sub for sub in self._subscriptions.get(portnum, ()) if sub.handler != handler]
+        if subscriptions:
+            self._subscriptions[portnum] = subscriptions
+        else:
+            self._subscriptions.pop(portnum, None)
+
+    def dispatch(self, packet: dict, interface=None) -> int:
+        """
+        Hand a packet to its handlers. Returns how many handlers were called.
+        """
+        portnum = (packet.get("decoded") or {}).get("portnum")
+        subscriptions = self._subscriptions.get(portnum)
+        if not subscriptions:
+            self.unhandled += 1
+            if self.default is not None:
+                self.default(packet, interface)
+            return 0
+
+        called = 0
+        for sub in subscriptions:
+            if not sub.wants(packet):
+                continue
+            start = perf_counter()
+            try:
+                sub.handler(packet, interface)
+            except Exception:
+                # One broken handler mustn't stop the others or the reader thread
+                logger.exception(f"{sub.name} failed on a {portnum} packet")
+            elapsed = perf_counter() - start
+            sub.calls += 1
+            sub.total_time += elapsed
+            if elapsed > sub.max_time:
+                sub.max_time = elapsed
+            called += 1
+        return called
+
+    @property
+    def stats(self) -> dict:
+        """
+        Per portnum, per handler call counts and timings in milliseconds
+        """
+        stats = {"unhandled": self.unhandled}
+        for portnum, subscriptions in self._subscriptions.items():
+            stats[portnum] = [{"handler": sub.name, "calls": sub.calls,
+                               "total_ms": sub.total_time * 1000,
+                               "avg_ms": sub.total_time * 1000 / sub.calls if sub.calls else 0.0,
+                               "max_ms": sub.max_time * 1000}
+                              for sub in subscriptions]
+        return stats
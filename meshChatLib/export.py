@@ -0,0 +1,219 @@
+# Standard library imports
+import csv
+import datetime
+import json
+import logging
+from pathlib import Path
+from time import perf_counter
+
+from sqlalchemy import inspect
+
+from meshChatLib.models import ChannelHistory, Node, PositionFix, TelemetryRollup
+from meshChatLib.search import DB_TIME_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# What can be exported: the table and the column the time range applies to
+TABLES = {
+    "messages": (ChannelHistory.__table__, "time_rx"),
+    "nodes": (Node.__table__, "last_seen"),
+    "telemetry": (TelemetryRollup.__table__, "bucket_start"),
+    "positions": (PositionFix.__table__, "time_fix"),
+}
+FORMATS = ("jsonl", "csv", "parquet")
+
+
+class JsonlSink(object):
+
+    def __init__(self, path: Path, columns: list) -> None:
+        self.path = path
+        self.columns = columns
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, rows: list) -> None:
+        columns = self.columns
+        dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+        self._file.write("".join(dumps(dict(zip(columns, row))) + "\n" for row in rows))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CsvSink(object):
+
+    def __init__(self, path: Path, columns: list) -> None:
+        self.path = path
+        new = not path.exists() or path.stat().st_size == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(columns)
+
+    def write(self, rows: list) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink(object):
+    """
+    Parquet can't be appended to, every export writes a file of its own next to the earlier ones
+    """
+
+    def __init__(self, path: Path, columns: list) -> None:
+        # Installed only by those who want Parquet
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, pip install pyarrow")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.path = path.with_name(f"{path.stem}-{datetime.datetime.now():%Y%m%d-%H%M%S}.parquet")
+        self.columns = columns
+        self._writer = None
+
+    def write(self, rows: list) -> None:
+        batch = self._pyarrow.Table.from_pydict({column: [row[index] for row in rows]
+                                                 for index, column in enumerate(self.columns)})
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self.path, batch.schema, compression="zstd")
+        elif batch.schema != self._writer.schema:
+            # A batch where a column happened to be all nulls
+            batch = batch.cast(self._writer.schema)
+        self._writer.write_table(batch)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+SINKS = {"jsonl": JsonlSink, "csv": CsvSink, "parquet": ParquetSink}
+
+
+class HistoryExporter(object):
+    """
+    Streams tables of the meshChat database to JSONL, CSV or Parquet files.
+
+    Rows are read in id order, batch_size at a time with a keyset query, so memory stays flat however big the
+    database is and no read transaction is held open between batches. Exports can be incremental: a state file
+    remembers the last id written per table and the next export picks up after it. Nodes are updated in place, so
+    they're always exported whole.
+    """
+
+    def __init__(self, engine, out_dir: Path, fmt: str = "jsonl", batch_size: int = 50000,
+                 since: datetime.datetime | None = None, until: datetime.datetime | None = None,
+                 channels=None, state_path: Path | None = None) -> None:
+        if fmt not in SINKS:
+            raise ValueError(f"Unknown format {fmt}, pick one of {', '.join(FORMATS)}")
+        self.engine = engine
+        self.out_dir = Path(out_dir)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.since = since
+        self.until = until
+        # Only applies to messages
+        self.channels = list(channels) if channels else None
+        self.state_path = Path(state_path) if state_path is not None else None
+        self.state = dict()
+        if self.state_path is not None and self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text())
+
+        # --- Counters ---
+        self.rows = dict()
+        self.seconds = 0.0
+
+    def _query(self, connection, name: str) -> tuple:
+        """
+        (column names, FROM ... WHERE clause, parameters) of the rows of name after the id bound to :after
+        """
+        table, time_column = TABLES[name]
+        existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        # An older database may not have every column of the models yet
+        columns = [column.name for column in table.columns if column.name in existing]
+        where = ["id > :after"]
+        params = dict()
+        if self.since is not None:
+            where.append(f"{time_column} >= :since")
+            params["since"] = self.since.strftime(DB_TIME_FORMAT)
+        if self.until is not None:
+            where.append(f"{time_column} < :until")
+            params["until"] = self.until.strftime(DB_TIME_FORMAT)
+        if self.channels is not None and name == "messages":
+            names = [f":channel{index}" for index in range(len(self.channels))]
+            where.append(f"to_channel IN ({', '.join(names)})")
+            params.update({f"channel{index}": str(channel) for index, channel in enumerate(self.channels)})
+        return columns, f"FROM {table.name} WHERE {' AND '.join(where)}", params
+
+    def count(self, name: str) -> int:
+        """
+        Rows the next export of name will write, for progress bars
+        """
+        with self.engine.connect() as connection:
+            columns, clause, params = self._query(connection, name)
+            return connection.exec_driver_sql(f"SELECT count(*) {clause}",
+                                              dict(params, after=self._start_id(name))).scalar()
+
+    def _start_id(self, name: str) -> int:
+        if name == "nodes":
+            return 0
+        return self.state.get(name, 0)
+
+    def export(self, name: str, progress=None) -> Path | None:
+        """
+        Export one table, calls progress(rows) after each batch. Returns the file written to, None when there was
+        nothing new.
+        """
+        start = perf_counter()
+        after = self._start_id(name)
+        written = 0
+        sink = None
+        with self.engine.connect() as connection:
+            columns, clause, params = self._query(connection, name)
+            quoted = ", ".join(f'"{column}"' for column in columns)
+            sql = f"SELECT {quoted} {clause} ORDER BY id LIMIT :limit"
+            id_index = columns.index("id")
+            while True:
+                # Each batch is its own short read, a live meshChat keeps writing meanwhile
+                rows = connection.exec_driver_sql(sql, dict(params, after=after, limit=self.batch_size)).fetchall()
+                connection.rollback()
+                if not rows:
+                    break
+                if sink is None:
+                    self.out_dir.mkdir(parents=True, exist_ok=True)
+                    path = self.out_dir / f"{name}.{self.fmt}"
+                    if name == "nodes" and path.exists() and self.fmt != "parquet":
+                        # Always whole, so replace the last export rather than append to it
+                        path.unlink()
+                    sink = SINKS[self.fmt](path, columns)
+                sink.write(rows)
+                written += len(rows)
+                after = rows[-1][id_index]
+                if progress is not None:
+                    progress(len(rows))
+                if len(rows) < self.batch_size:
+                    break
+        if sink is not None:
+            sink.close()
+            if name != "nodes":
+                self.state[name] = after
+        self.rows[name] = written
+        self.seconds += perf_counter() - start
+        return sink.path if sink is not None else None
+
+    def save_state(self) -> None:
+        """
+        Remember how far every table got, only once the files are complete
+        """
+        if self.state_path is None:
+            return
+        temporary = self.state_path.with_name(f".{self.state_path.name}.tmp")
+        temporary.write_text(json.dumps(self.state, indent=2))
+        temporary.replace(self.state_path)
+
+    @property
+    def stats(self) -> dict:
+        total = sum(self.rows.values())
+        return {"rows": dict(self.rows), "seconds": self.seconds,
+                "rows_per_second": total / self.seconds if self.seconds else 0.0}
@@ -0,0 +1,287 @@
+# Standard library imports
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import datetime
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+from time import perf_counter
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from meshChatLib.models import Node
+from meshChatLib.replay import JOURNAL_VERSION, _decode
+from meshChatLib.search import DB_TIME_FORMAT
+from meshChatLib.utils import NodeParser, TextMsg
+
+logger = logging.getLogger(__name__)
+
+# Plain files are split into chunks of this many bytes so one big dump still spreads over every worker. Gzip'd files
+# can't be split and go to a worker whole.
+CHUNK_BYTES = 16 * 1024 * 1024
+# Node columns that must be there for a row to be stored
+NODE_REQUIRED = ("radio_id", "longName", "shortName", "macaddr", "hwModel")
+
+MESSAGE_COLUMNS = ("from_radio_id", "to_channel", "msg_text", "time_rx", "packet_id", "rx_radio")
+
+
+# --- Parsing, in the worker processes ---
+def probe(path: Path) -> float | None:
+    """
+    Start time of a meshChat journal, None for any other file
+    """
+    opener = gzip.open if path.suffix == ".gz" else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as source:
+            header = json.loads(source.readline())
+    except (OSError, UnicodeDecodeError, ValueError):
+        return None
+    if isinstance(header, dict) and header.get("meshChatJournal") == JOURNAL_VERSION:
+        return header.get("started")
+    return None
+
+
+def _lines(path: Path, start: int, end: int | None):
+    if path.suffix == ".gz":
+        with gzip.open(path, "rb") as source:
+            yield from source
+        return
+    with open(path, "rb") as source:
+        if start:
+            # The line running over the start belongs to the chunk before
+            source.seek(start - 1)
+            source.readline()
+        while end is None or source.tell() < end:
+            line = source.readline()
+            if not line:
+                break
+            yield line
+
+
+def _epoch_to_db(epoch: float) -> str:
+    when = datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc).replace(tzinfo=None)
+    return when.strftime(DB_TIME_FORMAT)
+
+
+def _message_row(packet: dict, when: float | None, rx_radio: str | None) -> tuple | None:
+    txt_msg = TextMsg(raw_msg=packet)
+    if txt_msg.portnum != "TEXT_MESSAGE_APP" or not txt_msg.text:
+        return None
+    rx_time = txt_msg.rxTime or when
+    if rx_time is None:
+        return None
+    return (txt_msg.from_radio_id, txt_msg.to_radio_id, txt_msg.text, _epoch_to_db(rx_time), txt_msg.msg_id, rx_radio)
+
+
+def parse_chunk(path: str, start: int, end: int | None, started: float | None, rx_radio: str | None) -> dict:
+    """
+    Messages and nodes of one chunk of an input file.
+
+    Lines can be a meshChat journal, packet dicts as meshtastic publishes them on meshtastic.receive, node dicts as
+    on meshtastic.node.updated, or {"packet": ...} / {"node": ...} wrappers of either.
+    """
+    path = Path(path)
+    messages = list()
+    nodes = dict()
+    lines = 0
+    skipped = 0
+    for line in _lines(path, start, end):
+        line = line.strip()
+        if not line:
+            continue
+        lines += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            skipped += 1
+            continue
+        packet = node = when = None
+        if isinstance(record, list) and len(record) == 3:
+            elapsed_ms, topic, data = record
+            if started is not None:
+                when = started + elapsed_ms / 1000
+            data = _decode(data) if isinstance(data, dict) else dict()
+            if str(topic).startswith("meshtastic.receive"):
+                packet = data.get("packet")
+            elif topic == "meshtastic.node.updated":
+                node = data.get("node")
+        elif isinstance(record, dict):
+            if "meshChatJournal" in record:
+                continue
+            if "decoded" in record:
+                packet = record
+            elif "user" in record:
+                node = record
+            else:
+                packet = record.get("packet")
+                node = record.get("node")
+
+        if isinstance(packet, dict):
+            # Packets other than text messages are fine, there's just nothing to import from them
+            row = _message_row(packet, when, rx_radio)
+            if row is not None:
+                messages.append(row)
+            continue
+        if isinstance(node, dict):
+            values = NodeParser(node).as_dict()
+            values["rx_radio"] = rx_radio
+            if all(values[field] is not None for field in NODE_REQUIRED):
+                known = nodes.get(values["macaddr"])
+                # The latest sighting of each node wins
+                if known is None or (known["lastHeard"] or 0) <= (values["lastHeard"] or 0):
+                    nodes[values["macaddr"]] = values
+                continue
+        skipped += 1
+    size = (end if end is not None else path.stat().st_size) - start
+    return {"messages": messages, "nodes": list(nodes.values()), "lines": lines, "skipped": skipped,
+            "bytes": size}
+
+
+class BulkImporter(object):
+    """
+    Imports packet dumps, meshChat journals and logs of other Meshtastic clients into the database.
+
+    Files are parsed in a process pool, through the same TextMsg and NodeParser the receive path uses. The main
+    process inserts what comes back, batch_size rows to a transaction. Messages already in the database, or seen
+    earlier in the import, are skipped by (sender, packet id). Messages without a packet id can't be matched and are
+    always inserted. Nodes are upserted, keeping whichever copy was heard last.
+    """
+
+    def __init__(self, engine, jobs: int | None = None, batch_size: int = 50000, rx_radio: str | None = None) -> None:
+        self.engine = engine
+        self.jobs = jobs or os.cpu_count() or 1
+        self.batch_size = batch_size
+        # Label stored as the messages' rx_radio, e.g. the radio the logs came from
+        self.rx_radio = rx_radio
+
+        # --- Counters ---
+        self.files = 0
+        self.lines = 0
+        self.skipped = 0
+        self.messages_read = 0
+        self.messages_inserted = 0
+        self.nodes_upserted = 0
+        self.nodes_failed = 0
+        self.seconds = 0.0
+
+    def plan(self, paths) -> list:
+        """
+        (path, start, end, journal start time) of every chunk to parse
+        """
+        chunks = list()
+        for path in map(Path, paths):
+            started = probe(path)
+            size = path.stat().st_size
+            if path.suffix == ".gz" or size <= CHUNK_BYTES:
+                chunks.append((str(path), 0, None, started))
+            else:
+                chunks.extend((str(path), start, min(start + CHUNK_BYTES, size), started)
+                              for start in range(0, size, CHUNK_BYTES))
+            self.files += 1
+        return chunks
+
+    def run(self, paths, progress=None) -> None:
+        """
+        Import every file, calls progress(bytes) as chunks are done
+        """
+        start = perf_counter()
+        chunks = self.plan(paths)
+        messages = list()
+        nodes = list()
+        with self.engine.connect() as connection, ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            connection.exec_driver_sql(
+                "CREATE TEMP TABLE IF NOT EXISTS import_messages (from_radio_id, to_channel, msg_text, time_rx, "
+                "packet_id, rx_radio, UNIQUE (from_radio_id, packet_id))")
+            connection.commit()
+            pending = set()
+            queued = iter(chunks)
+            while True:
+                # A few chunks ahead of the inserts, so parsed rows don't pile up in memory
+                while len(pending) < self.jobs * 2:
+                    chunk = next(queued, None)
+                    if chunk is None:
+                        break
+                    pending.add(pool.submit(parse_chunk, *chunk, self.rx_radio))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self.lines += result["lines"]
+                    self.skipped += result["skipped"]
+                    self.messages_read += len(result["messages"])
+                    messages.extend(result["messages"])
+                    nodes.extend(result["nodes"])
+                    if len(messages) >= self.batch_size or len(nodes) >= self.batch_size:
+                        self._write(connection, messages, nodes)
+                        messages, nodes = list(), list()
+                    if progress is not None:
+                        progress(result["bytes"])
+            self._write(connection, messages, nodes)
+        self.seconds += perf_counter() - start
+
+    def _write(self, connection, messages: list, nodes: list) -> None:
+        if not messages and not nodes:
+            return
+        with connection.begin():
+            if messages:
+                connection.exec_driver_sql(f"INSERT OR IGNORE INTO import_messages VALUES "
+                                           f"({', '.join('?' * len(MESSAGE_COLUMNS))})", messages)
+                columns = ", ".join(MESSAGE_COLUMNS)
+                result = connection.exec_driver_sql(
+                    f"INSERT INTO channel_history ({columns}) SELECT {columns} FROM import_messages AS new "
+                    f"WHERE new.packet_id IS NULL OR NOT EXISTS (SELECT 1 FROM channel_history AS old "
+                    f"WHERE old.from_radio_id = new.from_radio_id AND old.packet_id = new.packet_id) "
+                    f"ORDER BY new.time_rx")
+                self.messages_inserted += result.rowcount
+                connection.exec_driver_sql("DELETE FROM import_messages")
+            if nodes:
+                self._upsert_nodes(connection, nodes)
+
+    def _upsert_nodes(self, connection, nodes: list) -> None:
+        latest = dict()
+        for values in nodes:
+            known = latest.get(values["macaddr"])
+            if known is None or (known["lastHeard"] or 0) <= (values["lastHeard"] or 0):
+                latest[values["macaddr"]] = values
+        stmt = sqlite_insert(Node)
+        # Older copies of a node mustn't overwrite what's already known about it
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Node.macaddr],
+            set_=dict({field: stmt.excluded[field] for field in NodeParser.FIELDS if field != "macaddr"},
+                      rx_radio=func.coalesce(stmt.excluded.rx_radio, Node.rx_radio)),
+            where=func.coalesce(Node.lastHeard, 0) <= func.coalesce(stmt.excluded.lastHeard, 0))
+        rows = list(latest.values())
+        try:
+            with connection.begin_nested():
+                connection.execute(stmt, rows)
+            self.nodes_upserted += len(rows)
+        except IntegrityError:
+            # Usually a radio id that moved to another macaddr, store the others one by one
+            for values in rows:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(stmt, values)
+                    self.nodes_upserted += 1
+                except IntegrityError:
+                    logger.warning(f"Skipping node {values['radio_id']} ({values['macaddr']}), it clashes with "
+                                   f"one already stored")
+                    self.nodes_failed += 1
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "files": self.files,
+            "lines": self.lines,
+            "skipped": self.skipped,
+            "messages_read": self.messages_read,
+            "messages_inserted": self.messages_inserted,
+            "duplicates": self.messages_read - self.messages_inserted,
+            "nodes_upserted": self.nodes_upserted,
+            "nodes_failed": self.nodes_failed,
+            "seconds": self.seconds,
+            "lines_per_second": self.lines / self.seconds if self.seconds else 0.0,
+        }
@@ -0,0 +1,213 @@
+# Standard library imports
+import datetime
+
+from sqlalchemy import update
+
+from meshChatLib.dispatch import PortnumDispatcher
+from meshChatLib.metrics import Metrics
+from meshChatLib.models import Node
+from meshChatLib.telemetry import METRICS as TELEMETRY_METRICS
+from meshChatLib.utils import NodeParser, TextMsg, TelemetryMsg, PositionMsg
+
+
+class PacketIngest(object):
+    """
+    What happens to a packet between the radio and the database, shared by meshChatApp and the headless daemon.
+
+    The handlers keep the node registry, telemetry and position stores and the batched writer up to date. Nothing is
+    rendered or published here: whoever owns the ingest is told through the on_* callbacks, and reacts to the
+    connection handlers' return values.
+    """
+
+    def __init__(self, radios, nodes, writer, telemetry, positions, session, metrics: Metrics | None = None,
+                 on_message=None, on_node=None, on_telemetry=None, on_position=None) -> None:
+        self.radios = radios
+        self.nodes = nodes
+        self.writer = writer
+        self.telemetry = telemetry
+        self.positions = positions
+        # Only for the small updates of the local radio flags, everything else goes through the writer
+        self.session = session
+
+        # --- Callbacks, all on the thread the handlers run on ---
+        # on_message(values): a ChannelHistory row, received or sent
+        self.on_message = on_message
+        # on_node(row, macaddrs): a node changed, macaddrs are the sidebar entries to redraw
+        self.on_node = on_node
+        # on_telemetry(radio_id, timestamp, sample)
+        self.on_telemetry = on_telemetry
+        # on_position(radio_id, timestamp, latitude, longitude, altitude): a fix was added to a track
+        self.on_position = on_position
+
+        # --- Packet handlers ---
+        # rx_packet looks the handlers up by portnum, new apps only need to subscribe here
+        timed = (metrics or Metrics(enabled=False)).timed
+        self.dispatcher = PortnumDispatcher()
+        self.dispatcher.subscribe("TEXT_MESSAGE_APP", timed("handler_seconds", self.text_packet_rx, handler="text_rx"))
+        self.dispatcher.subscribe("TELEMETRY_APP",
+                                  timed("handler_seconds", self.telemetry_packet_rx, handler="telemetry_rx"))
+        self.dispatcher.subscribe("POSITION_APP",
+                                  timed("handler_seconds", self.position_packet_rx, handler="position_rx"))
+
+    # --- Packets ---
+    def rx_packet(self, packet, interface) -> None:
+        """
+        Called when any packet is received from Meshtastic
+        """
+        link = self.radios.for_interface(interface)
+        if link is not None:
+            link.packets += 1
+        self.dispatcher.dispatch(packet, interface)
+
+    def text_packet_rx(self, packet, interface) -> None:
+        """
+        TEXT_MESSAGE_APP handler
+        """
+        link = self.radios.for_interface(interface)
+        self.text_rx(TextMsg(raw_msg=packet), rx_radio=link.label if link is not None else None)
+
+    def text_rx(self, txt_msg: TextMsg, rx_radio: str | None = None) -> None:
+        # Stored as naive UTC like the rest of the database, the chat log pages on it
+        time_rx = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self.store_message(from_radio_id=txt_msg.from_radio_id, to_channel=txt_msg.to_radio_id,
+                           msg_text=txt_msg.text, time_rx=time_rx, packet_id=txt_msg.msg_id, rx_radio=rx_radio)
+
+    def sent_text(self, link, message, packet) -> None:
+        """
+        Store a message one of the local radios sent
+        """
+        time_rx = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        packet_id = packet.get("id") if isinstance(packet, dict) else getattr(packet, "id", None)
+        self.store_message(from_radio_id=link.radio_id, to_channel=message.destination, msg_text=message.text,
+                           time_rx=time_rx, packet_id=packet_id, rx_radio=link.label)
+
+    def store_message(self, **values) -> None:
+        # The writer commits it with the next batch
+        self.writer.add_message(**values)
+        if self.on_message is not None:
+            self.on_message(values)
+
+    def telemetry_packet_rx(self, packet, interface) -> None:
+        """
+        TELEMETRY_APP handler, device metrics go into the telemetry store
+        """
+        telemetry_msg = TelemetryMsg(raw_msg=packet)
+        sample = {metric: getattr(telemetry_msg, metric) for metric in TELEMETRY_METRICS}
+        if all(value is None for value in sample.values()):
+            # Environment or power metrics, nothing the store keeps
+            return
+        # The sender's clock can be unset, fall back to when we heard it
+        timestamp = telemetry_msg.timestamp or telemetry_msg.rx_time or datetime.datetime.now().timestamp()
+        self.telemetry.add(telemetry_msg.from_radio_id, timestamp, sample)
+        link = self.radios.for_radio_id(telemetry_msg.from_radio_id)
+        if link is not None:
+            # A local radio's view of its channel sets how fast it sends
+            link.outbound.tune(telemetry_msg.channelUtilization, telemetry_msg.airUtilTx)
+        if self.on_telemetry is not None:
+            self.on_telemetry(telemetry_msg.from_radio_id, timestamp, sample)
+
+    def position_packet_rx(self, packet, interface) -> None:
+        """
+        POSITION_APP handler, adds the fix to the sender's track
+        """
+        position_msg = PositionMsg(raw_msg=packet)
+        if position_msg.latitude is None or position_msg.longitude is None:
+            return
+        timestamp = position_msg.time or position_msg.rx_time or datetime.datetime.now().timestamp()
+        self.add_position(position_msg.from_radio_id, timestamp, position_msg.latitude, position_msg.longitude,
+                          position_msg.altitude)
+
+    def add_position(self, radio_id: str, timestamp: float, lat: float, lon: float, alt: float | None) -> None:
+        fixes = self.positions.fixes
+        self.positions.add(radio_id, timestamp, lat, lon, alt)
+        # Repeats of the last fix aren't added
+        if self.positions.fixes != fixes and self.on_position is not None:
+            self.on_position(radio_id, timestamp, lat, lon, alt)
+
+    # --- Nodes ---
+    def update_nodes(self, node, interface) -> None:
+        values = NodeParser(node).as_dict()
+        # A local radio heard by one of the others stays tagged with itself
+        local_link = self.radios.for_radio_id(values["radio_id"])
+        link = local_link or self.radios.for_interface(interface)
+        if link is not None:
+            values["rx_radio"] = link.label
+
+        # The same node under a new macaddr replaces the old entry
+        previous = self.nodes.get_by_radio_id(values["radio_id"]) if values["radio_id"] is not None else None
+        row, changed = self.nodes.upsert(values)
+        if row is None:
+            return
+        # Insert or update happens in the writer's next batch
+        self.writer.upsert_node(values)
+        if local_link is not None:
+            local_link.outbound.tune(values["channelUtilization"], values["airUtilTx"])
+        if values["latitude"] is not None and values["longitude"] is not None and values["time"]:
+            # The node DB sent at connect has the last known position of nodes we haven't heard from yet
+            self.add_position(values["radio_id"], values["time"], values["latitude"], values["longitude"],
+                              values["altitude"])
+        if self.on_node is None:
+            return
+        if previous is not None and previous["macaddr"] != row["macaddr"]:
+            self.on_node(row, [row["macaddr"], previous["macaddr"]])
+        elif changed:
+            self.on_node(row, [row["macaddr"]])
+
+    # --- Radios ---
+    def on_local_connection(self, interface):
+        """
+        A local radio connected: store it as a node flagged local. Returns its RadioLink.
+        """
+        link = self.radios.for_interface(interface) or self.radios.primary
+        my_user = link.identify()
+        if self.nodes.get_by_macaddr(link.macaddr) is None:
+            # Wrap this response inside a dictionary beacuse that's how other respones work
+            local_node = dict(NodeParser({"user": my_user}).as_dict(), local_radio=True, rx_radio=link.label)
+            self.writer.upsert_node(local_node)
+        else:
+            self._set_local_flag(Node.macaddr == link.macaddr, {"local_radio": True, "rx_radio": link.label})
+            local_node = {"macaddr": link.macaddr, "rx_radio": link.label}
+        self.nodes.upsert(local_node)
+        changed = self.nodes.set_local_radios(self.radios.local_macaddrs)
+        if self.on_node is not None:
+            self.on_node(self.nodes.get_by_macaddr(link.macaddr), changed + [link.macaddr])
+        return link
+
+    def disconnect_radio(self, interface) -> tuple:
+        """
+        Called when a radio disconnect event is received. Returns (what happened, the radio's RadioLink):
+        "ignored" for a stale report, "lost" when it's being reopened in the background, "disconnected" when it was
+        closed while other radios carry on, and "gone" when no radio is left.
+        """
+        link = self.radios.for_interface(interface)
+        if link is not None and (interface is not link.interface or link.reconnecting):
+            # Closing the dead interface reports it lost again, and so may one a reconnect already replaced
+            return "ignored", link
+        if link is not None and link.lost():
+            return "lost", link
+        if link is not None and len(self.radios.connected) > 1:
+            link.close()
+            self._set_local_flag(Node.macaddr == link.macaddr, {"local_radio": False})
+            changed = self.nodes.set_local_radios(self.radios.local_macaddrs)
+            if self.on_node is not None and changed:
+                self.on_node(self.nodes.get_by_macaddr(link.macaddr), changed)
+            return "disconnected", link
+        return "gone", link
+
+    def _set_local_flag(self, where, values: dict) -> None:
+        u = update(Node)
+        u = u.values(values)
+        u = u.where(where)
+        self.session.execute(u)
+        self.session.commit()
+
+    def close(self) -> None:
+        """
+        Clear the local radio flags, close the radios and write out everything still queued
+        """
+        self._set_local_flag(Node.local_radio == True, {"local_radio": False})
+        self.nodes.set_local_radios(())
+        self.radios.close()
+        # Persist the telemetry periods still open, then write out anything still waiting in the queue
+        self.telemetry.close_buckets()
+        self.writer.close()
@@ -1,5 +1,6 @@
 import datetime
 
+from rich.table import Table
 from textual.app import App, ComposeResult, RenderResult
 from textual.containers import ScrollableContainer, Container, VerticalScroll, Vertical, Grid, Center, Middle
 from textual import events
@@ -7,12 +8,18 @@ from textual.css.query import NoMatches
 from textual.screen import Screen, ModalScreen
 from textual.timer import Timer
 from textual.widget import Widget
-from textual.widgets import (Header, Footer, Log, Placeholder, Static, Label, Button, LoadingIndicator, TextArea,
-                             Markdown, RichLog, Input, ListView, ListItem, OptionList, ProgressBar)
+# textual.widgets loads each widget on first use, TextArea and Markdown alone add most of 100 ms to startup
+from textual.widgets import Header, Footer, Placeholder, Static, Label, Button, LoadingIndicator, RichLog, Input, \
+    OptionList
+
+from meshChatLib.widgets import AsciiMap, ChatLog, TelemetryPanel
+
 class MainChatScreen(Screen):
 
     BINDINGS = [("ctrl+d", "toggle_dark", "Dark Mode"),
-                ("ctrl+q", "request_quit", "Quit")]
+                ("ctrl+f", "search", "Search"),
+                ("ctrl+q", "request_quit", "Quit"),
+                ("ctrl+s", "profile_snapshot", "Profile")]
 
     def __init__(
             self,
@@ -25,13 +32,21 @@ class MainChatScreen(Screen):
         yield Vertical(
                 OptionList(classes="nodes", id="nodes"),
                         Placeholder(label="Channels", classes="box", id="channels"), id="left_col")
+        # The chat log scrolls itself, it pages older messages in from the database as you scroll up
         yield Vertical(
-                VerticalScroll(
-                    RichLog(highlight=True, markup=True)),
+                ChatLog(history=getattr(self.app, "chat_history", None),
+                        max_messages=getattr(self.app, "chat_max_messages", 500),
+                        max_age=getattr(self.app, "chat_max_age", None),
+                        highlight=True, markup=True),
                     # Placeholder(label="Main Chat", classes="box", id="main_chat")),
                 Input(placeholder="Send messages", classes="box", id="main_chat_text_input", type="text"), id="center_col")
         yield Vertical(
-            Placeholder(label="Radio Information", classes="box", id="radio_info"),
+            VerticalScroll(
+                TelemetryPanel(store=getattr(self.app, "telemetry", None),
+                               names=getattr(self.app, "node_short_name", None), id="telemetry"),
+                classes="box", id="radio_info"),
+            AsciiMap(store=getattr(self.app, "positions", None), names=getattr(self.app, "node_short_name", None),
+                     radius_km=getattr(self.app, "map_radius_km", None), classes="box", id="map"),
             Button("Add Nodes", classes="box", id="add_node"), id="right_col"
         )
         yield Header(show_clock=True)
@@ -43,6 +58,84 @@ class MainChatScreen(Screen):
             input_box.focus()
         except:
             pass
+        self.query_one(ChatLog).load_latest()
+
+    def action_search(self) -> None:
+        self.app.push_screen(SearchScreen())
+
+    def action_profile_snapshot(self) -> None:
+        self.app.profile_snapshot()
+
+    def check_action(self, action: str, parameters: tuple) -> bool | None:
+        # Only in the footer when running with --profile
+        if action == "profile_snapshot":
+            return getattr(self.app, "profiler", None) is not None
+        return True
+
+
+class SearchScreen(Screen):
+    """
+    Search the message history. Plain words, "a phrase", pre* for prefixes and
+    from:, channel:, since:, until: filters.
+    """
+
+    BINDINGS = [("escape", "app.pop_screen", "Back")]
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield Input(placeholder='Search messages: words, "a phrase", pre*, from:, channel:, since:, until:',
+                    id="search_input", type="text")
+        yield Label("", id="search_status")
+        yield OptionList(id="search_results")
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.query_one("#search_input", Input).focus()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        self.run_search(event.value)
+
+    def run_search(self, query: str) -> None:
+        results = self.query_one("#search_results", OptionList)
+        status = self.query_one("#search_status", Label)
+        history_search = self.app.history_search
+        # Messages still waiting in the batched writer aren't indexed yet, they're matched in memory. An attached TUI
+        # has no writer, the daemon flushes its own.
+        pending = self.app.writer.pending("message") if self.app.writer is not None else ()
+        rows = history_search.search(query, pending=pending)
+        results.clear_options()
+        results.add_options([f"[dim]{row.to_channel}[/] {self.app.chat_line(row.time_rx, row.from_radio_id, row.msg_text)}"
+                             for row in rows])
+        status.update(f"{len(rows)} messages in {history_search.last_search_ms:.1f} ms" if query.strip() else "")
+
+
+class StatsScreen(Screen):
+    """
+    Counters and timings of the receive, storage and render paths, from app.metrics
+    """
+
+    BINDINGS = [("escape", "app.pop_screen", "Back")]
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield VerticalScroll(Static("", id="stats_table"))
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.refresh_stats()
+        self.set_interval(1.0, self.refresh_stats)
+
+    def refresh_stats(self) -> None:
+        metrics = self.app.metrics
+        table = Table(expand=True, caption=None if metrics.enabled else
+                      "Start meshChat with --metrics to time the handlers, database flushes and frames")
+        table.add_column("Metric")
+        table.add_column("Labels")
+        table.add_column("Value", justify="right")
+        for row in metrics.summary():
+            table.add_row(*row)
+        self.query_one("#stats_table", Static).update(table)
+
 
 class QuitScreen(ModalScreen[bool]):
     """Screen with a dialog to quit."""
@@ -0,0 +1,329 @@
+# Standard library imports
+import bisect
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+from pathlib import Path
+import threading
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# Counters and latency histograms of the receive, storage and render paths, in the Prometheus text format.
+#
+# Timing only costs anything when it's enabled: the hot paths are wrapped once at start up, a disabled Metrics hands
+# the functions back untouched. The stats the components keep anyway (writer, bridge, dedupe, ...) are only read when
+# the metrics are scraped or shown.
+
+PREFIX = "meshchat"
+# Seconds, from a fast handler call up to a stalled SQLite commit
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+           5.0, 10.0)
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value) if value == value else "NaN"
+    return str(int(value))
+
+
+class Histogram(object):
+    """
+    Latency distribution in fixed buckets, like a Prometheus histogram
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.buckets = buckets
+        # One count per bucket plus the +Inf one, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the q quantile falls in, the largest observation for the +Inf bucket
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            largest = self.max
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else largest
+        return largest
+
+    def cumulative(self) -> tuple:
+        """
+        (cumulative bucket counts, count, sum) at one point in time
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total, seconds = self.count, self.sum
+        running = 0
+        cumulative = list()
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, seconds
+
+
+class Metrics(object):
+    """
+    Registry of counters, histograms and the stats of the components that keep their own.
+
+    With enabled False nothing is timed or counted, only the collected component stats are there to read.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = PREFIX) -> None:
+        self.enabled = enabled
+        self.prefix = prefix
+        # (name, labels) -> value
+        self._counters = dict()
+        # (name, labels) -> Histogram
+        self._histograms = dict()
+        # name -> callable returning a flat stats dict
+        self._collectors = dict()
+        self._lock = threading.Lock()
+
+    # --- Recording ---
+    def inc(self, name: str, amount: int = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+        return histogram
+
+    def timed(self, name: str, func, **labels):
+        """
+        func, with the time of every call observed into the name histogram. func itself when disabled.
+        """
+        if not self.enabled:
+            return func
+        histogram = self.histogram(name, **labels)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        return wrapper
+
+    def receive(self, func):
+        """
+        timed() for an rx_packet handler, which also counts the packets per portnum
+        """
+        if not self.enabled:
+            return func
+        timed = self.timed("handler_seconds", func, handler="rx_packet")
+        counters = self._counters
+        lock = self._lock
+
+        @functools.wraps(func)
+        def wrapper(packet, interface):
+            portnum = str((packet.get("decoded") or {}).get("portnum"))
+            key = ("packets_total", (("portnum", portnum),))
+            with lock:
+                counters[key] = counters.get(key, 0) + 1
+            return timed(packet, interface)
+        return wrapper
+
+    def collect(self, name: str, stats) -> None:
+        """
+        Export what stats() returns, e.g. a component's stats property, each time the metrics are read
+        """
+        self._collectors[name] = stats
+
+    # --- Reading ---
+    def _collected(self) -> list:
+        """
+        (name, labels, value) of every number the collectors return. Nested dicts become a "key" label.
+        """
+        samples = list()
+        for component, stats in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception:
+                logger.exception(f"Collecting {component} stats failed")
+                continue
+            for key, value in values.items():
+                name = f"{component}_{key}"
+                if isinstance(value, dict):
+                    for label, item in value.items():
+                        if isinstance(item, (int, float)):
+                            samples.append((name, (("key", str(label)),), item))
+                elif isinstance(value, (int, float)):
+                    samples.append((name, (), value))
+        return samples
+
+    def render(self) -> str:
+        """
+        Everything in the Prometheus text exposition format
+        """
+        lines = list()
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        last = None
+        for (name, labels), value in counters:
+            full = f"{self.prefix}_{name}"
+            if full != last:
+                lines.append(f"# TYPE {full} counter")
+                last = full
+            lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+        for (name, labels), histogram in histograms:
+            full = f"{self.prefix}_{name}"
+            if full != last:
+                lines.append(f"# TYPE {full} histogram")
+                last = full
+            cumulative, count, seconds = histogram.cumulative()
+            for bound, running in zip(histogram.buckets + ("+Inf",), cumulative):
+                lines.append(f"{full}_bucket{_format_labels(labels, (('le', str(bound)),))} {running}")
+            lines.append(f"{full}_sum{_format_labels(labels)} {_number(float(seconds))}")
+            lines.append(f"{full}_count{_format_labels(labels)} {count}")
+        for name, labels, value in sorted(self._collected(), key=lambda sample: sample[:2]):
+            full = f"{self.prefix}_{name}"
+            if full != last:
+                lines.append(f"# TYPE {full} gauge")
+                last = full
+            lines.append(f"{full}{_format_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list:
+        """
+        (metric, labels, value text) rows for the stats screen
+        """
+        rows = list()
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        for (name, labels), value in counters:
+            rows.append((name, ", ".join(f"{key}={item}" for key, item in labels), str(value)))
+        for (name, labels), histogram in histograms:
+            if not histogram.count:
+                continue
+            rows.append((name, ", ".join(f"{key}={item}" for key, item in labels),
+                         f"{histogram.count} calls, avg {histogram.sum * 1000 / histogram.count:.3f} ms, "
+                         f"p95 < {histogram.quantile(0.95) * 1000:.3f} ms, max {histogram.max * 1000:.3f} ms"))
+        for name, labels, value in sorted(self._collected(), key=lambda sample: sample[:2]):
+            text = f"{value:.3f}" if isinstance(value, float) else str(value)
+            rows.append((name, ", ".join(f"{key}={item}" for key, item in labels), text))
+        return rows
+
+
+class MetricsExporter(object):
+    """
+    Serves the metrics on a local HTTP port, writes them to a file every interval seconds, or both.
+
+    The file is replaced atomically, so it works with node_exporter's textfile collector.
+    """
+
+    def __init__(self, metrics: Metrics, port: int | None = None, path: str | None = None,
+                 interval: float = 10.0, host: str = "127.0.0.1") -> None:
+        self.metrics = metrics
+        self.port = port
+        self.path = Path(path) if path is not None else None
+        self.interval = interval
+        self.host = host
+        self._server = None
+        self._threads = list()
+        self._closed = threading.Event()
+
+    def start(self) -> None:
+        if self.port is not None:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    # Scrapes every few seconds would drown the log
+                    pass
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            self._threads.append(threading.Thread(target=self._server.serve_forever, name="meshChat-metrics-http",
+                                                  daemon=True))
+        if self.path is not None:
+            self._threads.append(threading.Thread(target=self._dump_loop, name="meshChat-metrics-file", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _dump_loop(self) -> None:
+        while not self._closed.wait(self.interval):
+            self.dump()
+
+    def dump(self) -> None:
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            temporary.write_text(self.metrics.render())
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.exception(f"Writing metrics to {self.path} failed")
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.path is not None:
+            # The final numbers
+            self.dump()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,19 +1,120 @@
-# from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, Boolean, update, insert, select
-# from sqlalchemy.orm import sessionmaker, declarative_base, registry
-#
-# # Magic sqlalchemy string
-# Base = declarative_base()
-
-
-# class Node(Base):
-#     __tablename__ = 'nodes'
-#
-#     id = Column(Integer, primary_key=True)
-#     longName = Column(String(50), unique=False, nullable=False)
-#     shortName = Column(String(10), unique=False, nullable=False)
-#     macaddr = Column(String(20), unique=True, nullable=False)
-#     hwModel = Column(String(100), unique=False, nullable=False)
-#     created_at = Column(DateTime, default=func.now())
-#     last_seen = Column(DateTime, default=func.now(), onupdate=func.now())
-#     # Local radio sent per instance
-#     local_radio = Column(Boolean, default=False)
\ No newline at end of file
+from sqlalchemy import Column, Integer, String, DateTime, func, Boolean, Float, ForeignKey, Index, \
+    UniqueConstraint
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+# Remove all but the essential data?
+# Does the radio cache old data?
+# Test request then disconnect far radio and test again
+class Node(Base):
+    __tablename__ = 'nodes'
+    # radio_id and macaddr are unique, which already indexes them
+    __table_args__ = (
+        Index("ix_nodes_radio_num", "radio_num"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    last_seen = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    # Local radio sent per instance
+    local_radio = Column(Boolean, default=False)
+    # Label of the local radio this node was last heard on
+    rx_radio = Column(String(50), nullable=True)
+    # Meshtastic provided information
+    radio_num = Column(String(50), unique=False, nullable=True)
+    radio_id = Column(String(50), unique=True, nullable=False)
+    longName = Column(String(50), unique=False, nullable=False)
+    shortName = Column(String(10), unique=False, nullable=False)
+    macaddr = Column(String(20), unique=True, nullable=False)
+    hwModel = Column(String(100), unique=False, nullable=False)
+    role = Column(String(50), unique=False, nullable=True)
+    snr = Column(String(50), unique=False, nullable=True)
+    # Epoch seconds, as the radio reports it
+    lastHeard = Column(Integer(), unique=False, nullable=True)
+    batteryLevel = Column(Integer(), unique=False, nullable=True)
+    voltage = Column(Float(), unique=False, nullable=True)
+    channelUtilization = Column(Float(), unique=False, nullable=True)
+    airUtilTx = Column(Float(), unique=False, nullable=True)
+    latitudeI = Column(Float(), unique=False, nullable=True)
+    longitudeI = Column(Float(), unique=False, nullable=True)
+    altitude = Column(Integer(), unique=False, nullable=True)
+    time = Column(String(75), unique=False, nullable=True)
+    latitude = Column(Float(), unique=False, nullable=True)
+    longitude = Column(Float(), unique=False, nullable=True)
+
+
+class ChannelHistory(Base):
+    __tablename__ = 'channel_history'
+    __table_args__ = (
+        # A channel's history, newest first
+        Index("ix_channel_history_channel_time", "to_channel", "time_rx"),
+        # Everything one node has sent
+        Index("ix_channel_history_sender_time", "from_radio_id", "time_rx"),
+        # The chat log pages through every channel by time
+        Index("ix_channel_history_time", "time_rx"),
+        # Duplicate checks on the packet id
+        Index("ix_channel_history_sender_packet", "from_radio_id", "packet_id"),
+        # The chat log of one local radio
+        Index("ix_channel_history_radio_time", "rx_radio", "time_rx"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    from_radio_id = Column(ForeignKey("nodes.radio_id"), nullable=True)
+    to_channel = Column(String(50), nullable=True)
+    msg_text = Column(String(50), nullable=False)
+    time_rx = Column(DateTime(timezone=True), default=func.now())
+    # Meshtastic packet id, unique per sender for a while
+    packet_id = Column(Integer, nullable=True)
+    # Label of the local radio the message arrived on, or was sent from
+    rx_radio = Column(String(50), nullable=True)
+    # FROM Radio ID as a foregin key
+    # TO channel/DM
+    # Message text
+    # DateTime RX
+
+
+class TelemetryRollup(Base):
+    """
+    min/max/avg of one device metric of one node over a minute or an hour
+    """
+    __tablename__ = 'telemetry_rollup'
+    __table_args__ = (
+        # One row per period, which also indexes a node's trend lookups
+        UniqueConstraint("radio_id", "metric", "resolution", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    radio_id = Column(String(50), nullable=False)
+    metric = Column(String(50), nullable=False)
+    # Bucket length in seconds
+    resolution = Column(Integer, nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    min_value = Column(Float(), nullable=False)
+    max_value = Column(Float(), nullable=False)
+    avg_value = Column(Float(), nullable=False)
+    samples = Column(Integer, nullable=False)
+
+
+class PositionFix(Base):
+    """
+    One reported position of a node
+    """
+    __tablename__ = 'position_fix'
+    __table_args__ = (
+        # A node's track in time order
+        Index("ix_position_fix_radio_time", "radio_id", "time_fix"),
+        # Loading recent fixes of every node at start
+        Index("ix_position_fix_time", "time_fix"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    radio_id = Column(String(50), nullable=False)
+    time_fix = Column(DateTime(timezone=True), nullable=False)
+    latitude = Column(Float(), nullable=False)
+    longitude = Column(Float(), nullable=False)
+    altitude = Column(Integer(), nullable=True)
+    time_rx = Column(DateTime(timezone=True), default=func.now())
@@ -0,0 +1,294 @@
+# Standard library imports
+from collections import deque
+import heapq
+import itertools
+import logging
+import random
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Lower goes first
+PRIORITY_ADMIN = 0
+PRIORITY_DM = 1
+PRIORITY_CHANNEL = 2
+PRIORITY_BULK = 3
+
+BROADCAST = "^all"
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` sends per second on average, with bursts of up to `burst`
+    """
+
+    def __init__(self, rate: float, burst: float, clock=monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self._updated = clock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float | None = None) -> float:
+        """
+        Seconds until a token is available, 0 if one is available now
+        """
+        now = self.clock() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float | None = None) -> bool:
+        now = self.clock() if now is None else now
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def set_rate(self, rate: float) -> None:
+        self._refill(self.clock())
+        self.rate = rate
+
+
+class OutboundMessage(object):
+    __slots__ = ("text", "destination", "channel_index", "priority", "attempts", "not_before", "queued_at",
+                 "on_sent", "on_failed")
+
+    def __init__(self, text: str, destination=BROADCAST, channel_index: int = 0, priority: int = PRIORITY_CHANNEL,
+                 on_sent=None, on_failed=None) -> None:
+        self.text = text
+        self.destination = destination
+        self.channel_index = channel_index
+        self.priority = priority
+        self.attempts = 0
+        self.not_before = 0.0
+        self.queued_at = monotonic()
+        # Called from the scheduler thread with the message, and the sent packet or the last error
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+
+    @property
+    def key(self) -> tuple:
+        return self.destination, self.channel_index
+
+
+class OutboundScheduler(object):
+    """
+    Paces everything sent to the mesh through one token bucket, on its own thread.
+
+    Messages queue per destination and channel, so each conversation stays in order. Across queues the highest
+    priority ready message goes first: admin, then DMs, then channel chat, then bulk. A failed send is retried with
+    exponential backoff. The rate follows the local radio's channel utilisation and airtime through tune().
+    """
+
+    def __init__(self, send=None, rate: float = 0.2, burst: float = 3, max_attempts: int = 5,
+                 backoff: float = 2.0, max_backoff: float = 120.0, clock=monotonic) -> None:
+        # send(text, destinationId=..., channelIndex=...), normally interface.sendText
+        self.send = send
+        self.base_rate = rate
+        # time.monotonic, or a stand-in the tests move by hand
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst, clock=clock)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # (destination, channel) -> deque of OutboundMessage, only the head of each is in the heap
+        self._queues = dict()
+        # (priority, not_before, sequence, key) of each queue's head
+        self._heap = list()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        # Set while the radio is away, messages keep queueing and go out once it's back
+        self._paused = False
+        self._thread = None
+
+        # --- Counters ---
+        self.queued = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def start(self, send=None) -> None:
+        if send is not None:
+            self.send = send
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="meshChat-outbound", daemon=True)
+            self._thread.start()
+
+    def queue(self, text: str, destination=BROADCAST, channel_index: int = 0, priority: int | None = None,
+              on_sent=None, on_failed=None) -> OutboundMessage:
+        """
+        Queue a text message, never blocks. Without a priority, DMs go as PRIORITY_DM and the rest as
+        PRIORITY_CHANNEL.
+        """
+        if priority is None:
+            priority = PRIORITY_CHANNEL if destination == BROADCAST else PRIORITY_DM
+        message = OutboundMessage(text, destination, channel_index, priority, on_sent=on_sent, on_failed=on_failed)
+        with self._condition:
+            pending = self._queues.get(message.key)
+            if pending is None:
+                pending = self._queues[message.key] = deque()
+            pending.append(message)
+            if len(pending) == 1:
+                self._push(message)
+            self.queued += 1
+            self._condition.notify()
+        return message
+
+    def _push(self, message: OutboundMessage) -> None:
+        heapq.heappush(self._heap, (message.priority, message.not_before, next(self._sequence), message.key))
+
+    def _next_ready(self, now: float) -> tuple:
+        """
+        Pop the best queue head that's out of backoff. Returns (message, seconds to wait when there is none).
+        """
+        deferred = list()
+        found = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            message = self._queues[entry[3]][0]
+            if message.not_before <= now:
+                found = message
+                break
+            deferred.append(entry)
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        if found is not None:
+            return found, 0.0
+        if deferred:
+            return None, min(self._queues[entry[3]][0].not_before for entry in deferred) - now
+        return None, None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    if self._paused:
+                        self._condition.wait()
+                        continue
+                    message, wait = self._take_ready(self.clock())
+                    if message is not None:
+                        break
+                    self._condition.wait(timeout=wait)
+            self._send(message)
+
+    def _take_ready(self, now: float) -> tuple:
+        """
+        The next message to send now, with its token taken. Returns (message, None), or (None, seconds to wait) when
+        nothing can go yet. Called with the condition held.
+        """
+        message, wait = self._next_ready(now)
+        if message is None:
+            return None, wait
+        wait = self.bucket.delay(now)
+        if wait <= 0:
+            self.bucket.take(now)
+            return message, None
+        # Out of tokens, put the head back and wait for the bucket
+        self._push(message)
+        return None, wait
+
+    def _send(self, message: OutboundMessage) -> None:
+        message.attempts += 1
+        try:
+            packet = self.send(message.text, destinationId=message.destination, channelIndex=message.channel_index)
+        except Exception as error:
+            self._retry(message, error)
+            return
+        with self._condition:
+            self._pop_head(message)
+            self.sent += 1
+        if message.on_sent is not None:
+            message.on_sent(message, packet)
+
+    def _retry(self, message: OutboundMessage, error: Exception) -> None:
+        with self._condition:
+            if message.attempts >= self.max_attempts:
+                logger.error(f"Giving up on a message to {message.destination} after {message.attempts} attempts: "
+                             f"{error}")
+                self._pop_head(message)
+                self.failed += 1
+                give_up = True
+            else:
+                delay = min(self.backoff * 2 ** (message.attempts - 1), self.max_backoff)
+                # Jitter, so queues that failed together don't retry together
+                message.not_before = self.clock() + delay * random.uniform(0.8, 1.2)
+                self._push(message)
+                self.retries += 1
+                give_up = False
+        if give_up and message.on_failed is not None:
+            message.on_failed(message, error)
+
+    def _pop_head(self, message: OutboundMessage) -> None:
+        pending = self._queues[message.key]
+        pending.popleft()
+        if pending:
+            self._push(pending[0])
+        else:
+            del self._queues[message.key]
+        self._condition.notify()
+
+    def tune(self, channel_utilization: float | None, air_util_tx: float | None) -> float:
+        """
+        Scale the send rate to how busy the channel is, from the local radio's telemetry. Returns the new rate.
+
+        The firmware itself holds back sends above 25% channel utilisation, and many regions cap a node's airtime at
+        10% an hour, so the rate tapers towards a tenth of the base rate as either gets close.
+        """
+        factor = 1.0
+        if channel_utilization is not None:
+            factor = min(factor, 1.0 - channel_utilization / 30.0)
+        if air_util_tx is not None:
+            factor = min(factor, 1.0 - air_util_tx / 10.0)
+        rate = self.base_rate * max(factor, 0.1)
+        with self._condition:
+            self.bucket.set_rate(rate)
+            self._condition.notify()
+        return rate
+
+    def pause(self) -> None:
+        with self._condition:
+            self._paused = True
+
+    def resume(self) -> None:
+        with self._condition:
+            self._paused = False
+            self._condition.notify()
+
+    def close(self) -> None:
+        """
+        Stop the scheduler thread, anything still queued is dropped
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def depth(self) -> int:
+        with self._condition:
+            return sum(len(pending) for pending in self._queues.values())
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "queued": self.queued,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rate": self.bucket.rate,
+            "paused": self._paused,
+        }
@@ -0,0 +1,255 @@
+# Standard library imports
+from array import array
+import bisect
+import datetime
+import math
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from meshChatLib.models import PositionFix
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great circle distance between two points in kilometres
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex(object):
+    """
+    Last known position of every node, bucketed into cell_deg sized grid cells.
+
+    A radius or bounding box query only looks at the nodes in the cells it overlaps, instead of every node.
+    """
+
+    def __init__(self, cell_deg: float = 0.1) -> None:
+        self.cell_deg = cell_deg
+        # (cell row, cell column) -> {radio_id: (lat, lon)}
+        self._cells = dict()
+        # radio_id -> its cell
+        self._where = dict()
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def update(self, radio_id: str, lat: float, lon: float) -> None:
+        cell = self._cell(lat, lon)
+        old = self._where.get(radio_id)
+        if old is not None and old != cell:
+            members = self._cells[old]
+            del members[radio_id]
+            if not members:
+                del self._cells[old]
+        self._cells.setdefault(cell, dict())[radio_id] = (lat, lon)
+        self._where[radio_id] = cell
+
+    def remove(self, radio_id: str) -> None:
+        cell = self._where.pop(radio_id, None)
+        if cell is not None:
+            members = self._cells[cell]
+            del members[radio_id]
+            if not members:
+                del self._cells[cell]
+
+    def in_box(self, south: float, west: float, north: float, east: float) -> list:
+        """
+        (radio_id, lat, lon) of every node inside the box. A box with west > east crosses the antimeridian.
+        """
+        if west > east:
+            return self.in_box(south, west, north, 180.0) + self.in_box(south, -180.0, north, east)
+        low_row, low_col = self._cell(south, west)
+        high_row, high_col = self._cell(north, east)
+        found = list()
+        if (high_row - low_row + 1) * (high_col - low_col + 1) > len(self._cells):
+            # A box bigger than the populated area, walking the occupied cells is cheaper
+            cells = [members for (row, col), members in self._cells.items()
+                     if low_row <= row <= high_row and low_col <= col <= high_col]
+        else:
+            cells = [self._cells[(row, col)] for row in range(low_row, high_row + 1)
+                     for col in range(low_col, high_col + 1) if (row, col) in self._cells]
+        for members in cells:
+            for radio_id, (lat, lon) in members.items():
+                if south <= lat <= north and west <= lon <= east:
+                    found.append((radio_id, lat, lon))
+        return found
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list:
+        """
+        (distance in km, radio_id) of every node within radius_km of lat/lon, nearest first
+        """
+        lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+        south, north = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+        if abs(lat) + lat_span >= 90.0:
+            # Reaches a pole, every longitude is in range
+            west, east = -180.0, 180.0
+        else:
+            lon_span = min(lat_span / math.cos(math.radians(max(abs(south), abs(north)))), 180.0)
+            west = (lon - lon_span + 180.0) % 360.0 - 180.0
+            east = (lon + lon_span + 180.0) % 360.0 - 180.0
+            if lon_span >= 180.0:
+                west, east = -180.0, 180.0
+        nearby = list()
+        for radio_id, node_lat, node_lon in self.in_box(south, west, north, east):
+            distance = haversine_km(lat, lon, node_lat, node_lon)
+            if distance <= radius_km:
+                nearby.append((distance, radio_id))
+        nearby.sort()
+        return nearby
+
+    def get(self, radio_id: str) -> tuple | None:
+        cell = self._where.get(radio_id)
+        return self._cells[cell][radio_id] if cell is not None else None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+
+class Track(object):
+    """
+    Position fixes of one node in time order, in flat arrays
+    """
+    __slots__ = ("times", "lats", "lons", "alts")
+
+    def __init__(self) -> None:
+        self.times = array("d")
+        self.lats = array("d")
+        self.lons = array("d")
+        # NaN when the fix had no altitude
+        self.alts = array("f")
+
+    def add(self, timestamp: float, lat: float, lon: float, alt: float | None) -> None:
+        position = len(self.times)
+        if position and timestamp < self.times[-1]:
+            # Fixes almost always arrive in order, a late one is slotted in where it belongs
+            position = bisect.bisect_right(self.times, timestamp)
+        for values, value in ((self.times, timestamp), (self.lats, lat), (self.lons, lon),
+                              (self.alts, math.nan if alt is None else alt)):
+            values.insert(position, value)
+
+    def trim(self, keep: int) -> None:
+        drop = len(self.times) - keep
+        if drop > 0:
+            for values in (self.times, self.lats, self.lons, self.alts):
+                del values[:drop]
+
+    def between(self, since: float | None = None, until: float | None = None) -> list:
+        """
+        (timestamp, lat, lon, alt) of the fixes in [since, until), oldest first
+        """
+        start = bisect.bisect_left(self.times, since) if since is not None else 0
+        stop = bisect.bisect_left(self.times, until) if until is not None else len(self.times)
+        return [(self.times[i], self.lats[i], self.lons[i], None if math.isnan(self.alts[i]) else self.alts[i])
+                for i in range(start, stop)]
+
+    @property
+    def last(self) -> tuple | None:
+        if not self.times:
+            return None
+        return self.times[-1], self.lats[-1], self.lons[-1]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+
+class PositionStore(object):
+    """
+    Position tracks of every node, with a grid index over where each node was last seen.
+
+    Each node keeps its last `track_length` fixes in memory for playback, older ones stay in the position_fix
+    table. Every new fix is handed to `on_fix` to be persisted.
+    """
+
+    def __init__(self, track_length: int = 5000, cell_deg: float = 0.1, on_fix=None) -> None:
+        self.track_length = track_length
+        self.index = GridIndex(cell_deg)
+        # Called with a PositionFix column dict for every new fix
+        self.on_fix = on_fix
+        self._tracks = dict()
+        self._lock = threading.Lock()
+        # Bumped on every change, so the map can skip redrawing when nothing moved
+        self.version = 0
+        self.fixes = 0
+
+    def add(self, radio_id: str, timestamp: float, lat: float, lon: float, alt: float | None = None,
+            persist: bool = True) -> None:
+        with self._lock:
+            track = self._tracks.get(radio_id)
+            if track is None:
+                track = self._tracks[radio_id] = Track()
+            elif track.last == (timestamp, lat, lon):
+                # The same fix again, a position packet and the node update it causes both report it
+                return
+            track.add(timestamp, lat, lon, alt)
+            # Trim in chunks rather than on every fix
+            if len(track) > self.track_length * 1.25:
+                track.trim(self.track_length)
+            newest = track.last
+            self.index.update(radio_id, newest[1], newest[2])
+            self.version += 1
+            self.fixes += 1
+        if persist and self.on_fix is not None:
+            self.on_fix({"radio_id": radio_id, "latitude": lat, "longitude": lon, "altitude": alt,
+                         "time_fix": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc
+                                                                     ).replace(tzinfo=None)})
+
+    def warm(self, session: Session, since: datetime.datetime | None = None) -> int:
+        """
+        Load persisted fixes, since a naive UTC datetime when given, in one query. Returns the fixes loaded.
+        """
+        query = select(PositionFix.radio_id, PositionFix.time_fix, PositionFix.latitude, PositionFix.longitude,
+                       PositionFix.altitude).order_by(PositionFix.time_fix)
+        if since is not None:
+            query = query.where(PositionFix.time_fix >= since)
+        loaded = 0
+        for row in session.execute(query):
+            timestamp = row.time_fix.replace(tzinfo=datetime.timezone.utc).timestamp()
+            self.add(row.radio_id, timestamp, row.latitude, row.longitude, row.altitude, persist=False)
+            loaded += 1
+        return loaded
+
+    # --- Queries ---
+    def last_position(self, radio_id: str) -> tuple | None:
+        """
+        (lat, lon) of where the node was last seen
+        """
+        with self._lock:
+            return self.index.get(radio_id)
+
+    def last_positions(self) -> dict:
+        with self._lock:
+            return {radio_id: (track.last[1], track.last[2]) for radio_id, track in self._tracks.items()}
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list:
+        with self._lock:
+            return self.index.within(lat, lon, radius_km)
+
+    def near(self, radio_id: str, radius_km: float) -> list:
+        """
+        (distance in km, radio_id) of the other nodes within radius_km of this one, nearest first
+        """
+        position = self.last_position(radio_id)
+        if position is None:
+            return list()
+        return [found for found in self.within(position[0], position[1], radius_km) if found[1] != radio_id]
+
+    def in_box(self, south: float, west: float, north: float, east: float) -> list:
+        with self._lock:
+            return self.index.in_box(south, west, north, east)
+
+    def track(self, radio_id: str, since: float | None = None, until: float | None = None) -> list:
+        """
+        (timestamp, lat, lon, alt) of the node's fixes in memory, oldest first, for playback
+        """
+        with self._lock:
+            track = self._tracks.get(radio_id)
+            return track.between(since, until) if track is not None else list()
+
+    def __len__(self) -> int:
+        return len(self._tracks)
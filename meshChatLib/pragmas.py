@@ -0,0 +1,37 @@
+# SQLite connection settings. Nothing here imports SQLAlchemy, so the command line can load them cheaply.
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class StorageProfile(object):
+    """
+    SQLite settings applied to every connection the engine opens.
+
+    WAL lets the UI read history while the batched writer commits. With WAL, synchronous NORMAL only risks the last
+    few commits on power loss, never corruption, which is the right trade for chat history.
+    """
+
+    def __init__(self, synchronous: str = "NORMAL", cache_size_kib: int = 20000, mmap_size_mib: int = 64,
+                 busy_timeout_ms: int = 5000) -> None:
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_MODES)}, not {synchronous}")
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size_mib = mmap_size_mib
+        self.busy_timeout_ms = busy_timeout_ms
+
+    def pragmas(self, in_memory: bool = False) -> list:
+        pragmas = list()
+        if not in_memory:
+            # An in-memory database can't use WAL, it has no file to log next to
+            pragmas.append(("journal_mode", "WAL"))
+            pragmas.append(("mmap_size", self.mmap_size_mib * 1024 * 1024))
+        pragmas += [
+            ("synchronous", self.synchronous),
+            # Negative sizes are in KiB rather than pages
+            ("cache_size", -self.cache_size_kib),
+            ("temp_store", "MEMORY"),
+            ("busy_timeout", self.busy_timeout_ms),
+        ]
+        return pragmas
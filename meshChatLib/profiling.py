@@ -0,0 +1,171 @@
+# Standard library imports
+import collections
+import cProfile
+import datetime
+import logging
+from pathlib import Path
+import sys
+import threading
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+
+
+class StackSampler(object):
+    """
+    Samples the stack of every thread a few hundred times a second, e.g. the meshtastic reader threads and the writer
+    along with the event loop. Far cheaper than cProfile on a busy mesh.
+
+    Stacks are kept folded, "thread;module:function;...", the format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self._stacks = collections.Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="meshChat-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = list()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stack.reverse()
+                with self._lock:
+                    self._stacks[";".join(stack)] += 1
+
+    def dump(self, path: Path) -> None:
+        """
+        Write the stacks sampled since the last dump and start over
+        """
+        with self._lock:
+            stacks, self._stacks = self._stacks, collections.Counter()
+        with open(path, "w") as folded:
+            for stack, count in stacks.most_common():
+                folded.write(f"{stack} {count}\n")
+
+
+class SessionProfiler(object):
+    """
+    CPU profiles and tracemalloc snapshots of a running meshChat, written to directory for later analysis.
+
+    Each snapshot() writes the CPU profile of the time since the previous one, as a .pstats file for pstats or
+    snakeviz in cprofile mode or folded stacks in sample mode, plus a tracemalloc .snapshot and a .txt with its
+    top allocation sites. Only the newest `keep` sets are kept.
+
+    cProfile only sees the thread that called start(), which is the one running the event loop the packet handlers
+    and Textual run on. snapshot() and stop() have to be called from that thread too.
+    """
+
+    def __init__(self, directory: Path, mode: str = "cprofile", keep: int = 5, frames: int = 1) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode}, pick one of {', '.join(MODES)}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.keep = keep
+        # Stack depth tracemalloc records per allocation. One frame already names the allocation sites, every extra
+        # frame makes each allocation markedly slower.
+        self.frames = frames
+        self._profile = None
+        self._sampler = None
+        self._started_tracemalloc = False
+
+        # --- Counters ---
+        self.snapshots = 0
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracemalloc = True
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler()
+            self._sampler.start()
+        logger.info(f"Profiling ({self.mode}) into {self.directory}")
+
+    def snapshot(self, label: str = "snapshot") -> list:
+        """
+        Write out a profile and memory snapshot, returns the files written
+        """
+        self.snapshots += 1
+        stem = f"meshChat-{datetime.datetime.now():%Y%m%d-%H%M%S}-{self.snapshots:03d}-{label}"
+        written = list()
+        if self._profile is not None:
+            self._profile.disable()
+            path = self.directory / f"{stem}.pstats"
+            self._profile.dump_stats(path)
+            written.append(path)
+            # The next file covers the time from here on
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self._sampler is not None:
+            path = self.directory / f"{stem}.folded"
+            self._sampler.dump(path)
+            written.append(path)
+        if tracemalloc.is_tracing():
+            memory = tracemalloc.take_snapshot()
+            path = self.directory / f"{stem}.snapshot"
+            memory.dump(str(path))
+            written.append(path)
+            path = self.directory / f"{stem}.txt"
+            current, peak = tracemalloc.get_traced_memory()
+            with open(path, "w") as summary:
+                summary.write(f"Traced memory: {current / 1024 / 1024:.1f} MiB now, {peak / 1024 / 1024:.1f} MiB "
+                              f"peak\n\nTop allocation sites:\n")
+                for stat in memory.statistics("lineno")[:25]:
+                    summary.write(f"{stat}\n")
+            written.append(path)
+        self.rotate()
+        return written
+
+    def rotate(self) -> None:
+        """
+        Delete all but the newest `keep` snapshot sets
+        """
+        sets = collections.defaultdict(list)
+        for path in self.directory.glob("meshChat-*-*-*"):
+            sets[path.name.split(".")[0]].append(path)
+        for stem in sorted(sets)[:-self.keep or None]:
+            for path in sets[stem]:
+                path.unlink(missing_ok=True)
+
+    def stop(self) -> list:
+        """
+        Write the last snapshot and stop profiling
+        """
+        written = self.snapshot("exit")
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile = None
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return written
@@ -0,0 +1,252 @@
+# Standard library imports
+import logging
+from pathlib import Path
+import threading
+
+from meshChatLib.outbound import OutboundScheduler
+from meshChatLib.replay import open_interface
+
+logger = logging.getLogger(__name__)
+
+
+class RadioLink(object):
+    """
+    One local radio: its interface, its own send queue, and which node it is once connected.
+
+    Every interface runs its own meshtastic reader thread. Packets from all of them go through the same receive
+    bridge and writer, tagged with the label of the radio they arrived on.
+    """
+
+    def __init__(self, path, label: str | None = None, replay: Path | None = None,
+                 replay_speed: float = 1.0, backoff: float = 1.0, max_backoff: float = 30.0) -> None:
+        self.path = Path(path)
+        self.label = label or self.path.name
+        self.replay = replay
+        self.replay_speed = replay_speed
+        self.interface = None
+        # Each radio has its own channel and airtime budget, so each paces its own sends
+        self.outbound = OutboundScheduler(send=self.send_text)
+
+        # --- Local node, filled in by identify() ---
+        self.radio_id = None
+        self.macaddr = None
+        self.longName = None
+        self.shortName = None
+        self.connected = False
+
+        # --- Reconnecting ---
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # True from a lost connection until the new interface is open
+        self.reconnecting = False
+        # Set by the device watcher when the radio's device node comes back
+        self._device_back = threading.Event()
+        self._closed = threading.Event()
+
+        # --- Counters ---
+        self.packets = 0
+        self.nodes_heard = 0
+        self.reconnects = 0
+        self.connects = 0
+
+    def open(self) -> None:
+        self.attach(open_interface(self.path, replay=self.replay, replay_speed=self.replay_speed))
+
+    def attach(self, interface) -> None:
+        """
+        Use an interface opened elsewhere, e.g. a ReplayInterface
+        """
+        self.interface = interface
+        self.outbound.start()
+
+    def send_text(self, text: str, destinationId="^all", channelIndex: int = 0):
+        """
+        Put a message on air, called from the outbound scheduler's thread
+        """
+        return self.interface.sendText(text, destinationId=destinationId, channelIndex=channelIndex)
+
+    def identify(self) -> dict:
+        """
+        Read who the local radio is, after meshtastic.connection.established. Returns its user dict.
+        """
+        user = self.interface.getMyUser() or {}
+        self.radio_id = user.get("id")
+        self.macaddr = user.get("macaddr")
+        self.longName = user.get("longName")
+        self.shortName = user.get("shortName")
+        self.connected = True
+        self.connects += 1
+        return user
+
+    def lost(self) -> bool:
+        """
+        The connection went away. Holds the send queue and reopens the radio in the background, retrying with
+        exponential backoff. Returns False for a replay, which has nothing to reconnect to.
+        """
+        if self.replay is not None:
+            return False
+        if self.reconnecting:
+            return True
+        self.reconnecting = True
+        self.connected = False
+        self.outbound.pause()
+        threading.Thread(target=self._reconnect, name=f"meshChat-reconnect-{self.label}", daemon=True).start()
+        return True
+
+    def device_added(self) -> None:
+        self._device_back.set()
+
+    def _reconnect(self) -> None:
+        old = self.interface
+        try:
+            # Joins the dead reader thread, which can take a moment
+            old.close()
+        except Exception:
+            logger.debug(f"Closing the lost interface of {self.label} failed", exc_info=True)
+        delay = self.backoff
+        while not self._closed.is_set():
+            if self.path.exists():
+                try:
+                    self.open()
+                except Exception as error:
+                    logger.warning(f"Reconnecting {self.label} failed, next try in {delay:.0f} s: {error}")
+                else:
+                    self.reconnects += 1
+                    self.reconnecting = False
+                    self.outbound.resume()
+                    return
+            # Back off, but go straight away when the device node reappears
+            self._device_back.wait(delay)
+            self._device_back.clear()
+            delay = min(delay * 2, self.max_backoff)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._device_back.set()
+        self.outbound.close()
+        self.connected = False
+
+    def __repr__(self) -> str:
+        return f"RadioLink({self.label!r}, path={str(self.path)!r}, radio_id={self.radio_id!r})"
+
+
+class RadioSet(object):
+    """
+    The local radios of one meshChat process, in the order they were given. The first one is the primary, it's
+    the one sends go out on when no radio is picked.
+    """
+
+    def __init__(self, links: list) -> None:
+        self.links = list()
+        labels = set()
+        for link in links:
+            # Two radios with the same device name in different directories still need telling apart
+            label, suffix = link.label, 2
+            while label in labels:
+                label, suffix = f"{link.label}-{suffix}", suffix + 1
+            link.label = label
+            labels.add(label)
+            self.links.append(link)
+        self._by_label = {link.label: link for link in self.links}
+        # id(interface) -> RadioLink, filled in as the interfaces open. Interfaces replaced by a reconnect stay in,
+        # their late events still have to be recognised, and _interfaces keeps them alive so no id gets reused.
+        self._by_interface = dict()
+        self._interfaces = list()
+
+    @classmethod
+    def from_paths(cls, paths, replay: Path | None = None, replay_speed: float = 1.0):
+        """
+        One link per radio path. A replay stands in for the first radio only.
+        """
+        paths = list(paths)
+        if replay is not None:
+            return cls([RadioLink(paths[0], replay=replay, replay_speed=replay_speed)])
+        return cls([RadioLink(path) for path in paths])
+
+    def open_all(self) -> None:
+        """
+        Open every radio at once, each connect takes a few seconds of config download
+        """
+        errors = dict()
+
+        def open_link(link: RadioLink) -> None:
+            try:
+                link.open()
+            except Exception as error:
+                errors[link.label] = error
+
+        threads = [threading.Thread(target=open_link, args=(link,), name=f"meshChat-open-{link.label}")
+                   for link in self.links]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for label, error in errors.items():
+            logger.error(f"Could not open radio {label}: {error}")
+        if len(errors) == len(self.links):
+            raise next(iter(errors.values()))
+        self.reindex()
+
+    def reindex(self) -> None:
+        for link in self.links:
+            if link.interface is not None and id(link.interface) not in self._by_interface:
+                self._by_interface[id(link.interface)] = link
+                self._interfaces.append(link.interface)
+
+    def for_interface(self, interface) -> RadioLink | None:
+        link = self._by_interface.get(id(interface))
+        if link is None and interface is not None:
+            # Opened after the last reindex, e.g. attached by hand
+            self.reindex()
+            link = self._by_interface.get(id(interface))
+        return link
+
+    def for_radio_id(self, radio_id: str | None) -> RadioLink | None:
+        """
+        The link whose local node is radio_id
+        """
+        for link in self.links:
+            if link.radio_id is not None and link.radio_id == radio_id:
+                return link
+        return None
+
+    def device_added(self, path: str) -> None:
+        """
+        DeviceWatcher callback, wakes the reconnect of the radio at path
+        """
+        for link in self.links:
+            if str(link.path) == path and link.reconnecting:
+                link.device_added()
+
+    @property
+    def device_paths(self) -> list:
+        return [link.path for link in self.links if link.replay is None]
+
+    def get(self, label: str | None) -> RadioLink | None:
+        return self._by_label.get(label)
+
+    @property
+    def primary(self) -> RadioLink:
+        return self.links[0]
+
+    @property
+    def labels(self) -> list:
+        return [link.label for link in self.links]
+
+    @property
+    def local_macaddrs(self) -> set:
+        return {link.macaddr for link in self.links if link.connected and link.macaddr is not None}
+
+    @property
+    def connected(self) -> list:
+        return [link for link in self.links if link.connected]
+
+    def close(self) -> None:
+        for link in self.links:
+            link.close()
+
+    def __iter__(self):
+        return iter(self.links)
+
+    def __len__(self) -> int:
+        return len(self.links)
@@ -0,0 +1,135 @@
+# Standard library imports
+import datetime
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from meshChatLib.models import Node
+from meshChatLib.utils import NodeParser
+
+
+class NodeRegistry(object):
+    """
+    In-process copy of the nodes table, indexed by radio_id, radio_num and macaddr.
+
+    Rows are plain dicts of Node column values. A row is never changed in place, upsert() swaps in a new dict,
+    so a row handed out to the UI thread stays consistent while the reader thread keeps updating.
+    """
+    # Node columns kept in the registry on top of what NodeParser extracts
+    EXTRA_FIELDS = ("local_radio", "last_seen", "rx_radio")
+
+    def __init__(self) -> None:
+        self._by_macaddr = dict()
+        self._by_radio_id = dict()
+        self._by_radio_num = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, session: Session) -> int:
+        """
+        Load every row of the nodes table. Returns the number of nodes loaded.
+        """
+        columns = [getattr(Node, field) for field in NodeParser.FIELDS + self.EXTRA_FIELDS]
+        result = session.execute(select(*columns))
+        with self._lock:
+            for db_row in result:
+                self._index(dict(db_row._mapping))
+        return len(self._by_macaddr)
+
+    def upsert(self, values: dict) -> tuple:
+        """
+        Merge new column values into the node with the same macaddr, or add it. A row holding the same radio_id
+        under another macaddr is dropped, like the writer drops it from the table.
+        Returns the new row and whether anything in it changed.
+        """
+        macaddr = values.get("macaddr")
+        if macaddr is None:
+            return None, False
+        with self._lock:
+            stale = self._by_radio_id.get(values.get("radio_id"))
+            if stale is not None and stale["macaddr"] != macaddr:
+                self._unindex(stale)
+            old = self._by_macaddr.get(macaddr)
+            if old is None:
+                row = {"local_radio": False}
+                row.update(values)
+            else:
+                row = dict(old)
+                row.update(values)
+            changed = row != old
+            # Same as the Node.last_seen onupdate, SQLite's CURRENT_TIMESTAMP is UTC
+            row["last_seen"] = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            if old is not None:
+                self._unindex(old)
+            self._index(row)
+        return row, changed
+
+    def set_local_radios(self, macaddrs) -> list:
+        """
+        Flag the nodes with these macaddrs as local radios and clear the flag on every other node.
+        Returns the macaddrs whose flag changed.
+        """
+        macaddrs = set(macaddrs)
+        changed = list()
+        with self._lock:
+            for row in list(self._by_macaddr.values()):
+                local = row["macaddr"] in macaddrs
+                if row.get("local_radio") != local:
+                    self._unindex(row)
+                    self._index(dict(row, local_radio=local))
+                    changed.append(row["macaddr"])
+        return changed
+
+    def _index(self, row: dict) -> None:
+        self._by_macaddr[row["macaddr"]] = row
+        if row.get("radio_id") is not None:
+            self._by_radio_id[row["radio_id"]] = row
+        if row.get("radio_num") is not None:
+            self._by_radio_num[str(row["radio_num"])] = row
+
+    def _unindex(self, row: dict) -> None:
+        self._by_macaddr.pop(row["macaddr"], None)
+        if self._by_radio_id.get(row.get("radio_id")) is row:
+            del self._by_radio_id[row["radio_id"]]
+        if self._by_radio_num.get(str(row.get("radio_num"))) is row:
+            del self._by_radio_num[str(row["radio_num"])]
+
+    def _lookup(self, index: dict, key) -> dict | None:
+        row = index.get(key)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def get_by_macaddr(self, macaddr: str) -> dict | None:
+        return self._lookup(self._by_macaddr, macaddr)
+
+    def get_by_radio_id(self, radio_id: str) -> dict | None:
+        return self._lookup(self._by_radio_id, radio_id)
+
+    def get_by_radio_num(self, radio_num) -> dict | None:
+        # radio_num is a string column but the radio reports it as an int
+        return self._lookup(self._by_radio_num, str(radio_num))
+
+    def all(self) -> list:
+        with self._lock:
+            return list(self._by_macaddr.values())
+
+    def __len__(self) -> int:
+        return len(self._by_macaddr)
+
+    def __contains__(self, macaddr: str) -> bool:
+        return macaddr in self._by_macaddr
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "nodes": len(self._by_macaddr),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
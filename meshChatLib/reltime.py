@@ -0,0 +1,139 @@
+# Standard library imports
+import heapq
+import time
+
+# "How long ago" labels from epoch seconds. The wording follows arrow's humanize(), which the node sidebar used
+# before, but the label only depends on which bucket the age falls in. Each bucket's text is formatted once, and a
+# label is only worked out again when its age crosses into the next bucket.
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+# Calendar months and years averaged out, close enough at that distance
+MONTH = 2629800
+YEAR = 31557600
+
+# Unit, "one of it" wording and "several of it" wording
+_WORDING = {
+    "now": ("just now", "just now"),
+    "second": ("seconds ago", "seconds ago"),
+    "minute": ("a minute ago", "{} minutes ago"),
+    "hour": ("an hour ago", "{} hours ago"),
+    "day": ("a day ago", "{} days ago"),
+    "week": ("a week ago", "{} weeks ago"),
+    "month": ("a month ago", "{} months ago"),
+    "year": ("a year ago", "{} years ago"),
+}
+
+# (bucket, text) of every bucket seen so far
+_labels = dict()
+
+
+def bucket(age: int) -> tuple:
+    """
+    ((unit, count), age the bucket ends at) for an age in seconds. Ages in the future count as just now.
+    """
+    if age < 10:
+        return ("now", 0), 10
+    if age < MINUTE:
+        return ("second", 0), MINUTE
+    for unit, size, limit in (("minute", MINUTE, HOUR), ("hour", HOUR, DAY), ("day", DAY, WEEK)):
+        if age < limit:
+            count = age // size
+            return (unit, count), (count + 1) * size
+    if age < MONTH:
+        count = min(age // WEEK, 4)
+        return ("week", count), MONTH if count == 4 else (count + 1) * WEEK
+    if age < YEAR:
+        count = age // MONTH
+        return ("month", count), (count + 1) * MONTH
+    count = age // YEAR
+    return ("year", count), (count + 1) * YEAR
+
+
+def label_for(key: tuple) -> str:
+    """
+    Text of a bucket from bucket()
+    """
+    text = _labels.get(key)
+    if text is None:
+        unit, count = key
+        one, several = _WORDING[unit]
+        text = one if count <= 1 else several.format(count)
+        _labels[key] = text
+    return text
+
+
+def humanize(epoch: int, now: float | None = None) -> str:
+    """
+    "5 minutes ago" for epoch seconds
+    """
+    if now is None:
+        now = time.time()
+    return label_for(bucket(max(0, int(now - epoch)))[0])
+
+
+class AgeLabels(object):
+    """
+    Relative time labels for many items, e.g. the last heard time of every node in the sidebar.
+
+    label() hands back the cached text until the item's age moves into the next bucket, expired() tells a single
+    refresh timer which items have moved on since it last asked.
+    """
+
+    def __init__(self, clock=time.time) -> None:
+        self.clock = clock
+        # key -> (epoch, text, epoch second the text runs out at)
+        self._items = dict()
+        # (runs out at, key), entries replaced in _items are skipped when they come up
+        self._expiry = list()
+
+        # --- Counters ---
+        self.hits = 0
+        self.misses = 0
+
+    def label(self, key, epoch: int) -> str:
+        """
+        Text for key last heard at epoch seconds
+        """
+        item = self._items.get(key)
+        if item is not None and item[0] == epoch:
+            self.hits += 1
+            return item[1]
+        self.misses += 1
+        bucket_key, ends_at = bucket(max(0, int(self.clock() - epoch)))
+        text = label_for(bucket_key)
+        expires = epoch + ends_at
+        self._items[key] = (epoch, text, expires)
+        heapq.heappush(self._expiry, (expires, key))
+        if len(self._expiry) > 4 * len(self._items) + 64:
+            self._compact()
+        return text
+
+    def expired(self) -> list:
+        """
+        Keys whose text has run out since the last call. Their next label() works the text out again.
+        """
+        now = self.clock()
+        keys = list()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = heapq.heappop(self._expiry)
+            item = self._items.get(key)
+            if item is None or item[2] != expires:
+                continue
+            # Forget the text so the next label() call buckets the age again
+            del self._items[key]
+            keys.append(key)
+        return keys
+
+    def discard(self, key) -> None:
+        self._items.pop(key, None)
+
+    def _compact(self) -> None:
+        self._expiry = [(item[2], key) for key, item in self._items.items()]
+        heapq.heapify(self._expiry)
+
+    @property
+    def stats(self) -> dict:
+        return {"labels": len(self._items), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,182 @@
+# Standard library imports
+import base64
+import gzip
+import json
+import logging
+from pathlib import Path
+import threading
+from time import monotonic, sleep, time
+
+from pubsub import pub
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+# Only the pubsub topics the client reacts to are recorded, log lines would swamp the journal
+RECORDED_TOPICS = ("meshtastic.receive", "meshtastic.node.updated", "meshtastic.connection.established",
+                   "meshtastic.connection.lost")
+
+
+def _encode(value):
+    """
+    Make a packet dict JSON safe. Bytes are wrapped, protobuf objects (the "raw" copies) are dropped.
+    """
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items() if not hasattr(item, "SerializeToString")}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class PacketRecorder(object):
+    """
+    Write every meshtastic pubsub event to a gzip'd journal, one compact JSON line per event:
+    [milliseconds since start, topic, message data]
+    """
+
+    def __init__(self, journal_path: Path) -> None:
+        self.journal_path = Path(journal_path)
+        self._file = gzip.open(self.journal_path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = monotonic()
+        self.events = 0
+        self._write_line({"meshChatJournal": JOURNAL_VERSION, "started": time()})
+        # Listen on the root topic, pubsub delivers every sub topic to it. Subscribing to the sub topics directly
+        # would define their message spec before the client's own listeners get to.
+        pub.subscribe(self.on_event, "meshtastic")
+
+    def on_event(self, interface, topic=pub.AUTO_TOPIC, **data) -> None:
+        topic_name = topic.getName()
+        if not topic_name.startswith(RECORDED_TOPICS):
+            return
+        if topic_name == "meshtastic.connection.established":
+            # Replay needs to know who the local radio was
+            data["my_user"] = interface.getMyUser()
+        elapsed_ms = int((monotonic() - self._start) * 1000)
+        self._write_line([elapsed_ms, topic_name, _encode(data)])
+        self.events += 1
+
+    def _write_line(self, record) -> None:
+        line = json.dumps(record, separators=(",", ":"), default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self) -> None:
+        pub.unsubscribe(self.on_event, "meshtastic")
+        with self._lock:
+            self._file.close()
+
+
+def read_journal(journal_path: Path):
+    """
+    Yield (milliseconds since start, topic, message data) for every event in a journal
+    """
+    with gzip.open(journal_path, "rt", encoding="utf-8") as journal:
+        header = json.loads(journal.readline())
+        if header.get("meshChatJournal") != JOURNAL_VERSION:
+            raise ValueError(f"{journal_path} is not a version {JOURNAL_VERSION} meshChat journal")
+        for line in journal:
+            elapsed_ms, topic, data = json.loads(line)
+            yield elapsed_ms, topic, _decode(data)
+
+
+class ReplayInterface(object):
+    """
+    Stand-in for SerialInterface that replays a recorded journal into the same meshtastic pubsub topics.
+
+    speed is a multiplier on the recorded timing, 1 plays it back as recorded and 0 as fast as possible.
+    Without a journal the interface just sits idle, which is handy when driving the client's handlers by hand.
+    """
+
+    def __init__(self, journal_path: Path | None, speed: float = 1.0, devPath: str | None = None,
+                 noProto: bool = False) -> None:
+        self.journal_path = Path(journal_path) if journal_path is not None else None
+        self.speed = speed
+        self.devPath = devPath or str(journal_path)
+        self.nodes = dict()
+        self.myInfo = None
+        self.sent = list()
+        self.replayed = 0
+        self._my_user = dict()
+        self._stop = threading.Event()
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="meshChat-replay", daemon=True)
+        if self.journal_path is None:
+            self.finished.set()
+        else:
+            self._thread.start()
+
+    def _run(self) -> None:
+        start = monotonic()
+        try:
+            for elapsed_ms, topic, data in read_journal(self.journal_path):
+                if self._stop.is_set():
+                    break
+                if self.speed:
+                    delay = start + elapsed_ms / 1000 / self.speed - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                self._publish(topic, data)
+        except Exception:
+            logger.exception(f"Replay of {self.journal_path} failed")
+        finally:
+            self.finished.set()
+
+    def _publish(self, topic: str, data: dict) -> None:
+        if topic == "meshtastic.connection.established":
+            self._my_user = data.pop("my_user", None) or self._my_user
+        elif topic == "meshtastic.node.updated":
+            node = data.get("node", {})
+            if node.get("user", {}).get("id"):
+                self.nodes[node["user"]["id"]] = node
+        pub.sendMessage(topic, interface=self, **data)
+        self.replayed += 1
+
+    # --- The parts of the SerialInterface API the client uses ---
+    def getMyUser(self) -> dict:
+        return self._my_user
+
+    def getMyNodeInfo(self) -> dict | None:
+        return self.nodes.get(self._my_user.get("id"))
+
+    def getNode(self, nodeId: str, *args, **kwargs) -> dict | None:
+        return self.nodes.get(nodeId)
+
+    def sendText(self, text: str, destinationId="^all", *args, **kwargs) -> None:
+        # Nothing goes on air, keep what would have been sent so load tests can inspect it
+        self.sent.append((destinationId, text))
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+def open_interface(radio_path: Path | None, replay: Path | None = None, replay_speed: float = 1.0):
+    """
+    Open the radio at radio_path, or a ReplayInterface when a journal to replay is given.
+    A radio_path that is a broker's socket gets a BrokerInterface, sharing the radio meshBroker.py has open.
+    Without a radio_path meshtastic looks for a radio itself.
+    """
+    dev_path = str(radio_path) if radio_path is not None else None
+    if replay is not None:
+        return ReplayInterface(replay, speed=replay_speed, devPath=dev_path)
+    if radio_path is not None and Path(radio_path).is_socket():
+        from meshChatLib.broker import BrokerInterface
+        return BrokerInterface(radio_path)
+    # meshtastic is only imported once a real radio is opened, after the first frame is up
+    from meshtastic.serial_interface import SerialInterface
+    return SerialInterface(devPath=dev_path)
@@ -0,0 +1,204 @@
+# Standard library imports
+from collections import namedtuple
+import datetime
+import re
+import shlex
+from time import perf_counter
+import unicodedata
+
+import arrow
+from sqlalchemy import DateTime, text
+
+# Filters that can be mixed in with the search words, e.g. `from:!a1b2c3d4 since:2024-05-01 "net check"`
+FILTER_KEYS = ("from", "channel", "since", "until")
+# How SQLAlchemy stores DateTime columns in SQLite, so plain string comparisons line up
+DB_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# Runs of letters and digits, the same tokens as the FTS5 unicode61 tokenizer
+_TOKEN = re.compile(r"[^\W_]+")
+
+# A message still queued in the writer, shaped like the rows search() reads from the database
+PendingRow = namedtuple("PendingRow", ("id", "time_rx", "from_radio_id", "to_channel", "msg_text"))
+
+
+def tokens(text: str) -> list:
+    """
+    Lower case words of text without their diacritics, like the FTS index splits it
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    return _TOKEN.findall("".join(char for char in text if not unicodedata.combining(char)))
+
+
+class SearchQuery(object):
+    """
+    A parsed message search.
+
+    Plain words must all appear in the message, "quoted words" must appear as a phrase and a word ending in *
+    matches any word starting with it. from:, channel:, since: and until: narrow the results down further.
+    """
+    __slots__ = ("terms", "sender", "channel", "since", "until")
+
+    def __init__(self, terms=(), sender: str | None = None, channel: str | None = None,
+                 since: datetime.datetime | None = None, until: datetime.datetime | None = None) -> None:
+        self.terms = list(terms)
+        self.sender = sender
+        self.channel = channel
+        self.since = since
+        self.until = until
+
+    @classmethod
+    def parse(cls, query: str) -> "SearchQuery":
+        try:
+            words = shlex.split(query)
+        except ValueError:
+            # An unclosed quote while the user is still typing, search the words without it
+            words = shlex.split(query.replace('"', " "))
+        search = cls()
+        for word in words:
+            key, _, value = word.partition(":")
+            if value and key.lower() in FILTER_KEYS:
+                search._set_filter(key.lower(), value)
+            else:
+                search.terms.append(word)
+        return search
+
+    def _set_filter(self, key: str, value: str) -> None:
+        if key == "from":
+            self.sender = value
+        elif key == "channel":
+            self.channel = value
+        else:
+            # Dates are typed in local time, the database keeps naive UTC
+            try:
+                when = arrow.get(value, tzinfo=arrow.now().tzinfo).to("utc").naive
+            except (arrow.parser.ParserError, ValueError):
+                # Not a date yet, most likely still being typed
+                return
+            if key == "since":
+                self.since = when
+            else:
+                self.until = when
+
+    @property
+    def match(self) -> str:
+        """
+        The FTS5 MATCH expression for the search words
+        """
+        expressions = list()
+        for term in self.terms:
+            prefix = term.endswith("*")
+            term = term.rstrip("*")
+            if not term:
+                continue
+            # Everything is quoted, so punctuation and words like NOT and OR are searched for, not obeyed
+            quoted = '"' + term.replace('"', '""') + '"'
+            expressions.append(quoted + "*" if prefix else quoted)
+        return " ".join(expressions)
+
+    def matches(self, values: dict, sender: str | None = None) -> bool:
+        """
+        Whether a message's column values match, the same as the database query would. For messages that aren't
+        indexed yet. sender replaces the from: filter, once it's resolved to a radio id.
+        """
+        sender = sender or self.sender
+        if sender is not None and values.get("from_radio_id") != sender:
+            return False
+        if self.channel is not None and values.get("to_channel") != self.channel:
+            return False
+        time_rx = values.get("time_rx")
+        if self.since is not None and (time_rx is None or time_rx < self.since):
+            return False
+        if self.until is not None and (time_rx is None or time_rx >= self.until):
+            return False
+        words = tokens(values.get("msg_text") or "")
+        for term in self.terms:
+            prefix = term.endswith("*")
+            phrase = tokens(term.rstrip("*"))
+            if phrase and not self._has_phrase(words, phrase, prefix):
+                return False
+        return True
+
+    @staticmethod
+    def _has_phrase(words: list, phrase: list, prefix: bool) -> bool:
+        last = len(phrase) - 1
+        for start in range(len(words) - last):
+            if words[start:start + last] != phrase[:last]:
+                continue
+            word = words[start + last]
+            if word == phrase[last] or (prefix and word.startswith(phrase[last])):
+                return True
+        return False
+
+    def __bool__(self) -> bool:
+        return bool(self.match) or any((self.sender, self.channel, self.since, self.until))
+
+
+class HistorySearch(object):
+    """
+    Searches channel_history through its FTS5 index, newest matches first.
+
+    Results are walked in rowid order straight off the index, so a common word in millions of messages doesn't have
+    to sort every match before the newest `limit` come back.
+    """
+
+    def __init__(self, engine, resolve_sender=None) -> None:
+        self.engine = engine
+        # Turns a from: filter that isn't a radio id, like a long name, into one
+        self.resolve_sender = resolve_sender
+        self.last_search_ms = 0.0
+
+    def search(self, query: SearchQuery | str, limit: int = 200, pending=()) -> list:
+        """
+        Returns rows with id, time_rx, from_radio_id, to_channel and msg_text. pending are the column values of
+        messages the writer hasn't committed yet, the ones that match are merged in as PendingRows.
+        """
+        if isinstance(query, str):
+            query = SearchQuery.parse(query)
+        if not query:
+            return list()
+
+        where = list()
+        params = {"limit": limit}
+        if query.match:
+            source = "channel_history_fts JOIN channel_history ON channel_history.id = channel_history_fts.rowid"
+            where.append("channel_history_fts MATCH :match")
+            params["match"] = query.match
+            order = "channel_history_fts.rowid DESC"
+        else:
+            # Filters only, the channel and sender indexes do the work
+            source = "channel_history"
+            order = "channel_history.time_rx DESC"
+        sender = query.sender
+        if sender is not None:
+            if self.resolve_sender is not None and not sender.startswith("!"):
+                sender = self.resolve_sender(sender) or sender
+            where.append("channel_history.from_radio_id = :sender")
+            params["sender"] = sender
+        if query.channel is not None:
+            where.append("channel_history.to_channel = :channel")
+            params["channel"] = query.channel
+        if query.since is not None:
+            where.append("channel_history.time_rx >= :since")
+            params["since"] = query.since.strftime(DB_TIME_FORMAT)
+        if query.until is not None:
+            where.append("channel_history.time_rx < :until")
+            params["until"] = query.until.strftime(DB_TIME_FORMAT)
+
+        statement = text(f"SELECT channel_history.id, channel_history.time_rx, channel_history.from_radio_id, "
+                         f"channel_history.to_channel, channel_history.msg_text FROM {source} "
+                         f"WHERE {' AND '.join(where) or '1'} ORDER BY {order} LIMIT :limit"
+                         ).columns(time_rx=DateTime)
+        start = perf_counter()
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement, params).all()
+        # Checked in memory rather than flushed, which would commit on the UI thread. A batch being committed right
+        # now is in both, it's only kept once.
+        stored = {(row.time_rx, row.from_radio_id, row.msg_text) for row in rows}
+        unindexed = [PendingRow(None, values.get("time_rx"), values.get("from_radio_id"), values.get("to_channel"),
+                                values.get("msg_text"))
+                     for values in pending if query.matches(values, sender=sender)]
+        unindexed = [row for row in unindexed if (row.time_rx, row.from_radio_id, row.msg_text) not in stored]
+        if unindexed:
+            rows = sorted(rows + unindexed, key=lambda row: row.time_rx or datetime.datetime.min, reverse=True)
+            rows = rows[:limit]
+        self.last_search_ms = (perf_counter() - start) * 1000
+        return rows
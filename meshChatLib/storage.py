@@ -0,0 +1,196 @@
+# Standard library imports
+import logging
+from pathlib import Path
+
+from sqlalchemy import Integer, create_engine, event, inspect
+from sqlalchemy.pool import StaticPool
+
+from meshChatLib.models import Base, ChannelHistory, Node
+# Kept apart so the CLI can offer the choices without loading SQLAlchemy
+from meshChatLib.pragmas import SYNCHRONOUS_MODES, StorageProfile  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+def open_engine(database_path: Path | None, profile: StorageProfile | None = None):
+    """
+    Create the engine for the database at database_path, in memory when it's None, and bring its schema up to date
+    """
+    profile = profile or StorageProfile()
+    in_memory = database_path is None
+    if in_memory:
+        # The batched writer commits from its own thread, so every connection has to share the one database
+        engine = create_engine("sqlite+pysqlite:///:memory:", echo=False,
+                               connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(f"sqlite:///{database_path}", echo=False)
+    pragmas = profile.pragmas(in_memory=in_memory)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if not in_memory:
+            # Let SQLAlchemy decide when transactions start, pysqlite on its own runs DDL outside of them and
+            # the migrations have to be all or nothing. The in-memory database shares one connection between
+            # threads and is always created fresh, so it keeps pysqlite's behaviour.
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    if not in_memory:
+        @event.listens_for(engine, "begin")
+        def on_begin(connection):
+            connection.exec_driver_sql("BEGIN")
+
+    migrate(engine)
+    return engine
+
+
+def open_readonly(database_path: Path):
+    """
+    Engine on an existing database that can't write to it, for exports and attached TUIs. It's never migrated and
+    never locks out the process that writes to it.
+    """
+    database_path = Path(database_path)
+    if not database_path.exists():
+        raise FileNotFoundError(f"No database at {database_path}")
+    return create_engine(f"sqlite:///file:{database_path}?mode=ro&uri=true", echo=False)
+
+
+# --- Schema migrations ---
+# MIGRATIONS[n] takes a database from user_version n to n + 1. Missing tables are created straight from the models
+# before any migration runs, so a migration must also cope with the models already being ahead of the
+# database. Anything the models can't describe, like the full-text index, only comes from a migration.
+
+def _columns(connection, table: str) -> set:
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+
+def _has_table(connection, table: str) -> bool:
+    return inspect(connection).has_table(table)
+
+
+def _fix_channel_history_foreign_key(connection) -> None:
+    # channel_history used to point its foreign key at a "node" table that never existed, and SQLite can't
+    # change a foreign key in place. Rebuild the table and copy the messages across.
+    if not _has_table(connection, "channel_history"):
+        return
+    foreign_tables = {key["referred_table"] for key in inspect(connection).get_foreign_keys("channel_history")}
+    if "node" not in foreign_tables:
+        return
+    old_columns = _columns(connection, "channel_history")
+    connection.exec_driver_sql("ALTER TABLE channel_history RENAME TO channel_history_old")
+    ChannelHistory.__table__.create(connection)
+    shared = ", ".join(column.name for column in ChannelHistory.__table__.columns if column.name in old_columns)
+    connection.exec_driver_sql(f"INSERT INTO channel_history ({shared}) SELECT {shared} FROM channel_history_old")
+    connection.exec_driver_sql("DROP TABLE channel_history_old")
+
+
+def _create_indexes(connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        if not _has_table(connection, table.name):
+            continue
+        existing = _columns(connection, table.name)
+        for index in table.indexes:
+            # Indexes on columns a later migration adds are created by that migration
+            if all(column.name in existing for column in index.columns):
+                index.create(connection, checkfirst=True)
+
+
+def _create_message_search(connection) -> None:
+    # External content FTS5 index over channel_history.msg_text, the text itself is only stored once.
+    # The prefix indexes make 2 and 3 letter prefix queries as cheap as whole words.
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS channel_history_fts USING fts5("
+        "msg_text, content='channel_history', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    # Triggers keep the index in step with every insert, however the row gets written
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS channel_history_fts_insert AFTER INSERT ON channel_history BEGIN "
+        "INSERT INTO channel_history_fts(rowid, msg_text) VALUES (new.id, new.msg_text); END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS channel_history_fts_delete AFTER DELETE ON channel_history BEGIN "
+        "INSERT INTO channel_history_fts(channel_history_fts, rowid, msg_text) "
+        "VALUES ('delete', old.id, old.msg_text); END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS channel_history_fts_update AFTER UPDATE OF msg_text ON channel_history BEGIN "
+        "INSERT INTO channel_history_fts(channel_history_fts, rowid, msg_text) "
+        "VALUES ('delete', old.id, old.msg_text); "
+        "INSERT INTO channel_history_fts(rowid, msg_text) VALUES (new.id, new.msg_text); END")
+    # Index the history that's already there
+    connection.exec_driver_sql("INSERT INTO channel_history_fts(channel_history_fts) VALUES ('rebuild')")
+
+
+def _add_packet_id(connection) -> None:
+    # The packet id of each message, for duplicate suppression
+    if "packet_id" not in _columns(connection, "channel_history"):
+        connection.exec_driver_sql("ALTER TABLE channel_history ADD COLUMN packet_id INTEGER")
+    _create_indexes(connection)
+
+
+def _add_rx_radio(connection) -> None:
+    # Which local radio each message and node came in on, with several radios on one database
+    for table in ("nodes", "channel_history"):
+        if "rx_radio" not in _columns(connection, table):
+            connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN rx_radio VARCHAR(50)")
+    _create_indexes(connection)
+
+
+def _last_heard_integer(connection) -> None:
+    # lastHeard used to be a string column holding epoch seconds. SQLite can't change a column's type in place, so
+    # rebuild the nodes table with lastHeard as an integer and copy the nodes across.
+    if not _has_table(connection, "nodes"):
+        return
+    old_columns = {column["name"]: column for column in inspect(connection).get_columns("nodes")}
+    if "lastHeard" not in old_columns or isinstance(old_columns["lastHeard"]["type"], Integer):
+        return
+    for index in inspect(connection).get_indexes("nodes"):
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index['name']}")
+    # Leave channel_history's foreign key pointing at "nodes" rather than following the rename
+    connection.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+    try:
+        connection.exec_driver_sql("ALTER TABLE nodes RENAME TO nodes_old")
+    finally:
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+    Node.__table__.create(connection)
+    shared = [column.name for column in Node.__table__.columns if column.name in old_columns]
+    copied = ", ".join("CAST(NULLIF(lastHeard, '') AS INTEGER)" if name == "lastHeard" else name for name in shared)
+    connection.exec_driver_sql(f"INSERT INTO nodes ({', '.join(shared)}) SELECT {copied} FROM nodes_old")
+    connection.exec_driver_sql("DROP TABLE nodes_old")
+
+
+MIGRATIONS = [
+    _fix_channel_history_foreign_key,
+    _create_indexes,
+    _create_message_search,
+    _add_packet_id,
+    _add_rx_radio,
+    _last_heard_integer,
+]
+
+
+def schema_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine) -> int:
+    """
+    Upgrade the database in place to the latest schema version, one transaction per migration.
+    Returns the number of migrations applied.
+    """
+    latest = len(MIGRATIONS)
+    with engine.begin() as connection:
+        version = schema_version(connection)
+        if version > latest:
+            raise RuntimeError(f"Database schema version {version} is newer than this meshChat ({latest})")
+        # Every table of a new database, and tables added to the models since an old one was made. Tables that
+        # already exist are left for the migrations.
+        Base.metadata.create_all(connection)
+
+    for number in range(version, latest):
+        with engine.begin() as connection:
+            MIGRATIONS[number](connection)
+            connection.exec_driver_sql(f"PRAGMA user_version={number + 1}")
+        logger.info(f"Migrated database to schema version {number + 1}")
+    return latest - version
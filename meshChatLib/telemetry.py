@@ -0,0 +1,271 @@
+# Standard library imports
+from array import array
+from collections import deque
+import datetime
+import math
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from meshChatLib.models import TelemetryRollup
+
+# Device metrics kept per node, the same ones Node keeps the latest value of
+METRICS = ("batteryLevel", "voltage", "channelUtilization", "airUtilTx")
+# Rollup bucket sizes in seconds: per minute and per hour
+RESOLUTIONS = (60, 3600)
+NAN = float("nan")
+
+
+class RingBuffer(object):
+    """
+    The last `capacity` samples of one node, in flat arrays rather than a list of objects.
+    Missing metrics are stored as NaN.
+    """
+    __slots__ = ("capacity", "times", "values", "head", "count")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        # Single precision is plenty for battery percentages and utilisation
+        self.values = {metric: array("f", bytes(4 * capacity)) for metric in METRICS}
+        # Next slot to write
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: float, sample: dict) -> None:
+        self.times[self.head] = timestamp
+        for metric, values in self.values.items():
+            value = sample.get(metric)
+            values[self.head] = NAN if value is None else value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _order(self) -> range:
+        start = (self.head - self.count) % self.capacity
+        return range(start, start + self.count)
+
+    def series(self, metric: str) -> list:
+        """
+        (timestamp, value) pairs for one metric, oldest first, skipping samples that didn't have it
+        """
+        times = self.times
+        values = self.values[metric]
+        capacity = self.capacity
+        series = list()
+        for position in self._order():
+            value = values[position % capacity]
+            if not math.isnan(value):
+                series.append((times[position % capacity], value))
+        return series
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class Bucket(object):
+    """
+    min/max/sum/count of one metric over one rollup period
+    """
+    __slots__ = ("start", "min", "max", "total", "count")
+
+    def __init__(self, start: int, value: float) -> None:
+        self.start = start
+        self.min = value
+        self.max = value
+        self.total = value
+        self.count = 1
+
+    def add(self, value: float) -> None:
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.total += value
+        self.count += 1
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count
+
+
+class NodeTelemetry(object):
+    """
+    Recent samples and rolled up history of one node
+    """
+    __slots__ = ("recent", "open_buckets", "closed_buckets", "last_sample")
+
+    def __init__(self, capacity: int) -> None:
+        self.recent = RingBuffer(capacity)
+        # (resolution, metric) -> the Bucket still collecting samples
+        self.open_buckets = dict()
+        # (resolution, metric) -> finished Buckets, oldest first
+        self.closed_buckets = dict()
+        self.last_sample = 0.0
+
+    def closed(self, resolution: int, metric: str, history: int) -> deque:
+        key = (resolution, metric)
+        buckets = self.closed_buckets.get(key)
+        if buckets is None:
+            buckets = self.closed_buckets[key] = deque(maxlen=history)
+        return buckets
+
+
+class TelemetryStore(object):
+    """
+    Per node telemetry history, all in memory.
+
+    Every sample goes into the node's ring buffer and into the open per-minute and per-hour buckets. When a sample
+    lands past a bucket's period the bucket is closed, kept for trends and handed to `on_rollup` to be persisted,
+    so the database only ever sees one row per node, metric and period.
+    """
+
+    def __init__(self, capacity: int = 256, history: int = 168, resolutions=RESOLUTIONS, on_rollup=None) -> None:
+        self.capacity = capacity
+        # Closed buckets kept per node, metric and resolution, a week of hours by default
+        self.history = history
+        self.resolutions = tuple(resolutions)
+        # Called with a TelemetryRollup column dict for every closed bucket
+        self.on_rollup = on_rollup
+        self._nodes = dict()
+        self._lock = threading.Lock()
+        # Bumped on every change, so the UI can skip redrawing when nothing new arrived
+        self.version = 0
+        self.samples = 0
+
+    def _node(self, radio_id: str) -> NodeTelemetry:
+        node = self._nodes.get(radio_id)
+        if node is None:
+            node = self._nodes[radio_id] = NodeTelemetry(self.capacity)
+        return node
+
+    def add(self, radio_id: str, timestamp: float, sample: dict) -> None:
+        """
+        Record one telemetry sample, timestamp in epoch seconds
+        """
+        closed = list()
+        with self._lock:
+            node = self._node(radio_id)
+            node.recent.append(timestamp, sample)
+            node.last_sample = max(node.last_sample, timestamp)
+            for metric in METRICS:
+                value = sample.get(metric)
+                if value is None:
+                    continue
+                for resolution in self.resolutions:
+                    start = int(timestamp) // resolution * resolution
+                    key = (resolution, metric)
+                    bucket = node.open_buckets.get(key)
+                    if bucket is None or start > bucket.start:
+                        if bucket is not None:
+                            node.closed(resolution, metric, self.history).append(bucket)
+                            closed.append((radio_id, resolution, metric, bucket))
+                        node.open_buckets[key] = Bucket(start, value)
+                    elif start == bucket.start:
+                        bucket.add(value)
+                    # A sample older than the open bucket is already covered by the rollups, only the ring keeps it
+            self.version += 1
+            self.samples += 1
+        self._emit(closed)
+
+    def close_buckets(self) -> int:
+        """
+        Close every open bucket, on exit, so the partial periods get persisted too. Returns how many were closed.
+        """
+        closed = list()
+        with self._lock:
+            for radio_id, node in self._nodes.items():
+                for (resolution, metric), bucket in node.open_buckets.items():
+                    node.closed(resolution, metric, self.history).append(bucket)
+                    closed.append((radio_id, resolution, metric, bucket))
+                node.open_buckets.clear()
+            self.version += 1
+        self._emit(closed)
+        return len(closed)
+
+    def _emit(self, closed: list) -> None:
+        if self.on_rollup is None:
+            return
+        for radio_id, resolution, metric, bucket in closed:
+            self.on_rollup({"radio_id": radio_id, "metric": metric, "resolution": resolution,
+                            "bucket_start": datetime.datetime.fromtimestamp(bucket.start, datetime.timezone.utc
+                                                                            ).replace(tzinfo=None),
+                            "min_value": bucket.min, "max_value": bucket.max, "avg_value": bucket.avg,
+                            "samples": bucket.count})
+
+    def warm(self, session: Session, resolution: int = 3600) -> int:
+        """
+        Load the persisted rollups of one resolution back into memory, in a single query. Returns the rows loaded.
+        """
+        result = session.execute(select(TelemetryRollup)
+                                 .where(TelemetryRollup.resolution == resolution)
+                                 .order_by(TelemetryRollup.bucket_start))
+        loaded = 0
+        with self._lock:
+            for rollup in result.scalars():
+                start = int(rollup.bucket_start.replace(tzinfo=datetime.timezone.utc).timestamp())
+                bucket = Bucket(start, rollup.min_value)
+                bucket.max = rollup.max_value
+                bucket.total = rollup.avg_value * rollup.samples
+                bucket.count = rollup.samples
+                node = self._node(rollup.radio_id)
+                buckets = node.closed(resolution, rollup.metric, self.history)
+                if buckets and buckets[-1].start == start:
+                    # A period persisted twice across restarts, merge the halves
+                    merged = buckets[-1]
+                    merged.min = min(merged.min, bucket.min)
+                    merged.max = max(merged.max, bucket.max)
+                    merged.total += bucket.total
+                    merged.count += bucket.count
+                else:
+                    buckets.append(bucket)
+                node.last_sample = max(node.last_sample, start)
+                loaded += 1
+            self.version += 1
+        return loaded
+
+    # --- Reading, for the UI ---
+    def recent(self, radio_id: str, metric: str) -> list:
+        """
+        (timestamp, value) of the recent full resolution samples, oldest first
+        """
+        with self._lock:
+            node = self._nodes.get(radio_id)
+            return node.recent.series(metric) if node is not None else list()
+
+    def trend(self, radio_id: str, metric: str, resolution: int = 3600) -> list:
+        """
+        Buckets of one resolution, oldest first, including the one still open
+        """
+        with self._lock:
+            node = self._nodes.get(radio_id)
+            if node is None:
+                return list()
+            buckets = list(node.closed_buckets.get((resolution, metric), ()))
+            current = node.open_buckets.get((resolution, metric))
+            if current is None:
+                return buckets
+            if buckets and buckets[-1].start == current.start:
+                # The period was partly persisted before a restart and warmed back in, show it as one
+                merged = Bucket(current.start, min(buckets[-1].min, current.min))
+                merged.max = max(buckets[-1].max, current.max)
+                merged.total = buckets[-1].total + current.total
+                merged.count = buckets[-1].count + current.count
+                buckets[-1] = merged
+            else:
+                buckets.append(current)
+            return buckets
+
+    def radio_ids(self) -> list:
+        """
+        Nodes with telemetry, most recently heard first
+        """
+        with self._lock:
+            return sorted(self._nodes, key=lambda radio_id: self._nodes[radio_id].last_sample, reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, radio_id: str) -> bool:
+        return radio_id in self._nodes
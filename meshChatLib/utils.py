@@ -1,15 +1,16 @@
 # Standard library imports
 import datetime
-from pathlib import Path
-from pprint import pprint
-import sys
-from time import strftime, localtime, sleep
 
-import meshtastic
-from meshtastic.serial_interface import SerialInterface
-from pubsub import pub
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, Boolean, update, insert, select
-from sqlalchemy.orm import Session
+
+def sender_id(packet: dict) -> str | None:
+    """
+    The sender as a radio id. fromId is missing for nodes the radio doesn't know yet, so it's rebuilt from the node
+    number the same way meshtastic makes it.
+    """
+    num = packet.get("from")
+    if num is not None:
+        return f"!{num:08x}"
+    return packet.get("fromId")
 
 
 class Utils(object):
@@ -23,101 +24,101 @@ class Utils(object):
         msg_string = f"{now_fmt.ljust(20, ' ')}"
         return msg_string
 
+    @staticmethod
+    def time_prefix(when: datetime.datetime) -> str:
+        """
+        Same as status_time_prefix, for a message received at `when`. Naive datetimes are taken as UTC, which is how
+        the database stores them.
+        """
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        when_fmt = when.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+        return f"{when_fmt.ljust(20, ' ')}"
+
 
 class Message(object):
+    """
+    Base class for all messages.
+    Every field is pulled out of the packet dict once, in __init__, and the dict itself isn't kept.
+    """
+    __slots__ = ("rx_time", "hopLimit", "priority", "msg_id", "portnum", "payload", "from_radio_id", "to_radio_id",
+                 "from_radio_num", "to_radio_num", "channel")
 
     def __init__(self, raw_msg: dict):
-        """Base class for all messages"""
-        self._raw_msg = raw_msg
-
-    @property
-    def rx_time(self):
-        return self._raw_msg.get("rx_time")
-
-    @property
-    def hopLimit(self):
-        return self._raw_msg.get("hopLimit")
-
-    @property
-    def priority(self):
-        return self._raw_msg.get("priority")
-
-    @property
-    def msg_id(self):
-        return self._raw_msg.get("id")
-
-    @property
-    def portnum(self):
-        return self._raw_msg.get("decoded").get("portnum")
-
-    @property
-    def payload(self):
-        return self._raw_msg.get("decoded").get("payload")
-
-    @property
-    def from_radio_id(self):
-        return self._raw_msg.get("fromId")
-
-    @property
-    def to_radio_id(self):
-        return self._raw_msg.get("toId")
-
-    @property
-    def from_radio_num(self):
-        return self._raw_msg.get("from")
-
-    @property
-    def to_radio_num(self):
-        return self._raw_msg.get("to_radio_num")
+        decoded = raw_msg.get("decoded") or {}
+        self.rx_time = raw_msg.get("rxTime")
+        self.hopLimit = raw_msg.get("hopLimit")
+        self.priority = raw_msg.get("priority")
+        self.msg_id = raw_msg.get("id")
+        self.portnum = decoded.get("portnum")
+        self.payload = decoded.get("payload")
+        # The same id the deduper keys on, so stored messages line up with it on a restart
+        self.from_radio_id = sender_id(raw_msg)
+        self.to_radio_id = raw_msg.get("toId")
+        self.from_radio_num = raw_msg.get("from")
+        self.to_radio_num = raw_msg.get("to")
+        self.channel = raw_msg.get("channel", 0)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._all_slots())
+        return f"{type(self).__name__}({fields})"
+
+    @classmethod
+    def _all_slots(cls) -> list:
+        names = list()
+        for klass in reversed(cls.__mro__):
+            names.extend(getattr(klass, "__slots__", ()))
+        return names
 
 
 class AdminMsg(Message):
+    __slots__ = ("admin",)
 
     def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
+        super().__init__(raw_msg)
+        self.admin = (raw_msg.get("decoded") or {}).get("admin")
 
 
 class TextMsg(Message):
+    __slots__ = ("rxSnr", "rxTime", "rxRssi", "text")
 
     def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
-
-    @property
-    def rxSnr(self):
-        return self._raw_msg.get("rxSnr")
-
-    @property
-    def rxTime(self):
-        return self._raw_msg.get("rxTime")
-
-    @property
-    def rxRssi(self):
-        return self._raw_msg.get("rxRssi")
-
-    @property
-    def text(self):
-        return self._raw_msg.get("decoded").get("text")
+        super().__init__(raw_msg)
+        self.rxSnr = raw_msg.get("rxSnr")
+        self.rxTime = raw_msg.get("rxTime")
+        self.rxRssi = raw_msg.get("rxRssi")
+        self.text = (raw_msg.get("decoded") or {}).get("text")
 
 
 class TelemetryMsg(Message):
-    def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
+    __slots__ = ("timestamp", "batteryLevel", "voltage", "channelUtilization", "airUtilTx")
 
-    @property
-    def from_radio_num(self):
-        return self._raw_msg.get("from")
+    def __init__(self, raw_msg: dict):
+        super().__init__(raw_msg)
+        telemetry = (raw_msg.get("decoded") or {}).get("telemetry") or {}
+        device_metrics = telemetry.get("deviceMetrics") or {}
+        self.timestamp = telemetry.get("time")
+        self.batteryLevel = device_metrics.get("batteryLevel")
+        self.voltage = device_metrics.get("voltage")
+        self.channelUtilization = device_metrics.get("channelUtilization")
+        self.airUtilTx = device_metrics.get("airUtilTx")
 
-    @property
-    def to_radio_num(self):
-        return self._raw_msg.get("to_radio_num")
 
-    @property
-    def airUtilTx(self):
-        return self._raw_msg.get("decoded").get("telemetry").get("deviceMetrics").get("airUtilTx")
+class PositionMsg(Message):
+    __slots__ = ("latitude", "longitude", "altitude", "time")
 
-    @property
-    def timestamp(self):
-        return self._raw_msg.get("decoded").get("telemetry").get("time")
+    def __init__(self, raw_msg: dict):
+        super().__init__(raw_msg)
+        position = (raw_msg.get("decoded") or {}).get("position") or {}
+        self.latitude = position.get("latitude")
+        self.longitude = position.get("longitude")
+        # Older firmware only sends the integer form, in units of 1e-7 degrees
+        if self.latitude is None and position.get("latitudeI") is not None:
+            self.latitude = position["latitudeI"] * 1e-7
+        if self.longitude is None and position.get("longitudeI") is not None:
+            self.longitude = position["longitudeI"] * 1e-7
+        self.altitude = position.get("altitude")
+        self.time = position.get("time")
 
 
 class Channel(object):
@@ -131,233 +132,57 @@ class DirectMessage(object):
         self._txt_msg = txt_msg
 
 class Routing(Message):
+    __slots__ = ("errorReason",)
 
     def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
-
-    @property
-    def errorReason(self) -> None:
-        if self._raw_msg.get("decoded") and self._raw_msg.get("decoded").get("routing") and self._raw_msg.get("decoded").get("routing").get("errorReason"):
-            return self._raw_msg.get("decoded").get("routing").get("errorReason")
-        else:
-            return None
+        super().__init__(raw_msg)
+        routing = (raw_msg.get("decoded") or {}).get("routing") or {}
+        self.errorReason = routing.get("errorReason")
 
 class NodeParser(object):
-    def __init__(self, node):
-        self.node = node
+    """
+    A node from meshtastic.node.updated, decoded once into the Node table columns
+    """
+    # Attributes that map one to one onto columns of the Node table
+    FIELDS = ("radio_num", "radio_id", "longName", "shortName", "macaddr", "hwModel", "role", "snr", "lastHeard",
+              "batteryLevel", "voltage", "channelUtilization", "airUtilTx", "latitudeI", "longitudeI", "altitude",
+              "time", "latitude", "longitude")
+    __slots__ = FIELDS
 
-    @property
-    def radio_num(self):
-        if self.node.get("num"):
-            return self.node.get("num")
-        else:
-            return None
-    @property
-    def radio_id(self):
-        if self.node.get("user") and self.node.get("user").get("id"):
-            return self.node.get("user").get("id")
-        else:
-            return None
-    @property
-    def longName(self):
-        if self.node.get("user") and self.node.get("user").get("longName"):
-            return self.node.get("user").get("longName")
-        else:
-            return None
-    @property
-    def shortName(self):
-        if self.node.get("user") and self.node.get("user").get("shortName"):
-            return self.node.get("user").get("shortName")
-        else:
-            return None
-    @property
-    def macaddr(self):
-        if self.node.get("user") and self.node.get("user").get("macaddr"):
-            return self.node.get("user").get("macaddr")
-        else:
-            return None
-    @property
-    def hwModel(self):
-        if self.node.get("user") and self.node.get("user").get("hwModel"):
-            return self.node.get("user").get("hwModel")
-        else:
-            return None
-    @property
-    def role(self):
-        if self.node.get("user") and self.node.get("user").get("role"):
-            return self.node.get("user").get("role")
-        else:
-            return None
-    @property
-    def snr(self):
-        if self.node.get("snr"):
-            self.node.get("snr")
-        else:
-            return None
-    @property
-    def lastHeard(self):
-        if self.node.get("lastHeard"):
-            self.node.get("lastHeard")
-        else:
-            return None
-    @property
-    def batteryLevel(self):
-        if self.node.get("deviceMetrics") and self.node.get("deviceMetrics").get("batteryLevel"):
-            self.node.get("deviceMetrics").get("batteryLevel")
-        else:
-            return None
-    @property
-    def voltage(self):
-        if self.node.get("deviceMetrics") and self.node.get("deviceMetrics").get("voltage"):
-            self.node.get("deviceMetrics").get("voltage")
-        else:
-            return None
-
-    @property
-    def channelUtilization(self):
-        if self.node.get("deviceMetrics") and self.node.get("deviceMetrics").get("channelUtilization"):
-            self.node.get("deviceMetrics").get("channelUtilization")
-        else:
-            return None
-    @property
-    def airUtilTx(self):
-        if self.node.get("deviceMetrics") and self.node.get("deviceMetrics").get("airUtilTx"):
-            return self.node.get("deviceMetrics").get("airUtilTx")
-        else:
-            return None
-    @property
-    def latitudeI(self):
-        if self.node.get("position") and self.node.get("position").get("latitudeI"):
-            return self.node.get("position").get("latitudeI")
-        else:
-            return None
-    @property
-    def longitudeI(self):
-        if self.node.get("position") and self.node.get("position").get("longitudeI"):
-            return self.node.get("position").get("longitudeI")
-        else:
-            return None
-
-    @property
-    def altitude(self):
-        if self.node.get("position") and self.node.get("position").get("altitude"):
-            return self.node.get("position").get("altitude")
-        else:
-            return None
-    @property
-    def time(self):
-        if self.node.get("position") and self.node.get("position").get("time"):
-            return self.node.get("position").get("time")
-        else:
-            return None
-    @property
-    def latitude(self):
-        if self.node.get("position") and self.node.get("position").get("latitude"):
-            return self.node.get("position").get("latitude")
-        else:
-            return None
-    @property
-    def longitude(self):
-        if self.node.get("position") and self.node.get("position").get("longitude"):
-            return self.node.get("position").get("longitude")
-        else:
-            return None
-    # radio_num
-    # user_id
-    # longName
-    # shortName
-    # macaddr
-    # hwModel
-    # role
-    # snr
-    # lastHeard
-    # batteryLevel
-    # voltage
-    # channelUtilization
-    # airUtilTx
-    # latitudeI
-    # longitudeI
-    # altitude
-    # time
-    # latitude
-    # longitude
-
-class MeshtasticUtils(object):
-
-    def __init__(self, radio_path: Path, db_session: Session, node_table) -> SerialInterface:
-        self.radio_path = radio_path
-        self.Node = node_table
-        self.session = db_session
-
-        if not radio_path.exists():
-            self.radio_disconnect_polling()
-        self.interface = self.startup
-
-    @property
-    def startup(self):
-        # Start setting up Meshtastic because Textual is ready
-        # pub.subscribe(self.recv_text, "meshtastic.receive.text")
-        # pub.subscribe(self.on_local_connection, "meshtastic.connection.established")
-        # pub.subscribe(self.update_nodes, "meshtastic.node.updated")
-        # pub.subscribe(self.disconnect_radio, "meshtastic.connection.lost")
-        interface = meshtastic.serial_interface.SerialInterface(devPath=str(self.radio_path))
-        return interface
-
-    def on_local_connection(self, interface):
-        """
-            Called when a new radio connection is made
-            """
-        # Local radio information
-        self.getMyUser = self.interface.getMyUser()
-        self.radio_id = self.getMyUser.get("id")
-        self.longName = self.getMyUser.get("longName")
-        self.shortName = self.getMyUser.get("shortName")
-        self.hwModel = self.getMyUser.get("hwModel")
-        self.macaddr = self.getMyUser.get("macaddr")
-
-        # Check if the node has been seen before
-        resp = self.session.execute(select(self.Node).filter_by(macaddr=self.getMyUser.get("macaddr")))
-
-        if len(resp.fetchall()) != 0:
-            return resp.fetchall()
-        else:
-            return resp.fetchall()
-
-    def recv_text(self, packet, interface):
-        # print(f"{success_green} Incoming Message: {packet}")
-        # print(f"{success_green} self.interface Information: {self.interface}")
-        decoded_text = packet.get("decoded").get('text')
-        # Date time msg received
-        now = datetime.datetime.now()
-        now_fmt = now.strftime('%Y-%m-%d %H:%M:%S')
-        # Ljust is to make the formatting look better
-        msg_string = f"{now_fmt.ljust(20, ' ')} [white bold]|[/] {decoded_text}"
-        return msg_string
-
-    def disconnect_radio(self, interface):
+    def __init__(self, node):
+        user = node.get("user") or {}
+        device_metrics = node.get("deviceMetrics") or {}
+        position = node.get("position") or {}
+
+        self.radio_num = node.get("num")
+        self.snr = node.get("snr")
+        self.lastHeard = node.get("lastHeard")
+
+        self.radio_id = user.get("id")
+        self.longName = user.get("longName")
+        self.shortName = user.get("shortName")
+        self.macaddr = user.get("macaddr")
+        self.hwModel = user.get("hwModel")
+        self.role = user.get("role")
+
+        self.batteryLevel = device_metrics.get("batteryLevel")
+        self.voltage = device_metrics.get("voltage")
+        self.channelUtilization = device_metrics.get("channelUtilization")
+        self.airUtilTx = device_metrics.get("airUtilTx")
+
+        self.latitudeI = position.get("latitudeI")
+        self.longitudeI = position.get("longitudeI")
+        self.altitude = position.get("altitude")
+        self.time = position.get("time")
+        self.latitude = position.get("latitude")
+        self.longitude = position.get("longitude")
+
+    def as_dict(self) -> dict:
         """
-        Called when a radio disconnect event is received.
-        Quit and print to console
+        Node table column values for this node
         """
-        # Remove local radio from SQL
-
-        if not self.radio_path.exists():
-            self.radio_disconnect_polling()
-        self.interface = self.startup
-
-    def update_nodes(self, node, interface):
-        return(f"Update Nodes {node}")
-
-    def radio_disconnect_polling(self):
-        start_time = datetime.datetime.now()
-        while True:
-            sleep(1)
-            # console.print(f"{datetime.datetime.now() - start_time}")
-            time_delta = datetime.datetime.now() - start_time
-            if time_delta.seconds < 30:
-                # If the radio path exists, try to connect to the radio
-                if self.radio_path.exists():
-                    # Do first startup sequence here
-                    return self.radio_path
-            else:
-                sys.exit(1)
\ No newline at end of file
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"NodeParser({self.as_dict()!r})"
+
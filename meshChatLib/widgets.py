@@ -0,0 +1,342 @@
+# Standard library imports
+from collections import deque
+import datetime
+import math
+
+from rich.console import Group
+from rich.segment import Segment
+from rich.style import Style
+from rich.table import Table
+from textual.geometry import Region
+from textual.strip import Strip
+from textual.widget import Widget
+from textual.widgets import RichLog, Static
+
+from meshChatLib.positions import EARTH_RADIUS_KM
+
+
+class ChatLog(RichLog):
+    """
+    Chat view that only keeps a bounded window of messages in memory.
+
+    Live messages are appended at the bottom and the oldest roll off once there are more than max_messages, or once
+    they are older than max_age. Scrolling to the top pages older messages in from `history`, scrolling back down
+    pages forward again until the view catches up with the live tail.
+
+    history is called as history(before=None, after=None, limit=n) and returns (time received, line) pairs,
+    oldest first. before/after are datetimes bounding the page.
+    """
+
+    def __init__(self, history=None, max_messages: int = 500, max_age: datetime.timedelta | None = None,
+                 page_size: int = 100, **kwargs) -> None:
+        super().__init__(max_lines=max_messages * 2, **kwargs)
+        self.history = history
+        self.max_messages = max_messages
+        self.max_age = max_age
+        # At most half the window, so a page never replaces everything the user was looking at
+        self.page_size = max(min(page_size, max_messages // 2), 1)
+        # (time received, rendered line) for every message in view, oldest first
+        self.window = deque()
+        # False while the user is reading back through history, live messages then aren't drawn
+        self.following = True
+        self._paging = False
+
+    def on_mount(self) -> None:
+        if self.max_age is not None:
+            self.set_interval(30, self.roll_off)
+
+    def load_latest(self) -> None:
+        """
+        Fill the window with the newest page of history, and follow live messages from there
+        """
+        if self.history is None:
+            return
+        self.window = deque(self.history(limit=self.max_messages))
+        self.following = True
+        self.auto_scroll = True
+        self._redraw()
+
+    def add_message(self, when: datetime.datetime, line: str) -> None:
+        """
+        A live message arrived
+        """
+        if not self.following:
+            # It is in the database, it'll be paged in when the user scrolls back down
+            return
+        self.window.append((when, line))
+        self.write(line)
+        if len(self.window) > self.max_messages:
+            self.window.popleft()
+
+    def roll_off(self) -> None:
+        """
+        Drop messages older than max_age from the window
+        """
+        if self.max_age is None or not self.following:
+            return
+        cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - self.max_age
+        dropped = 0
+        while self.window and self.window[0][0] < cutoff:
+            self.window.popleft()
+            dropped += 1
+        if dropped:
+            self._redraw()
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        if self._paging or self.history is None or not self.window:
+            return
+        if new_value <= 0 < old_value:
+            self.call_after_refresh(self.page_older)
+        elif not self.following and new_value >= self.max_scroll_y > old_value:
+            self.call_after_refresh(self.page_newer)
+
+    def page_older(self) -> None:
+        older = self.history(before=self.window[0][0], limit=self.page_size)
+        if not older:
+            return
+        # Older messages push the newest out of the window, so stop following the live tail
+        self.window.extendleft(reversed(older))
+        while len(self.window) > self.max_messages:
+            self.window.pop()
+            self.following = False
+        self.auto_scroll = self.following
+        self._redraw(scroll_to=len(older))
+
+    def page_newer(self) -> None:
+        newer = self.history(after=self.window[-1][0], limit=self.page_size)
+        self.window.extend(newer)
+        trimmed = 0
+        while len(self.window) > self.max_messages:
+            self.window.popleft()
+            trimmed += 1
+        if len(newer) < self.page_size:
+            # Caught up with the newest stored message
+            self.following = True
+            self.auto_scroll = True
+        self._redraw(scroll_to=max(len(self.window) - len(newer) - trimmed - 1, 0))
+
+    def _redraw(self, scroll_to: int | None = None) -> None:
+        self._paging = True
+        self.clear()
+        for when, line in self.window:
+            self.write(line, scroll_end=False)
+        # The new lines have to be laid out before there is anywhere to scroll to
+        self.call_after_refresh(self._restore_scroll, scroll_to)
+
+    def _restore_scroll(self, scroll_to: int | None) -> None:
+        if scroll_to is None:
+            self.scroll_end(animate=False, immediate=True)
+        else:
+            # Stay off both edges, the next page is only loaded when an edge is reached
+            self.scroll_to(y=max(min(scroll_to, self.max_scroll_y - 1), 1), animate=False, immediate=True)
+        self.call_after_refresh(self._done_paging)
+
+    def _done_paging(self) -> None:
+        self._paging = False
+
+
+# --- Telemetry ---
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+# Rows of the selected node's detail: metric, label, and the fixed ends of its scale (None scales to the data)
+TREND_ROWS = (("batteryLevel", "Battery", 0, 100), ("voltage", "Volts", None, None),
+              ("channelUtilization", "Ch util", 0, None), ("airUtilTx", "Air TX", 0, None))
+
+
+def sparkline(values: list, width: int, low: float | None = None, high: float | None = None) -> str:
+    """
+    The last `width` values as a row of block characters, scaled between low and high
+    (the values' own range when not given)
+    """
+    values = values[-width:]
+    if not values:
+        return ""
+    low = min(values) if low is None else low
+    high = max(values) if high is None else high
+    span = high - low
+    if span <= 0:
+        return SPARK_BLOCKS[len(SPARK_BLOCKS) // 2] * len(values)
+    top = len(SPARK_BLOCKS) - 1
+    return "".join(SPARK_BLOCKS[max(0, min(top, round((value - low) / span * top)))] for value in values)
+
+
+class TelemetryPanel(Static):
+    """
+    Battery and airtime trends of every node with telemetry, drawn from a TelemetryStore without touching the
+    database. The selected node gets its hourly history on top, every node a row of its recent samples below.
+    Redraws on a timer, and only when the store has changed.
+    """
+
+    def __init__(self, store=None, names=None, width: int = 16, max_nodes: int = 500, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.store = store
+        # radio_id -> display name, falls back to the radio id
+        self.names = names
+        self.spark_width = width
+        self.max_nodes = max_nodes
+        self.selected = None
+        self._drawn = None
+
+    def on_mount(self) -> None:
+        self.set_interval(2.0, self.refresh_panel)
+        self.refresh_panel()
+
+    def select(self, radio_id: str | None) -> None:
+        self.selected = radio_id
+        self.refresh_panel()
+
+    def _display_name(self, radio_id: str) -> str:
+        name = self.names(radio_id) if self.names is not None else None
+        return name or radio_id
+
+    def refresh_panel(self) -> None:
+        if self.store is None:
+            return
+        state = (self.store.version, self.selected)
+        if state == self._drawn:
+            return
+        self._drawn = state
+        self.update(self.render_trends())
+
+    def render_trends(self) -> Group:
+        parts = list()
+        if self.selected is not None and self.selected in self.store:
+            detail = Table(title=f"{self._display_name(self.selected)}, hourly", box=None, expand=True, show_header=False)
+            detail.add_column("Metric")
+            detail.add_column("Trend")
+            detail.add_column("Now", justify="right")
+            for metric, label, low, high in TREND_ROWS:
+                buckets = self.store.trend(self.selected, metric)
+                averages = [bucket.avg for bucket in buckets]
+                latest = f"{averages[-1]:.1f}" if averages else "-"
+                detail.add_row(label, sparkline(averages, self.spark_width * 2, low, high), latest)
+            parts.append(detail)
+
+        table = Table(box=None, expand=True)
+        table.add_column("Node", no_wrap=True)
+        table.add_column("Battery", no_wrap=True)
+        table.add_column("Air TX", no_wrap=True)
+        for radio_id in self.store.radio_ids()[:self.max_nodes]:
+            battery = [value for _, value in self.store.recent(radio_id, "batteryLevel")]
+            airtime = [value for _, value in self.store.recent(radio_id, "airUtilTx")]
+            style = "bold" if radio_id == self.selected else ""
+            table.add_row(self._display_name(radio_id), sparkline(battery, self.spark_width, 0, 100),
+                          sparkline(airtime, self.spark_width, 0), style=style)
+        parts.append(table)
+        return Group(*parts)
+
+
+# --- Map ---
+class AsciiMap(Widget):
+    """
+    Last known node positions plotted on a character grid.
+
+    Centred on `home` (a radio id) and showing radius_km around it when both are set, otherwise fitted around every
+    known position. A node is drawn as the first letter of its name, the home node as @ and a cell holding several
+    nodes as +. Each redraw is diffed against the last one and only the changed cells are repainted.
+    """
+    EMPTY = ("·", "dim")
+
+    def __init__(self, store=None, names=None, home: str | None = None, radius_km: float | None = None,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.store = store
+        self.names = names
+        self.home = home
+        self.radius_km = radius_km
+        # cells[y][x] is the (character, style) drawn there
+        self.cells = list()
+        self.repainted_cells = 0
+        self._drawn = None
+
+    def on_mount(self) -> None:
+        self.set_interval(1.0, self.refresh_map)
+
+    def on_resize(self, event) -> None:
+        self._drawn = None
+        self.refresh_map()
+
+    def set_home(self, radio_id: str | None, radius_km: float | None = None) -> None:
+        self.home = radio_id
+        if radius_km is not None:
+            self.radius_km = radius_km
+        self._drawn = None
+        self.refresh_map()
+
+    def _bounds(self) -> tuple | None:
+        home = self.store.last_position(self.home) if self.home is not None else None
+        if home is not None and self.radius_km:
+            lat_span = math.degrees(self.radius_km / EARTH_RADIUS_KM)
+            lon_span = lat_span / max(math.cos(math.radians(home[0])), 0.01)
+            return home[0] - lat_span, home[1] - lon_span, home[0] + lat_span, home[1] + lon_span
+        positions = self.store.last_positions()
+        if not positions:
+            return None
+        lats = [lat for lat, lon in positions.values()]
+        lons = [lon for lat, lon in positions.values()]
+        # A little room around the outermost nodes, and some span even for a single node
+        lat_pad = max((max(lats) - min(lats)) * 0.05, 0.001)
+        lon_pad = max((max(lons) - min(lons)) * 0.05, 0.001)
+        return min(lats) - lat_pad, min(lons) - lon_pad, max(lats) + lat_pad, max(lons) + lon_pad
+
+    def _plot(self, width: int, height: int) -> list:
+        cells = [[self.EMPTY] * width for _ in range(height)]
+        bounds = self._bounds()
+        if bounds is None or width < 1 or height < 1:
+            return cells
+        south, west, north, east = bounds
+        for radio_id, lat, lon in self.store.in_box(south, west, north, east):
+            x = min(int((lon - west) / (east - west) * width), width - 1)
+            y = min(int((north - lat) / (north - south) * height), height - 1)
+            if radio_id == self.home:
+                cells[y][x] = ("@", "bold red")
+            elif cells[y][x] == self.EMPTY:
+                name = (self.names(radio_id) if self.names is not None else None) or radio_id.lstrip("!")
+                cells[y][x] = (name[:1] or "?", "bold green")
+            elif cells[y][x][0] != "@":
+                cells[y][x] = ("+", "bold yellow")
+        return cells
+
+    def refresh_map(self) -> None:
+        if self.store is None:
+            return
+        width, height = self.size
+        state = (self.store.version, width, height)
+        if state == self._drawn:
+            return
+        self._drawn = state
+        cells = self._plot(width, height)
+        if self.home is not None and self.radius_km:
+            self.border_title = f"{len(self.store.near(self.home, self.radius_km))} nodes within {self.radius_km:g} km"
+        if len(self.cells) != height or (self.cells and len(self.cells[0]) != width):
+            self.cells = cells
+            self.repainted_cells += width * height
+            self.refresh()
+            return
+        changed = list()
+        for y, (old_row, new_row) in enumerate(zip(self.cells, cells)):
+            if old_row == new_row:
+                continue
+            for x, (old, new) in enumerate(zip(old_row, new_row)):
+                if old != new:
+                    changed.append(Region(x, y, 1, 1))
+        self.cells = cells
+        if changed:
+            self.repainted_cells += len(changed)
+            self.refresh(*changed)
+
+    def render_line(self, y: int) -> Strip:
+        if y >= len(self.cells):
+            return Strip.blank(self.size.width)
+        segments = list()
+        # One segment per run of the same style
+        run, run_style = list(), None
+        for char, style in self.cells[y]:
+            if style != run_style and run:
+                segments.append(Segment("".join(run), Style.parse(run_style)))
+                run = list()
+            run.append(char)
+            run_style = style
+        if run:
+            segments.append(Segment("".join(run), Style.parse(run_style)))
+        return Strip(segments)
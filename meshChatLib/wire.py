@@ -0,0 +1,200 @@
+# Standard library imports
+import struct
+
+# Compact tagged binary encoding of packet dicts, for the broker socket. It carries what meshtastic's decoded packet
+# dicts hold (None, bools, ints, floats, str, bytes, lists, dicts) without JSON's base64 and number formatting.
+# Protobuf objects, the "raw" copies meshtastic adds, are dropped the same way the journal drops them.
+
+# --- Value tags ---
+T_NONE = 0x00
+T_TRUE = 0x01
+T_FALSE = 0x02
+T_UINT8 = 0x03
+T_INT64 = 0x04
+T_FLOAT = 0x05
+T_STR8 = 0x06
+T_STR32 = 0x07
+T_BYTES8 = 0x08
+T_BYTES32 = 0x09
+T_LIST8 = 0x0A
+T_LIST32 = 0x0B
+T_MAP8 = 0x0C
+T_MAP32 = 0x0D
+T_BIGINT = 0x0E
+
+_SHORT = struct.Struct(">BB")
+_LONG = struct.Struct(">BI")
+_INT64 = struct.Struct(">Bq")
+_FLOAT = struct.Struct(">Bd")
+_NONE = bytes([T_NONE])
+_TRUE = bytes([T_TRUE])
+_FALSE = bytes([T_FALSE])
+
+# --- Frames: body length, frame kind, then one packed value ---
+FRAME_HEADER = struct.Struct(">IB")
+MAX_FRAME = 16 * 1024 * 1024
+
+FRAME_HELLO = 1
+FRAME_SUBSCRIBE = 2
+FRAME_EVENT = 3
+FRAME_DROPPED = 4
+FRAME_SEND = 5
+FRAME_ERROR = 6
+
+
+def _sized(out: list, short_tag: int, long_tag: int, size: int) -> None:
+    out.append(_SHORT.pack(short_tag, size) if size < 256 else _LONG.pack(long_tag, size))
+
+
+def _pack(value, out: list) -> None:
+    kind = type(value)
+    if value is None:
+        out.append(_NONE)
+    elif kind is str:
+        data = value.encode()
+        _sized(out, T_STR8, T_STR32, len(data))
+        out.append(data)
+    elif kind is int:
+        if 0 <= value < 256:
+            out.append(_SHORT.pack(T_UINT8, value))
+        elif -2 ** 63 <= value < 2 ** 63:
+            out.append(_INT64.pack(T_INT64, value))
+        else:
+            data = str(value).encode()
+            if len(data) > 255:
+                # The length is a single byte
+                raise ValueError(f"Can't pack an int of {len(data)} digits")
+            out.append(_SHORT.pack(T_BIGINT, len(data)))
+            out.append(data)
+    elif kind is dict:
+        items = [(key, item) for key, item in value.items() if not hasattr(item, "SerializeToString")]
+        _sized(out, T_MAP8, T_MAP32, len(items))
+        for key, item in items:
+            _pack(key, out)
+            _pack(item, out)
+    elif kind is bool:
+        out.append(_TRUE if value else _FALSE)
+    elif kind is float:
+        out.append(_FLOAT.pack(T_FLOAT, value))
+    elif kind is bytes or kind is bytearray:
+        _sized(out, T_BYTES8, T_BYTES32, len(value))
+        out.append(bytes(value))
+    elif kind is list or kind is tuple:
+        _sized(out, T_LIST8, T_LIST32, len(value))
+        for item in value:
+            _pack(item, out)
+    # Subclasses, e.g. IntEnum values
+    elif isinstance(value, bool):
+        _pack(bool(value), out)
+    elif isinstance(value, int):
+        _pack(int(value), out)
+    elif isinstance(value, float):
+        _pack(float(value), out)
+    elif isinstance(value, str):
+        _pack(str(value), out)
+    elif isinstance(value, dict):
+        _pack(dict(value), out)
+    elif isinstance(value, (list, tuple)):
+        _pack(list(value), out)
+    elif hasattr(value, "SerializeToString"):
+        out.append(_NONE)
+    else:
+        raise TypeError(f"Can't pack {kind.__name__}")
+
+
+def pack(value) -> bytes:
+    out = list()
+    _pack(value, out)
+    return b"".join(out)
+
+
+def _unpack(data: bytes, offset: int) -> tuple:
+    tag = data[offset]
+    offset += 1
+    if tag == T_STR8 or tag == T_BYTES8 or tag == T_LIST8 or tag == T_MAP8:
+        size = data[offset]
+        offset += 1
+    elif tag == T_STR32 or tag == T_BYTES32 or tag == T_LIST32 or tag == T_MAP32:
+        size = _LONG.unpack_from(data, offset - 1)[1]
+        offset += 4
+    elif tag == T_UINT8:
+        return data[offset], offset + 1
+    elif tag == T_INT64:
+        return _INT64.unpack_from(data, offset - 1)[1], offset + 8
+    elif tag == T_FLOAT:
+        return _FLOAT.unpack_from(data, offset - 1)[1], offset + 8
+    elif tag == T_NONE:
+        return None, offset
+    elif tag == T_TRUE:
+        return True, offset
+    elif tag == T_FALSE:
+        return False, offset
+    elif tag == T_BIGINT:
+        size = data[offset]
+        offset += 1
+        return int(data[offset:offset + size]), offset + size
+    else:
+        raise ValueError(f"Unknown tag {tag:#x} at {offset - 1}")
+
+    if tag == T_STR8 or tag == T_STR32:
+        return data[offset:offset + size].decode(), offset + size
+    if tag == T_BYTES8 or tag == T_BYTES32:
+        return data[offset:offset + size], offset + size
+    if tag == T_LIST8 or tag == T_LIST32:
+        items = list()
+        for _ in range(size):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    mapping = dict()
+    for _ in range(size):
+        key, offset = _unpack(data, offset)
+        mapping[key], offset = _unpack(data, offset)
+    return mapping, offset
+
+
+def unpack(data: bytes):
+    value, offset = _unpack(data, 0)
+    if offset != len(data):
+        raise ValueError(f"{len(data) - offset} bytes left over")
+    return value
+
+
+def frame(kind: int, value=None, body: bytes | None = None) -> bytes:
+    """
+    One frame. Pass an already packed body to send the same event to many subscribers without packing it again.
+    """
+    if body is None:
+        body = pack(value)
+    return FRAME_HEADER.pack(len(body), kind) + body
+
+
+def read_frame(stream) -> tuple:
+    """
+    (kind, value) of the next frame from a blocking binary stream, (None, None) at the end of the stream
+    """
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None, None
+    size, kind = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Frame of {size} bytes is over the limit")
+    body = stream.read(size)
+    if len(body) < size:
+        return None, None
+    return kind, unpack(body)
+
+
+async def read_frame_async(reader) -> tuple:
+    """
+    read_frame() for an asyncio StreamReader
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        size, kind = FRAME_HEADER.unpack(header)
+        if size > MAX_FRAME:
+            raise ValueError(f"Frame of {size} bytes is over the limit")
+        body = await reader.readexactly(size)
+    except EOFError:
+        return None, None
+    return kind, unpack(body)
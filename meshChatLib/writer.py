@@ -0,0 +1,284 @@
+# Standard library imports
+import logging
+import queue
+import threading
+from time import perf_counter
+
+from sqlalchemy import and_, delete, exists, func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from meshChatLib.models import ChannelHistory, Node, PositionFix, TelemetryRollup
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedWriter(object):
+    """
+    Write-behind persistence stage for ChannelHistory and Node rows.
+
+    The meshtastic callbacks only put rows on a bounded queue. A background thread commits everything waiting in
+    one transaction once `batch_size` rows are queued or `flush_interval` seconds have passed, whichever is first.
+    """
+
+    def __init__(self, engine, batch_size: int = 200, flush_interval: float = 1.0, max_queue: int = 10000,
+                 on_flush=None, flush_time=None) -> None:
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Called from the writer thread with the macaddrs of the nodes each flush wrote
+        self.on_flush = on_flush
+        # Histogram from meshChatLib.metrics every flush's duration goes into, when metrics are enabled
+        self.flush_time = flush_time
+        self.Session = sessionmaker(bind=engine)
+
+        # A full queue blocks the producer until the next flush, so nothing is silently dropped
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        # Only one flush can run at a time, the background thread and an explicit flush() share this
+        self._flush_lock = threading.Lock()
+        # The batch being written, so pending() still sees rows that have left the queue but aren't committed.
+        # Rows move from the queue to it under _pending_lock.
+        self._in_flight = list()
+        self._pending_lock = threading.Lock()
+
+        # --- Counters ---
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.max_queue_depth = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="meshChat-writer", daemon=True)
+        self._thread.start()
+
+    # --- Producer side, called from the meshtastic reader thread ---
+    def add_message(self, **values) -> None:
+        """
+        Queue a new ChannelHistory row
+        """
+        self._put(("message", values))
+
+    def upsert_node(self, values: dict) -> None:
+        """
+        Queue an insert or update of a Node row, keyed on macaddr
+        """
+        self._put(("node", values))
+
+    def add_position(self, values: dict) -> None:
+        """
+        Queue a new PositionFix row
+        """
+        self._put(("position", values))
+
+    def add_rollup(self, values: dict) -> None:
+        """
+        Queue a TelemetryRollup row, merged into the stored one if that period was already written
+        """
+        self._put(("rollup", values))
+
+    def _put(self, item: tuple) -> None:
+        if self._closed.is_set():
+            # Late packets after close() still get written, just without batching
+            self._write([item])
+            return
+        self._queue.put(item)
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self.enqueued += 1
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        if depth >= self.batch_size:
+            self._wake.set()
+
+    # --- Consumer side ---
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Background flush failed")
+
+    def flush(self) -> int:
+        """
+        Write everything currently queued in one transaction.
+        Returns the number of rows written.
+        """
+        with self._flush_lock:
+            batch = list()
+            with self._pending_lock:
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._in_flight = batch
+            if not batch:
+                return 0
+            try:
+                return self._write(batch)
+            finally:
+                self._in_flight = list()
+
+    def pending(self, kind: str = "message") -> list:
+        """
+        Values of the queued rows of one kind that aren't committed yet, oldest first. Lets readers merge them in
+        without waiting for a flush. A row committed meanwhile can be both here and in the database.
+        """
+        with self._pending_lock:
+            with self._queue.mutex:
+                items = self._in_flight + list(self._queue.queue)
+        return [values for item_kind, values in items if item_kind == kind]
+
+    def close(self) -> None:
+        """
+        Stop the background thread and flush whatever is left. Safe to call more than once.
+        """
+        if not self._closed.is_set():
+            self._closed.set()
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+
+    def _write(self, batch: list) -> int:
+        messages = list()
+        positions = list()
+        rollups = list()
+        # Several updates for the same node in one batch collapse into the latest one
+        nodes = dict()
+        for kind, values in batch:
+            if kind == "message":
+                messages.append(values)
+            elif kind == "position":
+                positions.append(values)
+            elif kind == "rollup":
+                rollups.append(values)
+            elif values.get("macaddr") is None:
+                logger.warning(f"Dropping node update without a macaddr: {values}")
+                with self._stats_lock:
+                    self.failed_rows += 1
+            else:
+                nodes[values["macaddr"]] = values
+
+        start = perf_counter()
+        try:
+            with self.Session() as session, session.begin():
+                if messages:
+                    session.execute(insert(ChannelHistory), messages)
+                for values in nodes.values():
+                    for stmt in self._node_statements(values):
+                        session.execute(stmt)
+                if positions:
+                    session.execute(insert(PositionFix), positions)
+                if rollups:
+                    session.execute(self._rollup_upsert(), rollups)
+            written = len(messages) + len(nodes) + len(positions) + len(rollups)
+        except SQLAlchemyError:
+            logger.exception("Batch write failed, retrying row by row")
+            written = self._write_each(messages, nodes, positions, rollups)
+        elapsed = perf_counter() - start
+        elapsed_ms = elapsed * 1000
+        if self.flush_time is not None:
+            self.flush_time.observe(elapsed)
+
+        with self._stats_lock:
+            self.flushes += 1
+            self.flushed_rows += written
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+            if elapsed_ms > self.max_flush_ms:
+                self.max_flush_ms = elapsed_ms
+        if self.on_flush is not None and nodes:
+            self.on_flush(list(nodes))
+        return written
+
+    def _write_each(self, messages: list, nodes: dict, positions: list, rollups: list) -> int:
+        """
+        Fallback for a batch that failed as a whole, so one bad row doesn't lose the others
+        """
+        # Each row is one transaction of one or more statements
+        rows = [[insert(ChannelHistory).values(**values)] for values in messages]
+        rows += [self._node_statements(values) for values in nodes.values()]
+        rows += [[insert(PositionFix).values(**values)] for values in positions]
+        rows += [[self._rollup_upsert().values(**values)] for values in rollups]
+        written = 0
+        with self.Session() as session:
+            for statements in rows:
+                try:
+                    with session.begin():
+                        for stmt in statements:
+                            session.execute(stmt)
+                    written += 1
+                except SQLAlchemyError:
+                    logger.exception("Dropping row that could not be written")
+                    with self._stats_lock:
+                        self.failed_rows += 1
+        return written
+
+    @classmethod
+    def _node_statements(cls, values: dict) -> list:
+        """
+        Statements storing one node update. A node whose radio_id is stored under another macaddr, e.g. after a
+        firmware change, would clash on the unique radio_id. That row is moved to the new macaddr, or dropped when
+        the new macaddr already has a row, before the upsert.
+        """
+        statements = list()
+        if values.get("radio_id") is not None:
+            nodes = Node.__table__
+            taken = nodes.alias("taken")
+            stale = and_(nodes.c.radio_id == values["radio_id"], nodes.c.macaddr != values["macaddr"])
+            statements.append(update(nodes).where(stale, ~exists().where(taken.c.macaddr == values["macaddr"]))
+                              .values(macaddr=values["macaddr"]))
+            statements.append(delete(nodes).where(stale))
+        statements.append(cls._node_upsert(values))
+        return statements
+
+    @staticmethod
+    def _node_upsert(values: dict):
+        stmt = sqlite_insert(Node).values(**values)
+        # onupdate isn't applied to ON CONFLICT updates, so bump last_seen by hand
+        return stmt.on_conflict_do_update(index_elements=[Node.macaddr],
+                                          set_=dict(values, last_seen=func.now()))
+
+    @staticmethod
+    def _rollup_upsert():
+        stmt = sqlite_insert(TelemetryRollup)
+        table = TelemetryRollup.__table__.c
+        new = stmt.excluded
+        # Merge with what was stored for the same period, e.g. a partial bucket written on the last exit.
+        # SQLite's min() and max() with two arguments are scalar, not aggregates.
+        return stmt.on_conflict_do_update(
+            index_elements=[TelemetryRollup.radio_id, TelemetryRollup.metric, TelemetryRollup.resolution,
+                            TelemetryRollup.bucket_start],
+            set_={"min_value": func.min(table.min_value, new.min_value),
+                  "max_value": func.max(table.max_value, new.max_value),
+                  "avg_value": (table.avg_value * table.samples + new.avg_value * new.samples)
+                  / (table.samples + new.samples),
+                  "samples": table.samples + new.samples})
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "enqueued": self.enqueued,
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "failed_rows": self.failed_rows,
+                "last_flush_ms": self.last_flush_ms,
+                "max_flush_ms": self.max_flush_ms,
+                "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+            }
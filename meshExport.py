@@ -0,0 +1,69 @@
+# Standard library imports
+from pathlib import Path
+
+# Installed 3rd party modules
+import arrow
+import click
+from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeRemainingColumn
+
+from meshChatLib.export import FORMATS, TABLES, HistoryExporter
+from meshChatLib.storage import open_readonly
+
+
+def parse_time(ctx, param, value):
+    # Typed in local time like the search filters, the database keeps naive UTC
+    if value is None:
+        return None
+    try:
+        return arrow.get(value, tzinfo=arrow.now().tzinfo).to("utc").naive
+    except (arrow.parser.ParserError, ValueError):
+        raise click.BadParameter(f"{value} isn't a date or time")
+
+
+@click.command("meshExport")
+@click.option("--database", "-d", help="Path to the database file", default="./meshLibTest.db",
+              type=click.Path(exists=True, dir_okay=False, readable=True, resolve_path=True), show_default=True)
+@click.option("--out", "-o", "out_dir", help="Directory the export files are written to", default="./export",
+              type=click.Path(file_okay=False, writable=True, resolve_path=True), show_default=True)
+@click.option("--format", "-f", "fmt", help="jsonl and csv append to earlier exports, parquet needs pyarrow",
+              default="jsonl", type=click.Choice(FORMATS), show_default=True)
+@click.option("--table", "-t", "tables", help="Tables to export, repeat for several", multiple=True,
+              default=list(TABLES), type=click.Choice(list(TABLES)), show_default=True)
+@click.option("--since", help="Only rows from this time on, e.g. 2024-05-01 or 2024-05-01T18:00",
+              default=None, callback=parse_time)
+@click.option("--until", help="Only rows before this time", default=None, callback=parse_time)
+@click.option("--channel", "channels", help="Only messages on this channel, repeat for several", multiple=True)
+@click.option("--incremental", "state_path", default=None,
+              help="State file remembering the last exported row of each table. Each export only writes the rows "
+                   "added since the last one.",
+              type=click.Path(dir_okay=False, writable=True, resolve_path=True))
+@click.option("--batch-size", help="Rows read per query", default=50000, type=click.IntRange(min=1),
+              show_default=True)
+def main(database, out_dir, fmt, tables, since, until, channels, state_path, batch_size):
+    """
+    Stream message, node, telemetry and position history out of a meshChat database.
+
+    The database is opened read only and read in batches, so it can be exported while meshChat is running.
+    """
+    console = Console()
+    exporter = HistoryExporter(open_readonly(Path(database)), Path(out_dir), fmt=fmt, batch_size=batch_size,
+                               since=since, until=until, channels=channels, state_path=state_path)
+    with Progress(TextColumn("{task.description}"), BarColumn(), MofNCompleteColumn(), TimeRemainingColumn(),
+                  console=console) as progress:
+        for name in tables:
+            task = progress.add_task(name, total=exporter.count(name))
+            try:
+                path = exporter.export(name, progress=lambda rows: progress.advance(task, rows))
+            except RuntimeError as error:
+                raise click.ClickException(str(error))
+            progress.update(task, description=f"{name} -> {path.name}" if path is not None else f"{name}, nothing new")
+    # Only once every file is complete, an interrupted export is simply done again
+    exporter.save_state()
+    stats = exporter.stats
+    console.print(f"{sum(stats['rows'].values())} rows in {stats['seconds']:.1f} s, "
+                  f"{stats['rows_per_second']:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
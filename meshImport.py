@@ -0,0 +1,50 @@
+# Standard library imports
+from pathlib import Path
+
+# Installed 3rd party modules
+import click
+from rich.console import Console
+from rich.progress import (BarColumn, DownloadColumn, Progress, TextColumn, TimeRemainingColumn,
+                           TransferSpeedColumn)
+
+from meshChatLib.importer import BulkImporter
+from meshChatLib.storage import open_engine
+
+
+@click.command("meshImport")
+@click.argument("files", nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False, readable=True, resolve_path=True))
+@click.option("--database", "-d", help="Path to the database file, created when it doesn't exist",
+              default="./meshLibTest.db", type=click.Path(dir_okay=False, resolve_path=True), show_default=True)
+@click.option("--jobs", "-j", help="Processes parsing the files, one per CPU by default", default=None,
+              type=click.IntRange(min=1))
+@click.option("--batch-size", help="Rows inserted per transaction", default=50000, type=click.IntRange(min=1),
+              show_default=True)
+@click.option("--rx-radio", help="Label stored as the radio the imported messages and nodes were heard on",
+              default=None)
+def main(files, database, jobs, batch_size, rx_radio):
+    """
+    Import packet dumps, meshChat journals and logs of other Meshtastic clients into a meshChat database.
+
+    FILES are JSON lines, plain or gzip'd: meshChat journals (--record), packets as meshtastic publishes them or
+    nodes as in its node list. Messages already in the database are skipped.
+    """
+    console = Console()
+    # The default profile: WAL with synchronous NORMAL, a power cut loses the last batches but can't corrupt the file
+    importer = BulkImporter(open_engine(Path(database)), jobs=jobs,
+                            batch_size=batch_size, rx_radio=rx_radio)
+    total = sum(Path(path).stat().st_size for path in files)
+    with Progress(TextColumn("{task.description}"), BarColumn(), DownloadColumn(), TransferSpeedColumn(),
+                  TimeRemainingColumn(), console=console) as progress:
+        task = progress.add_task(f"{len(files)} file(s)", total=total)
+        importer.run(files, progress=lambda size: progress.advance(task, size))
+    stats = importer.stats
+    console.print(f"{stats['messages_inserted']} messages imported, {stats['duplicates']} already there, "
+                  f"{stats['nodes_upserted']} nodes, {stats['skipped']} lines skipped")
+    console.print(f"{stats['lines']} lines in {stats['seconds']:.1f} s, {stats['lines_per_second']:.0f} lines/s")
+    if stats["nodes_failed"]:
+        console.print(f"{stats['nodes_failed']} nodes clashed with ones already stored, see the log")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,11 @@ from textual.widgets import (Header, Footer, Log, Placeholder, Static, Label, Bu
                              Markdown, RichLog, Input, ListView, ListItem, OptionList, ProgressBar)
 from textual.worker import Worker, get_current_worker
 
+from meshChatLib.broker import BrokerInterface
+from meshChatLib.dispatch import PortnumDispatcher
+from meshChatLib.replay import ReplayInterface, open_interface
+from meshChatLib.utils import TelemetryMsg
+
 console = Console()
 
 logger = logging.getLogger()
@@ -39,9 +44,24 @@ logger.setLevel(logging.ERROR)
 
 def main():
     radio_path = "/dev/ttyACM0"
-    Path(radio_path)
+    # Pass a recorded journal as the first argument to replay it instead of using a radio, or the socket of a
+    # running meshBroker.py to share its radio
+    replay = sys.argv[1] if len(sys.argv) > 1 else None
+    if replay is not None and Path(replay).is_socket():
+        radio_path, replay = replay, None
     pub.subscribe(recv_text, "meshtastic.receive")
-    interface = meshtastic.serial_interface.SerialInterface(devPath=str(radio_path))
+    interface = open_interface(radio_path, replay=replay)
+
+    if isinstance(interface, ReplayInterface):
+        # There is no radio to send the admin request to, just print what comes in
+        with Status(f"Replaying {replay}", console=console) as status:
+            interface.finished.wait()
+        return
+    if isinstance(interface, BrokerInterface):
+        # The admin request needs the radio itself, just print what the broker passes on
+        with Status(f"Listening on {radio_path}", console=console) as status:
+            while True:
+                sleep(1)
 
     with Status(f"Waiting on a message with {radio_path}", console=console) as status:
         # console.print(interface.getMyUser())
@@ -86,136 +106,52 @@ def recv_text(packet, interface):
     console.print('[blue bold]-' * 10)
 
     console.print('[purple bold]-' * 10)
-    port_num_str = packet.get("decoded").get("portnum")
-
-    if port_num_str == "ADMIN_APP":
-        # This is an admin function
-        pass
-        console.print(f"Admin")
-        console.print(f"{packet}")
-
-    elif port_num_str == "POSITION_APP":
-        # GPS data
-        console.print(f"Position")
-    elif port_num_str == "TEXT_MESSAGE_APP":
-        # Text message
-        console.print(f"Text message")
-        console.print(packet)
-        # txt = TextMsg(raw_msg=packet)
-        # console.print(f"From: {txt.from_radio_id}")
-        # console.print(f"To: {txt.to_radio_id}")
-        # console.print(f"Body: {txt.text}")
+    dispatcher.dispatch(packet, interface)
 
-    elif port_num_str == "TELEMETRY_APP":
-        console.print("Telemetery")
-        tel = TelemetryMsg(raw_msg=packet)
-        # console.print(tel.from_radio_id)
-        console.print(interface.getNode(nodeId=tel.from_radio_id))
-        # console.print(tel.from_radio_num)
-    elif port_num_str == "ROUTING_APP":
 
-        console.print(f"Routing")
+def admin_rx(packet, interface):
+    # This is an admin function
+    console.print(f"Admin")
+    console.print(f"{packet}")
 
 
-    else:
-        console.print(packet)
+def position_rx(packet, interface):
+    # GPS data
+    console.print(f"Position")
 
 
-class Message(object):
+def text_rx(packet, interface):
+    # Text message
+    console.print(f"Text message")
+    console.print(packet)
+    # txt = TextMsg(raw_msg=packet)
+    # console.print(f"From: {txt.from_radio_id}")
+    # console.print(f"To: {txt.to_radio_id}")
+    # console.print(f"Body: {txt.text}")
 
-    def __init__(self, raw_msg: dict):
-        """Base class for all messages"""
-        self._raw_msg = raw_msg
 
-    @property
-    def rx_time(self):
-        return self._raw_msg.get("rx_time")
-
-    @property
-    def hopLimit(self):
-        return self._raw_msg.get("hopLimit")
+def telemetry_rx(packet, interface):
+    console.print("Telemetery")
+    tel = TelemetryMsg(raw_msg=packet)
+    # console.print(tel.from_radio_id)
+    console.print(interface.getNode(nodeId=tel.from_radio_id))
+    # console.print(tel.from_radio_num)
 
-    @property
-    def priority(self):
-        return self._raw_msg.get("priority")
-
-    @property
-    def msg_id(self):
-        return self._raw_msg.get("id")
-
-    @property
-    def portnum(self):
-        return self._raw_msg.get("decoded").get("portnum")
-
-    @property
-    def payload(self):
-        return self._raw_msg.get("decoded").get("payload")
-
-    @property
-    def from_radio_id(self):
-        return self._raw_msg.get("fromId")
-
-    @property
-    def to_radio_id(self):
-        return self._raw_msg.get("toId")
-
-    @property
-    def from_radio_num(self):
-        return self._raw_msg.get("from")
-
-    @property
-    def to_radio_num(self):
-        return self._raw_msg.get("to_radio_num")
 
+def routing_rx(packet, interface):
+    console.print(f"Routing")
 
-class AdminMsg(Message):
 
-    def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
+def unknown_rx(packet, interface):
+    console.print(packet)
 
 
-class TextMsg(Message):
-
-    def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
-
-    @property
-    def rxSnr(self):
-        return self._raw_msg.get("rxSnr")
-
-    @property
-    def rxTime(self):
-        return self._raw_msg.get("rxTime")
-
-    @property
-    def rxRssi(self):
-        return self._raw_msg.get("rxRssi")
-
-    @property
-    def text(self):
-        return self._raw_msg.get("decoded").get("text")
-
-
-class TelemetryMsg(Message):
-
-    def __init__(self, raw_msg: dict):
-        self._raw_msg = raw_msg
-
-    @property
-    def from_radio_num(self):
-        return self._raw_msg.get("from")
-
-    @property
-    def to_radio_num(self):
-        return self._raw_msg.get("to_radio_num")
-
-    @property
-    def airUtilTx(self):
-        return self._raw_msg.get("decoded").get("telemetry").get("deviceMetrics").get("airUtilTx")
-
-    @property
-    def timestamp(self):
-        return self._raw_msg.get("decoded").get("telemetry").get("time")
+dispatcher = PortnumDispatcher(default=unknown_rx)
+dispatcher.subscribe("ADMIN_APP", admin_rx)
+dispatcher.subscribe("POSITION_APP", position_rx)
+dispatcher.subscribe("TEXT_MESSAGE_APP", text_rx)
+dispatcher.subscribe("TELEMETRY_APP", telemetry_rx)
+dispatcher.subscribe("ROUTING_APP", routing_rx)
 
 
 if __name__ == "__main__":
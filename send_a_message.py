@@ -4,6 +4,8 @@ from pubsub import pub
 
 import time
 
+from meshChatLib.outbound import OutboundScheduler, PRIORITY_BULK
+
 def onReceive(packet, interface): # called when a packet arrives
     print(f"Received: {packet}")
 
@@ -17,13 +19,17 @@ def main():
     pub.subscribe(onConnection, "meshtastic.connection.established") # what the heck does this do?
     # By default, will try to find a meshtastic device, otherwise provide a device path like /dev/ttyUSB0
     interface = meshtastic.serial_interface.SerialInterface() # sets a callable object called "interface" I think?
+    # Test messages go through the send queue as bulk traffic, so they back off when the channel is busy
+    outbound = OutboundScheduler(send=interface.sendText)
+    outbound.start()
 
     # Main application "logic"
     message_number = 0  # starts the message number at 0
     run_time = 0 # starts run time at 0
     while True:
-        interface.sendText(f"Test Message every 15 seconds - Message # {str(message_number)} Runtime {str(run_time)}")
-        print(f"Sent Test Message - Message # {str(message_number)} Runtime {str(run_time)}")
+        outbound.queue(f"Test Message every 15 seconds - Message # {str(message_number)} Runtime {str(run_time)}",
+                       priority=PRIORITY_BULK)
+        print(f"Queued Test Message - Message # {str(message_number)} Runtime {str(run_time)}")
         time.sleep(15)
         message_number = message_number + 1
         run_time = run_time + 15
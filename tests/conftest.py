@@ -0,0 +1,40 @@
+# Standard library imports
+from pathlib import Path
+import sys
+
+import pytest
+
+# The tests import meshChatLib from the checkout
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from meshChatLib.storage import open_engine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    A fresh database file at the latest schema version
+    """
+    engine = open_engine(tmp_path / "meshLibTest.db")
+    yield engine
+    engine.dispose()
+
+
+class FakeClock(object):
+    """
+    time.monotonic stand-in the tests move forward by hand
+    """
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
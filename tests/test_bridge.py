@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+from pubsub import pub
+
+from meshChatLib.bridge import ReceiveBridge
+
+
+def test_calls_wait_for_the_loop_in_order():
+    calls = list()
+    bridge = ReceiveBridge(None)
+
+    def handler(packet, interface=None):
+        calls.append(packet)
+
+    for number in range(3):
+        assert bridge.put(handler, (number,), {"interface": "radio"})
+    assert calls == [] and bridge.depth == 3
+    assert bridge.drain_once() == 3
+    assert calls == [0, 1, 2]
+    assert bridge.stats["delivered"] == 3
+
+
+def test_full_queue_drops_and_counts_per_handler():
+    bridge = ReceiveBridge(None, max_pending=2)
+
+    def rx_packet(packet):
+        pass
+
+    def update_nodes(node):
+        pass
+
+    assert bridge.put(rx_packet, (1,))
+    assert bridge.put(rx_packet, (2,))
+    assert not bridge.put(rx_packet, (3,))
+    assert not bridge.put(update_nodes, (4,))
+    stats = bridge.stats
+    assert (stats["received"], stats["dropped"], stats["depth"], stats["max_depth"]) == (4, 2, 2, 2)
+    assert stats["dropped_by_handler"] == {"rx_packet": 1, "update_nodes": 1}
+
+    # Room again once drained
+    bridge.drain_once()
+    assert bridge.put(rx_packet, (5,))
+
+
+def test_drains_in_batches():
+    bridge = ReceiveBridge(None, batch_size=4)
+    for number in range(10):
+        bridge.put(lambda: None)
+    assert [bridge.drain_once() for _ in range(4)] == [4, 4, 2, 0]
+
+
+def test_accept_filter_and_failing_handlers(caplog):
+    calls = list()
+    bridge = ReceiveBridge(None)
+
+    def handler(packet, interface):
+        if packet == "bad":
+            raise ValueError("bad packet")
+        calls.append(packet)
+
+    listener = bridge.listener(handler, accept=lambda packet, interface: packet != "duplicate")
+    for packet in ("first", "duplicate", "bad", "second"):
+        listener(packet=packet, interface=None)
+    assert bridge.drain_once() == 3
+    assert calls == ["first", "second"]
+    assert bridge.stats["rejected"] == 1
+    assert "handler failed" in caplog.text
+
+
+def test_listener_keeps_the_signature_pubsub_checks():
+    calls = list()
+    bridge = ReceiveBridge(None)
+
+    def on_bridge_test(packet, interface):
+        calls.append(packet)
+
+    pub.subscribe(bridge.listener(on_bridge_test), "meshChat.test.bridge")
+    pub.sendMessage("meshChat.test.bridge", packet="hello", interface=None)
+    bridge.drain_once()
+    assert calls == ["hello"]
+
+
+def test_reader_thread_calls_run_on_the_loop():
+    async def run() -> tuple:
+        bridge = ReceiveBridge(None)
+        bridge.start()
+        loop_thread = threading.get_ident()
+        done = asyncio.Event()
+        ran_on = list()
+
+        def handler(number):
+            ran_on.append(threading.get_ident())
+            if number == 499:
+                done.set()
+
+        reader = threading.Thread(target=lambda: [bridge.put(handler, (number,)) for number in range(500)])
+        reader.start()
+        await asyncio.wait_for(done.wait(), timeout=10)
+        reader.join()
+        bridge._task.cancel()
+        return loop_thread, ran_on, bridge.stats
+
+    loop_thread, ran_on, stats = asyncio.run(run())
+    assert len(ran_on) == 500 and set(ran_on) == {loop_thread}
+    assert stats["delivered"] == 500 and stats["dropped"] == 0
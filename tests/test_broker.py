@@ -0,0 +1,69 @@
+import io
+
+from meshChatLib.broker import BrokerSubscriber, PacketFilter
+from meshChatLib.wire import FRAME_DROPPED, FRAME_EVENT, frame, read_frame
+
+
+def packet(portnum: str = "TEXT_MESSAGE_APP", from_num: int = 0x1234abcd, channel: int = 0) -> dict:
+    return {"packet": {"from": from_num, "fromId": f"!{from_num:08x}", "to": 0xFFFFFFFF, "toId": "^all",
+                       "channel": channel, "decoded": {"portnum": portnum}}}
+
+
+def buffered(subscriber: BrokerSubscriber) -> list:
+    stream = io.BytesIO(b"".join(subscriber._frames))
+    frames = list()
+    while True:
+        kind, value = read_frame(stream)
+        if kind is None:
+            return frames
+        frames.append((kind, value))
+
+
+def test_empty_filter_wants_everything():
+    assert PacketFilter().wants("meshtastic.receive", packet())
+    assert PacketFilter.from_dict(None).as_dict() == {"portnums": None, "channels": None, "nodes": None}
+
+
+def test_filter_on_portnum_channel_and_node():
+    text_only = PacketFilter(portnums=["TEXT_MESSAGE_APP"])
+    assert text_only.wants("meshtastic.receive", packet())
+    assert not text_only.wants("meshtastic.receive", packet("POSITION_APP"))
+
+    assert not PacketFilter(channels=[1]).wants("meshtastic.receive", packet())
+    assert PacketFilter(channels=[1]).wants("meshtastic.receive", packet(channel=1))
+
+    # Radio ids and node numbers both match
+    assert PacketFilter(nodes=["!1234abcd"]).wants("meshtastic.receive", packet())
+    assert PacketFilter(nodes=[0x1234abcd]).wants("meshtastic.receive", packet())
+    assert not PacketFilter(nodes=["!00000001"]).wants("meshtastic.receive", packet())
+
+
+def test_node_updates_and_connection_events():
+    nodes = PacketFilter(nodes=["!1234abcd"])
+    assert nodes.wants("meshtastic.node.updated", {"node": {"num": 0x1234abcd, "user": {"id": "!1234abcd"}}})
+    assert not nodes.wants("meshtastic.node.updated", {"node": {"num": 1, "user": {"id": "!00000001"}}})
+    assert PacketFilter(portnums=["TEXT_MESSAGE_APP"]).wants("meshtastic.connection.established", {})
+
+
+def test_filter_survives_a_round_trip_through_its_dict():
+    spec = PacketFilter(portnums=["TEXT_MESSAGE_APP"], nodes=[1, "!00000002"]).as_dict()
+    assert PacketFilter.from_dict(spec).as_dict() == spec
+
+
+def test_full_buffer_drops_and_reports_the_gap():
+    event = frame(FRAME_EVENT, {"text": "x" * 300})
+    subscriber = BrokerSubscriber(None, "client-1", max_buffer=len(event) * 3)
+    for _ in range(3):
+        assert subscriber.offer(event)
+    assert not subscriber.offer(event)
+    assert not subscriber.offer(event)
+    assert subscriber.stats["dropped"] == 2
+
+    # The client catches up
+    subscriber._frames.clear()
+    subscriber._buffered = 0
+    assert subscriber.offer(event)
+    assert subscriber.offer(event)
+    assert [(kind, value.get("dropped")) for kind, value in buffered(subscriber)] == [
+        (FRAME_DROPPED, 2), (FRAME_EVENT, None), (FRAME_EVENT, None)]
+    assert buffered(subscriber)[0][1] == {"dropped": 2, "total": 2}
@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+import json
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from meshChatLib.attach import AttachedApp, connect
+from meshChatLib.daemon import decode_event, encode_event
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MY_USER = {"id": "!0000abcd", "longName": "Base camp", "shortName": "BASE", "macaddr": "mac-local",
+           "hwModel": "TBEAM"}
+
+
+def write_journal(path: Path, messages: int = 5) -> Path:
+    events = [[0, "meshtastic.connection.established", {"my_user": MY_USER}],
+              [0, "meshtastic.node.updated", {"node": {"num": 0xabcd, "user": MY_USER}}],
+              [0, "meshtastic.node.updated", {"node": {"num": 1, "user": {
+                  "id": "!00000001", "longName": "Summit", "shortName": "SUMT", "macaddr": "mac-1",
+                  "hwModel": "TBEAM"}}}]]
+    for packet_id in range(1, messages + 1):
+        events.append([0, "meshtastic.receive.text", {"packet": {
+            "from": 1, "fromId": "!00000001", "to": 0xFFFFFFFF, "toId": "^all", "id": packet_id, "channel": 0,
+            "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": f"message {packet_id}"}}}])
+    with gzip.open(path, "wt", encoding="utf-8") as journal:
+        journal.write(json.dumps({"meshChatJournal": 1, "started": time.time()}) + "\n")
+        for event in events:
+            journal.write(json.dumps(event) + "\n")
+    return path
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = tmp_path / "daemon.sock"
+    process = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / "meshLibTest.py"), "--headless", "--replay",
+         str(write_journal(tmp_path / "journal.jsonl.gz")), "--replay-speed", "0", "-r", str(tmp_path / "radio"),
+         "-d", str(tmp_path / "daemon.db"), "--socket", str(socket_path)],
+        cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while not socket_path.exists():
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            pytest.fail(f"The daemon didn't start: {process.stderr.read().decode()}")
+        time.sleep(0.05)
+    yield process, socket_path
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def read_until(stream, kind: str) -> dict:
+    while True:
+        line = stream.readline()
+        assert line, f"The daemon closed the connection before a {kind} event"
+        event = decode_event(line)
+        if event["type"] == kind:
+            return event
+
+
+def test_snapshot_and_bad_commands_keep_the_connection(daemon):
+    process, socket_path = daemon
+    sock, hello = connect(socket_path)
+    assert hello["database"].endswith("daemon.db")
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(encode_event({"type": "subscribe"}))
+        stream.flush()
+        snapshot = read_until(stream, "snapshot")
+        # The socket is up before the replay's node dump is in, what the snapshot misses comes as deltas
+        macaddrs = {node["macaddr"] for node in snapshot["nodes"]}
+        while not macaddrs >= {"mac-local", "mac-1"}:
+            macaddrs.add(read_until(stream, "node")["node"]["macaddr"])
+
+        for command in (b"not json\n", encode_event({"type": "send"}), encode_event({"type": "send", "text": 5}),
+                        encode_event([1, 2])):
+            stream.write(command)
+            stream.flush()
+            assert read_until(stream, "error")["text"]
+
+        # Still attached, a good command goes through
+        stream.write(encode_event({"type": "send", "text": "still here"}))
+        stream.flush()
+        assert read_until(stream, "message")["msg_text"] == "still here"
+    assert process.poll() is None
+
+
+def test_attach_and_detach_leave_the_daemon_running(daemon):
+    process, socket_path = daemon
+
+    async def attach_and_detach() -> AttachedApp:
+        sock, hello = connect(socket_path)
+        app = AttachedApp(sock, hello)
+        async with app.run_test() as pilot:
+            for _ in range(100):
+                await pilot.pause(0.05)
+                if app.nodes.get_by_macaddr("mac-1") is not None:
+                    break
+            assert app.nodes.get_by_macaddr("mac-1") is not None
+            app.disable_local_radio()
+        return app
+
+    app = asyncio.run(attach_and_detach())
+    # Read only, nothing to close on the way out
+    assert app.writer is None
+    assert "mode=ro" in str(app.engine.url)
+    time.sleep(0.2)
+    assert process.poll() is None
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=30) == 0
+    assert not socket_path.exists()
@@ -0,0 +1,75 @@
+import datetime
+from time import monotonic
+
+from sqlalchemy.orm import Session
+
+from meshChatLib.dedupe import PacketDeduper
+from meshChatLib.importer import _message_row
+from meshChatLib.utils import TextMsg, sender_id
+from meshChatLib.writer import BatchedWriter
+
+
+def text_packet(packet_id: int, from_num: int = 0x1234abcd, from_id: bool = True) -> dict:
+    packet = {"from": from_num, "to": 0xFFFFFFFF, "toId": "^all", "id": packet_id, "rxTime": 1700000000,
+              "decoded": {"portnum": "TEXT_MESSAGE_APP", "payload": b"hi", "text": "hi"}}
+    if from_id:
+        packet["fromId"] = f"!{from_num:08x}"
+    return packet
+
+
+def test_sender_id_is_the_same_with_or_without_fromid():
+    assert sender_id(text_packet(1)) == sender_id(text_packet(1, from_id=False)) == "!1234abcd"
+    assert TextMsg(raw_msg=text_packet(1, from_id=False)).from_radio_id == "!1234abcd"
+    assert _message_row(text_packet(1, from_id=False), None, "radio")[0] == "!1234abcd"
+
+
+def test_copies_are_dropped_until_the_window_passes(clock):
+    deduper = PacketDeduper(window=60.0)
+    assert deduper.accept(text_packet(1), now=clock())
+    clock.advance(30)
+    assert not deduper.accept(text_packet(1, from_id=False), now=clock())
+    # Another sender may reuse the id
+    assert deduper.accept(text_packet(1, from_num=0x42), now=clock())
+    clock.advance(31)
+    assert deduper.accept(text_packet(1), now=clock())
+    assert deduper.stats["duplicates"] == 1
+    assert deduper.link_stats["!1234abcd"].duplicates == 1
+
+
+def test_packets_without_an_id_are_always_accepted(clock):
+    deduper = PacketDeduper()
+    assert deduper.accept(text_packet(0), now=clock())
+    assert deduper.accept(text_packet(0), now=clock())
+
+
+def test_max_entries_evicts_the_oldest_first(clock):
+    deduper = PacketDeduper(window=600.0, max_entries=2)
+    for packet_id in (1, 2, 3):
+        assert deduper.accept(text_packet(packet_id), now=clock())
+    assert not deduper.accept(text_packet(3), now=clock())
+    assert deduper.accept(text_packet(1), now=clock())
+
+
+def test_expired_keys_are_still_caught_by_the_bloom_filters():
+    # The Bloom filters rotate on the real clock they were made at, stay within half a window of it
+    now = monotonic()
+    deduper = PacketDeduper(window=10.0, bloom_window=3600.0)
+    assert deduper.accept(text_packet(1), now=now)
+    assert not deduper.accept(text_packet(1), now=now + 60)
+    assert deduper.stats["bloom_hits"] == 1
+
+
+def test_warm_keys_match_live_packets_without_fromid(engine):
+    # Stored from a packet meshtastic had no user for, so it had no fromId
+    txt_msg = TextMsg(raw_msg=text_packet(7, from_id=False))
+    writer = BatchedWriter(engine)
+    writer.add_message(from_radio_id=txt_msg.from_radio_id, to_channel=txt_msg.to_radio_id, msg_text=txt_msg.text,
+                       packet_id=txt_msg.msg_id,
+                       time_rx=datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+    writer.close()
+
+    deduper = PacketDeduper(window=600.0)
+    with Session(engine) as session:
+        assert deduper.warm(session) == 1
+    assert not deduper.accept(text_packet(7))
+    assert not deduper.accept(text_packet(7, from_id=False))
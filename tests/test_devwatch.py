@@ -0,0 +1,82 @@
+import threading
+from time import monotonic
+
+import pytest
+
+from meshChatLib import devwatch
+from meshChatLib.devwatch import DeviceWatcher
+
+
+def create_later(path, delay: float = 0.2) -> threading.Timer:
+    timer = threading.Timer(delay, path.write_text, args=("",))
+    timer.start()
+    return timer
+
+
+def test_wait_for_wakes_when_the_device_appears(tmp_path):
+    device = tmp_path / "ttyACM0"
+    # A long poll interval, so only an inotify event wakes the watcher in time
+    with DeviceWatcher([tmp_path / "ttyACM*"], poll_interval=30.0) as watcher:
+        if watcher.mode != "inotify":
+            pytest.skip("inotify is not available")
+        timer = create_later(device)
+        start = monotonic()
+        assert watcher.wait_for(device, timeout=10.0)
+        assert monotonic() - start < 5.0
+        timer.join()
+
+
+def test_wait_for_while_polling(tmp_path, monkeypatch):
+    def unavailable():
+        raise OSError("inotify is not available")
+    monkeypatch.setattr(devwatch, "Inotify", unavailable)
+    device = tmp_path / "ttyUSB0"
+    added = list()
+    seen = threading.Event()
+
+    def on_added(path):
+        added.append(path)
+        seen.set()
+    with DeviceWatcher([tmp_path / "ttyUSB*"], on_added=on_added, poll_interval=0.05) as watcher:
+        assert watcher.mode == "poll"
+        timer = create_later(device)
+        assert watcher.wait_for(device, timeout=10.0)
+        # wait_for can see the file before the next poll does
+        assert seen.wait(10.0)
+        timer.join()
+    assert added == [str(device)]
+
+
+def test_wait_for_times_out(tmp_path):
+    with DeviceWatcher([tmp_path / "ttyACM*"], poll_interval=0.05) as watcher:
+        start = monotonic()
+        assert not watcher.wait_for(tmp_path / "ttyACM0", timeout=0.2)
+        assert monotonic() - start >= 0.2
+
+
+def test_wait_for_returns_at_once_for_a_present_device(tmp_path):
+    device = tmp_path / "ttyACM0"
+    device.write_text("")
+    watcher = DeviceWatcher([tmp_path / "ttyACM*"])
+    assert watcher.present == {str(device)}
+    assert watcher.wait_for(device, timeout=0)
+
+
+def test_rescan_reports_added_and_removed_devices(tmp_path):
+    added = list()
+    removed = list()
+    first = tmp_path / "ttyACM0"
+    first.write_text("")
+    watcher = DeviceWatcher([tmp_path / "ttyACM*", tmp_path / "ttyUSB*"], on_added=added.append,
+                            on_removed=removed.append)
+
+    second = tmp_path / "ttyUSB0"
+    second.write_text("")
+    (tmp_path / "other").write_text("")
+    first.unlink()
+    watcher.rescan()
+    assert added == [str(second)]
+    assert removed == [str(first)]
+
+    watcher.rescan()
+    assert (watcher.added, watcher.removed, watcher.scans) == (1, 1, 2)
@@ -0,0 +1,76 @@
+from meshChatLib.dispatch import PortnumDispatcher
+
+
+def packet(portnum: str | None, from_id: str = "!00000001", channel: int = 0) -> dict:
+    packet = {"fromId": from_id, "channel": channel}
+    if portnum is not None:
+        packet["decoded"] = {"portnum": portnum}
+    return packet
+
+
+def test_packets_go_to_their_portnum_in_subscription_order():
+    calls = list()
+    dispatcher = PortnumDispatcher()
+    dispatcher.subscribe("TEXT_MESSAGE_APP", lambda packet, interface: calls.append(("first", interface)))
+    dispatcher.subscribe("TEXT_MESSAGE_APP", lambda packet, interface: calls.append(("second", interface)))
+    dispatcher.subscribe("POSITION_APP", lambda packet, interface: calls.append(("position", interface)))
+
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP"), "radio") == 2
+    assert calls == [("first", "radio"), ("second", "radio")]
+
+
+def test_unknown_portnums_go_to_the_default():
+    defaulted = list()
+    dispatcher = PortnumDispatcher(default=lambda packet, interface: defaulted.append(packet))
+    dispatcher.subscribe("TEXT_MESSAGE_APP", lambda packet, interface: None)
+
+    assert dispatcher.dispatch(packet("RANGE_TEST_APP")) == 0
+    assert dispatcher.dispatch(packet(None)) == 0
+    assert dispatcher.dispatch({"decoded": None}) == 0
+    assert len(defaulted) == 3
+    assert dispatcher.stats["unhandled"] == 3
+
+
+def test_sender_and_channel_filters():
+    calls = list()
+    dispatcher = PortnumDispatcher()
+
+    @dispatcher.on("TEXT_MESSAGE_APP", from_ids=["!00000001"], channels=[0, 2])
+    def filtered(packet, interface):
+        calls.append(packet["fromId"])
+
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP")) == 1
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP", from_id="!00000002")) == 0
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP", channel=1)) == 0
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP", channel=2)) == 1
+    assert calls == ["!00000001", "!00000001"]
+
+
+def test_a_failing_handler_does_not_stop_the_others(caplog):
+    calls = list()
+    dispatcher = PortnumDispatcher()
+
+    def broken(packet, interface):
+        raise RuntimeError("boom")
+
+    dispatcher.subscribe("TEXT_MESSAGE_APP", broken)
+    dispatcher.subscribe("TEXT_MESSAGE_APP", lambda packet, interface: calls.append(packet))
+    assert dispatcher.dispatch(packet("TEXT_MESSAGE_APP")) == 2
+    assert len(calls) == 1
+    assert "broken failed on a TEXT_MESSAGE_APP packet" in caplog.text
+
+
+def test_unsubscribe_and_stats():
+    def handler(packet, interface):
+        pass
+
+    dispatcher = PortnumDispatcher()
+    dispatcher.subscribe("TELEMETRY_APP", handler)
+    dispatcher.dispatch(packet("TELEMETRY_APP"))
+    stats, = dispatcher.stats["TELEMETRY_APP"]
+    assert stats["calls"] == 1 and stats["handler"].endswith("handler")
+    assert stats["max_ms"] >= 0 and stats["avg_ms"] == stats["total_ms"]
+
+    dispatcher.unsubscribe("TELEMETRY_APP", handler)
+    assert "TELEMETRY_APP" not in dispatcher.stats
+    assert dispatcher.dispatch(packet("TELEMETRY_APP")) == 0
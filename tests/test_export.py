@@ -0,0 +1,129 @@
+import csv
+import datetime
+import json
+from pathlib import Path
+
+import pytest
+
+from meshChatLib.export import HistoryExporter
+from meshChatLib.writer import BatchedWriter
+
+START = datetime.datetime(2024, 5, 1, 12, 0)
+
+
+def add_messages(engine, count: int, first: int = 0, channel: str = "^all") -> None:
+    writer = BatchedWriter(engine)
+    for number in range(first, first + count):
+        writer.add_message(from_radio_id="!00000001", to_channel=channel, msg_text=f"message {number}",
+                           time_rx=START + datetime.timedelta(minutes=number), packet_id=number + 1)
+    writer.close()
+
+
+def add_node(engine, macaddr: str, long_name: str) -> None:
+    writer = BatchedWriter(engine)
+    writer.upsert_node({"radio_id": f"!{macaddr}", "macaddr": macaddr, "longName": long_name, "shortName": "N",
+                        "hwModel": "TBEAM"})
+    writer.close()
+
+
+def read_jsonl(path: Path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_incremental_exports_only_write_new_rows(engine, tmp_path):
+    state_path = tmp_path / "state.json"
+    add_messages(engine, 5)
+    exporter = HistoryExporter(engine, tmp_path / "out", batch_size=2, state_path=state_path)
+    path = exporter.export("messages")
+    exporter.save_state()
+    assert exporter.stats["rows"] == {"messages": 5}
+    assert json.loads(state_path.read_text()) == {"messages": 5}
+
+    # A later run picks up after the saved id and appends
+    add_messages(engine, 3, first=5)
+    exporter = HistoryExporter(engine, tmp_path / "out", batch_size=2, state_path=state_path)
+    assert exporter.count("messages") == 3
+    assert exporter.export("messages") == path
+    exporter.save_state()
+    assert [row["msg_text"] for row in read_jsonl(path)] == [f"message {number}" for number in range(8)]
+    assert len({row["id"] for row in read_jsonl(path)}) == 8
+
+    # Nothing new, nothing written
+    exporter = HistoryExporter(engine, tmp_path / "out", state_path=state_path)
+    assert exporter.export("messages") is None
+    assert exporter.stats["rows"] == {"messages": 0}
+
+
+def test_state_is_replaced_atomically(engine, tmp_path, monkeypatch):
+    state_path = tmp_path / "state.json"
+    add_messages(engine, 2)
+    exporter = HistoryExporter(engine, tmp_path / "out", state_path=state_path)
+    exporter.export("messages")
+    exporter.save_state()
+
+    add_messages(engine, 2, first=2)
+    exporter = HistoryExporter(engine, tmp_path / "out", state_path=state_path)
+    exporter.export("messages")
+
+    def interrupted(self, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Path, "replace", interrupted)
+    with pytest.raises(OSError):
+        exporter.save_state()
+    # The old state is untouched until the new one is complete
+    assert json.loads(state_path.read_text()) == {"messages": 2}
+    monkeypatch.undo()
+    exporter.save_state()
+    assert json.loads(state_path.read_text()) == {"messages": 4}
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".")] == []
+
+
+def test_time_range_and_channel_filters(engine, tmp_path):
+    add_messages(engine, 4)
+    add_messages(engine, 4, first=4, channel="!00000002")
+    exporter = HistoryExporter(engine, tmp_path / "out", since=START + datetime.timedelta(minutes=2),
+                               until=START + datetime.timedelta(minutes=6), channels=["^all"])
+    path = exporter.export("messages")
+    assert [row["msg_text"] for row in read_jsonl(path)] == ["message 2", "message 3"]
+
+    exporter = HistoryExporter(engine, tmp_path / "dm", until=START + datetime.timedelta(minutes=6),
+                               channels=["!00000002"])
+    assert [row["msg_text"] for row in read_jsonl(exporter.export("messages"))] == ["message 4", "message 5"]
+
+
+def test_csv_header_is_written_once(engine, tmp_path):
+    state_path = tmp_path / "state.json"
+    add_messages(engine, 2)
+    exporter = HistoryExporter(engine, tmp_path / "out", fmt="csv", state_path=state_path)
+    path = exporter.export("messages")
+    exporter.save_state()
+    add_messages(engine, 2, first=2)
+    exporter = HistoryExporter(engine, tmp_path / "out", fmt="csv", state_path=state_path)
+    exporter.export("messages")
+
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0][:2] == ["id", "from_radio_id"]
+    assert [row[rows[0].index("msg_text")] for row in rows[1:]] == [f"message {number}" for number in range(4)]
+
+
+def test_nodes_replace_the_earlier_file(engine, tmp_path):
+    state_path = tmp_path / "state.json"
+    add_node(engine, "mac-1", "Base camp")
+    exporter = HistoryExporter(engine, tmp_path / "out", state_path=state_path)
+    path = exporter.export("nodes")
+    exporter.save_state()
+
+    add_node(engine, "mac-1", "Summit")
+    add_node(engine, "mac-2", "Trailhead")
+    exporter = HistoryExporter(engine, tmp_path / "out", state_path=state_path)
+    assert exporter.export("nodes") == path
+    assert [row["longName"] for row in read_jsonl(path)] == ["Summit", "Trailhead"]
+    # Nodes are always exported whole, so they keep no state
+    assert "nodes" not in json.loads(state_path.read_text())
+
+
+def test_unknown_format_is_refused(engine, tmp_path):
+    with pytest.raises(ValueError):
+        HistoryExporter(engine, tmp_path, fmt="xml")
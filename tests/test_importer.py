@@ -0,0 +1,101 @@
+import gzip
+import json
+
+import pytest
+from sqlalchemy import text
+
+from meshChatLib import importer
+from meshChatLib.importer import BulkImporter, _lines
+from meshChatLib.writer import BatchedWriter
+
+START = 1714564800.0
+
+
+def packet(sender: int, packet_id: int | None, number: int) -> dict:
+    return {"from": sender, "toId": "^all", "id": packet_id, "rxTime": START + number,
+            "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": f"message {number} from {sender}"}}
+
+
+def write_dump(path, packets) -> None:
+    path.write_text("".join(json.dumps(values) + "\n" for values in packets))
+
+
+def stored(engine) -> list:
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT from_radio_id, packet_id, msg_text FROM channel_history "
+                                       "ORDER BY time_rx, id")).all()
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 10, 11, 64, 1000])
+def test_lines_splits_chunks_without_losing_or_duplicating_a_line(tmp_path, chunk):
+    path = tmp_path / "dump.jsonl"
+    # Lines of different lengths, so chunk boundaries fall at line starts, mid line and on the newlines
+    lines = [b"x" * (number % 13) + b"\n" for number in range(60)]
+    lines.append(b"no newline at the end")
+    path.write_bytes(b"".join(lines))
+    size = path.stat().st_size
+
+    read = [line for start in range(0, size, chunk) for line in _lines(path, start, min(start + chunk, size))]
+    assert read == lines
+
+
+def test_lines_reads_gzip_whole(tmp_path):
+    path = tmp_path / "dump.jsonl.gz"
+    with gzip.open(path, "wb") as target:
+        target.write(b"one\ntwo\n")
+    assert list(_lines(path, 0, None)) == [b"one\n", b"two\n"]
+
+
+def test_duplicates_are_skipped_across_batches_and_chunks(engine, tmp_path, monkeypatch):
+    # Tiny chunks and batches, so copies of a message are parsed by different workers and written in different
+    # transactions
+    monkeypatch.setattr(importer, "CHUNK_BYTES", 512)
+    first = tmp_path / "first.jsonl"
+    second = tmp_path / "second.jsonl"
+    write_dump(first, [packet(1, number, number) for number in range(40)])
+    # The same packets again from another radio's log, plus some new ones and the same id from another sender
+    write_dump(second, [packet(1, number, number) for number in range(20, 40)]
+               + [packet(1, number, number) for number in range(40, 50)]
+               + [packet(2, number, number) for number in range(10)])
+
+    bulk = BulkImporter(engine, jobs=2, batch_size=3)
+    bulk.run([first, second])
+
+    rows = stored(engine)
+    assert len(bulk.plan([first])) > 1
+    assert len(rows) == 60
+    assert len(set((sender, packet_id) for sender, packet_id, _ in rows)) == 60
+    assert bulk.stats["messages_read"] == 80
+    assert bulk.stats["messages_inserted"] == 60
+    assert bulk.stats["duplicates"] == 20
+
+
+def test_messages_already_stored_are_skipped(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(importer, "CHUNK_BYTES", 512)
+    writer = BatchedWriter(engine)
+    for number in range(5):
+        values = packet(1, number, number)
+        writer.add_message(from_radio_id="!00000001", to_channel="^all", msg_text=values["decoded"]["text"],
+                           packet_id=number)
+    writer.close()
+    dump = tmp_path / "dump.jsonl"
+    write_dump(dump, [packet(1, number, number) for number in range(10)])
+
+    BulkImporter(engine, jobs=2, batch_size=4).run([dump])
+    assert len(stored(engine)) == 10
+
+    # Importing the same file again adds nothing
+    again = BulkImporter(engine, jobs=2, batch_size=4)
+    again.run([dump])
+    assert again.stats["messages_inserted"] == 0
+    assert len(stored(engine)) == 10
+
+
+def test_messages_without_a_packet_id_are_always_inserted(engine, tmp_path):
+    dump = tmp_path / "dump.jsonl"
+    write_dump(dump, [packet(1, None, 0), packet(1, None, 0), packet(1, 7, 1)])
+
+    BulkImporter(engine, jobs=1).run([dump])
+    BulkImporter(engine, jobs=1).run([dump])
+    assert [packet_id for _, packet_id, _ in stored(engine)].count(None) == 4
+    assert [packet_id for _, packet_id, _ in stored(engine)].count(7) == 1
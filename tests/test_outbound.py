@@ -0,0 +1,99 @@
+import pytest
+
+from meshChatLib.outbound import PRIORITY_ADMIN, OutboundScheduler, TokenBucket
+
+
+class FakeRadio(object):
+    """sendText stand-in that fails the first `failures` calls"""
+
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.sent = list()
+
+    def __call__(self, text, destinationId=None, channelIndex=0):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("radio busy")
+        self.sent.append((text, destinationId))
+        return {"id": len(self.sent)}
+
+
+def send_ready(scheduler: OutboundScheduler, now: float) -> list:
+    """Try everything the scheduler lets out at `now`, like its thread would. Returns the texts tried."""
+    sent = list()
+    while True:
+        with scheduler._condition:
+            message, wait = scheduler._take_ready(now)
+        if message is None:
+            return sent
+        scheduler._send(message)
+        sent.append(message.text)
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=0.5, burst=2, clock=clock)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    assert bucket.delay() == pytest.approx(2.0)
+    clock.advance(1.0)
+    assert bucket.delay() == pytest.approx(1.0)
+    clock.advance(1.0)
+    assert bucket.take()
+    # Never more than a burst saved up
+    clock.advance(60.0)
+    assert bucket.take() and bucket.take() and not bucket.take()
+
+
+def test_burst_then_paced_sends(clock):
+    radio = FakeRadio()
+    scheduler = OutboundScheduler(send=radio, rate=1.0, burst=2, clock=clock)
+    for text in ("one", "two", "three"):
+        scheduler.queue(text)
+    assert send_ready(scheduler, clock()) == ["one", "two"]
+    with scheduler._condition:
+        assert scheduler._take_ready(clock()) == (None, pytest.approx(1.0))
+    clock.advance(1.0)
+    assert send_ready(scheduler, clock()) == ["three"]
+    assert scheduler.stats["sent"] == 3
+
+
+def test_priority_order_across_conversations(clock):
+    scheduler = OutboundScheduler(send=FakeRadio(), rate=1.0, burst=10, clock=clock)
+    scheduler.queue("chat 1")
+    scheduler.queue("chat 2")
+    scheduler.queue("direct", destination="!00000001")
+    scheduler.queue("admin", destination="!00000002", priority=PRIORITY_ADMIN)
+    # Each conversation keeps its own order
+    assert send_ready(scheduler, clock()) == ["admin", "direct", "chat 1", "chat 2"]
+
+
+def test_failed_send_backs_off_then_gives_up(clock):
+    failed = list()
+    scheduler = OutboundScheduler(send=FakeRadio(failures=3), rate=1.0, burst=10, max_attempts=3, backoff=2.0,
+                                  clock=clock)
+    scheduler.queue("hello", on_failed=lambda message, error: failed.append(message.text))
+    scheduler.queue("later")
+
+    assert send_ready(scheduler, clock()) == ["hello"]
+    with scheduler._condition:
+        message, wait = scheduler._take_ready(clock())
+    # 2 s with 20% jitter, and the message after it in the conversation waits too
+    assert message is None and 1.6 <= wait <= 2.4
+
+    clock.advance(2.4)
+    assert send_ready(scheduler, clock()) == ["hello"]
+    clock.advance(4.8)
+    # The third failure drops it and the conversation moves on
+    assert send_ready(scheduler, clock()) == ["hello", "later"]
+    assert failed == ["hello"]
+    assert scheduler.stats["retries"] == 2
+    assert scheduler.stats["failed"] == 1
+
+
+def test_tune_slows_down_on_a_busy_channel(clock):
+    scheduler = OutboundScheduler(rate=1.0, clock=clock)
+    assert scheduler.tune(15.0, None) == pytest.approx(0.5)
+    assert scheduler.tune(None, 5.0) == pytest.approx(0.5)
+    # Never below a tenth of the base rate
+    assert scheduler.tune(60.0, 20.0) == pytest.approx(0.1)
+    assert scheduler.tune(None, None) == pytest.approx(1.0)
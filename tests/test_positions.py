@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from meshChatLib.positions import GridIndex, haversine_km
+
+
+def brute_force_within(points: dict, lat: float, lon: float, radius_km: float) -> list:
+    return sorted((haversine_km(lat, lon, node_lat, node_lon), radio_id)
+                  for radio_id, (node_lat, node_lon) in points.items()
+                  if haversine_km(lat, lon, node_lat, node_lon) <= radius_km)
+
+
+def brute_force_box(points: dict, south: float, west: float, north: float, east: float) -> set:
+    def in_lon(lon):
+        return west <= lon <= east if west <= east else lon >= west or lon <= east
+    return {radio_id for radio_id, (lat, lon) in points.items() if south <= lat <= north and in_lon(lon)}
+
+
+def index_of(points: dict, cell_deg: float = 0.1) -> GridIndex:
+    index = GridIndex(cell_deg=cell_deg)
+    for radio_id, (lat, lon) in points.items():
+        index.update(radio_id, lat, lon)
+    return index
+
+
+def test_haversine():
+    assert haversine_km(0, 0, 0, 0) == 0
+    # A degree of latitude is about 111 km, and the same across the antimeridian
+    assert haversine_km(0, 0, 1, 0) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km(0, 179.5, 0, -179.5) == pytest.approx(111.195, abs=0.01)
+
+
+def test_in_box_includes_the_edges():
+    index = index_of({"a": (40.0, -74.0), "b": (40.1, -73.9), "c": (40.05, -74.05), "d": (39.99, -74.0)})
+    assert {radio_id for radio_id, _, _ in index.in_box(40.0, -74.0, 40.1, -73.9)} == {"a", "b"}
+
+
+def test_in_box_across_the_antimeridian():
+    index = index_of({"east": (10.0, 179.95), "west": (10.0, -179.95), "middle": (10.0, 0.0), "edge": (10.0, 180.0)})
+    found = {radio_id for radio_id, _, _ in index.in_box(9.0, 179.9, 11.0, -179.9)}
+    assert found == {"east", "west", "edge"}
+
+
+def test_within_across_the_antimeridian():
+    index = index_of({"east": (0.0, 179.9), "west": (0.0, -179.9), "far": (0.0, 178.0)})
+    assert {radio_id for _, radio_id in index.within(0.0, 180.0, 20.0)} == {"east", "west"}
+    assert [radio_id for _, radio_id in index.within(0.0, -179.95, 10.0)] == ["west"]
+
+
+def test_within_near_the_poles():
+    # Near a pole nodes on the far side of the world by longitude are still close
+    index = index_of({"near": (89.95, 0.0), "across": (89.95, 180.0), "south": (-89.95, 90.0)})
+    assert {radio_id for _, radio_id in index.within(89.99, 45.0, 20.0)} == {"near", "across"}
+    assert [radio_id for _, radio_id in index.within(-90.0, 0.0, 10.0)] == ["south"]
+    # Not reaching the pole, the longitude span still widens with the latitude: 10 degrees east is 193 km here
+    index = index_of({"inside": (80.0, 10.0), "outside": (80.0, 12.0)})
+    assert [radio_id for _, radio_id in index.within(80.0, 0.0, 200.0)] == ["inside"]
+
+
+def test_within_matches_a_brute_force_search():
+    rng = random.Random(7)
+    points = dict()
+    for number in range(400):
+        # Clustered around the awkward places and spread over the globe
+        lat, lon = rng.choice([(0.0, 180.0), (89.5, 0.0), (-89.5, 0.0), (40.0, -74.0)])
+        points[f"!{number:08x}"] = (max(-90.0, min(90.0, lat + rng.uniform(-2, 2))),
+                                    (lon + rng.uniform(-2, 2) + 180.0) % 360.0 - 180.0)
+    for number in range(50):
+        points[f"!f{number:07x}"] = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+    for cell_deg in (0.1, 1.0, 7.0):
+        index = index_of(points, cell_deg)
+        for lat, lon in [(0.0, 180.0), (0.0, -179.99), (89.9, 10.0), (-89.9, -170.0), (40.0, -74.0),
+                         (rng.uniform(-90, 90), rng.uniform(-180, 180))]:
+            for radius_km in (1.0, 50.0, 300.0, 3000.0):
+                expected = brute_force_within(points, lat, lon, radius_km)
+                assert index.within(lat, lon, radius_km) == expected, (cell_deg, lat, lon, radius_km)
+
+
+def test_in_box_matches_a_brute_force_search():
+    rng = random.Random(11)
+    points = {f"!{number:08x}": (rng.uniform(-90, 90), rng.uniform(-180, 180)) for number in range(300)}
+    index = index_of(points, cell_deg=2.0)
+    for _ in range(200):
+        south, north = sorted((rng.uniform(-90, 90), rng.uniform(-90, 90)))
+        west, east = rng.uniform(-180, 180), rng.uniform(-180, 180)
+        found = [radio_id for radio_id, _, _ in index.in_box(south, west, north, east)]
+        assert len(found) == len(set(found))
+        assert set(found) == brute_force_box(points, south, west, north, east)
+
+
+def test_moving_a_node_between_cells():
+    index = GridIndex(cell_deg=0.1)
+    index.update("a", 40.01, -74.01)
+    index.update("b", 40.02, -74.02)
+    index.update("a", 40.55, -74.01)
+    assert len(index) == 2
+    assert index.get("a") == (40.55, -74.01)
+    assert [radio_id for _, radio_id in index.within(40.01, -74.01, 5.0)] == ["b"]
+    assert [radio_id for _, radio_id in index.within(40.55, -74.01, 5.0)] == ["a"]
+    # Only occupied cells are kept
+    assert len(index._cells) == 2
+
+    # Moving within a cell just updates the position
+    index.update("a", 40.56, -74.02)
+    assert index.get("a") == (40.56, -74.02) and len(index._cells) == 2
+
+    index.remove("b")
+    index.remove("missing")
+    assert index.get("b") is None
+    assert len(index) == 1 and len(index._cells) == 1
@@ -0,0 +1,85 @@
+from sqlalchemy.orm import Session
+
+from meshChatLib.registry import NodeRegistry
+from meshChatLib.writer import BatchedWriter
+
+
+def node(num: int, **values) -> dict:
+    row = {"radio_num": str(num), "radio_id": f"!{num:08x}", "macaddr": f"mac-{num}", "longName": f"Node {num}",
+           "shortName": f"N{num}", "hwModel": "TBEAM"}
+    row.update(values)
+    return row
+
+
+def test_warm_loads_the_nodes_table(engine):
+    writer = BatchedWriter(engine)
+    for num in range(3):
+        writer.upsert_node(node(num))
+    writer.close()
+
+    registry = NodeRegistry()
+    with Session(engine) as session:
+        assert registry.warm(session) == 3
+    assert registry.get_by_radio_id("!00000002")["longName"] == "Node 2"
+    assert registry.get_by_radio_num(1)["macaddr"] == "mac-1"
+    assert registry.get_by_macaddr("mac-0")["local_radio"] is False
+
+
+def test_upsert_merges_and_reports_changes():
+    registry = NodeRegistry()
+    first, changed = registry.upsert(node(1, snr="5.0"))
+    assert changed and first["local_radio"] is False
+
+    again, changed = registry.upsert(node(1, snr="5.0"))
+    assert not changed
+
+    # Only the values given are replaced
+    renamed, changed = registry.upsert({"macaddr": "mac-1", "longName": "Summit"})
+    assert changed
+    assert (renamed["longName"], renamed["snr"], renamed["radio_id"]) == ("Summit", "5.0", "!00000001")
+    assert registry.get_by_radio_num("1") is renamed
+
+
+def test_registry_follows_a_radio_id_to_its_new_macaddr():
+    registry = NodeRegistry()
+    registry.upsert(node(1))
+
+    row, changed = registry.upsert(node(1, macaddr="mac-2"))
+
+    assert changed
+    assert registry.get_by_radio_id("!00000001") is row
+    assert registry.get_by_macaddr("mac-1") is None
+    assert len(registry) == 1
+
+
+def test_rows_handed_out_are_never_changed():
+    registry = NodeRegistry()
+    before, _ = registry.upsert(node(1))
+    registry.upsert({"macaddr": "mac-1", "longName": "Summit"})
+    registry.set_local_radios(["mac-1"])
+    assert before["longName"] == "Node 1"
+    assert before["local_radio"] is False
+
+
+def test_rows_without_a_macaddr_are_ignored():
+    registry = NodeRegistry()
+    assert registry.upsert({"radio_id": "!00000001"}) == (None, False)
+    assert len(registry) == 0
+
+
+def test_set_local_radios_returns_the_flags_that_changed():
+    registry = NodeRegistry()
+    for num in range(3):
+        registry.upsert(node(num))
+    assert registry.set_local_radios(["mac-0", "mac-1"]) == ["mac-0", "mac-1"]
+    assert registry.set_local_radios(["mac-1"]) == ["mac-0"]
+    assert [row["macaddr"] for row in registry.all() if row["local_radio"]] == ["mac-1"]
+
+
+def test_stats_count_hits_and_misses():
+    registry = NodeRegistry()
+    registry.upsert(node(1))
+    registry.get_by_macaddr("mac-1")
+    registry.get_by_radio_id("!ffffffff")
+    assert registry.stats == {"nodes": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+    assert "mac-1" in registry
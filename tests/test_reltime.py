@@ -0,0 +1,100 @@
+import pytest
+
+from meshChatLib.reltime import DAY, HOUR, MINUTE, MONTH, WEEK, YEAR, AgeLabels, bucket, humanize
+
+
+@pytest.mark.parametrize("age, text", [
+    (-30, "just now"),
+    (0, "just now"),
+    (9, "just now"),
+    (10, "seconds ago"),
+    (MINUTE - 1, "seconds ago"),
+    (MINUTE, "a minute ago"),
+    (2 * MINUTE - 1, "a minute ago"),
+    (2 * MINUTE, "2 minutes ago"),
+    (HOUR - 1, "59 minutes ago"),
+    (HOUR, "an hour ago"),
+    (DAY - 1, "23 hours ago"),
+    (DAY, "a day ago"),
+    (WEEK - 1, "6 days ago"),
+    (WEEK, "a week ago"),
+    (2 * WEEK, "2 weeks ago"),
+    (MONTH - 1, "4 weeks ago"),
+    (MONTH, "a month ago"),
+    (YEAR - 1, "11 months ago"),
+    (YEAR, "a year ago"),
+    (3 * YEAR, "3 years ago"),
+])
+def test_humanize_bucket_boundaries(age, text):
+    assert humanize(1000000000 - age, now=1000000000) == text
+
+
+def test_buckets_end_where_the_next_one_starts():
+    ages = list(range(0, 2 * HOUR, 7)) + list(range(HOUR, 2 * YEAR, 3607))
+    for age in ages:
+        key, ends_at = bucket(age)
+        assert ends_at > age
+        assert bucket(ends_at - 1)[0] == key
+        assert bucket(ends_at)[0] != key
+
+
+def test_labels_are_cached_until_their_bucket_runs_out(clock):
+    labels = AgeLabels(clock=clock)
+    heard = clock.now - 2 * MINUTE
+    assert labels.label("a", heard) == "2 minutes ago"
+    assert labels.label("a", heard) == "2 minutes ago"
+    assert labels.stats == {"labels": 1, "hits": 1, "misses": 1}
+
+    # Still in the same bucket
+    clock.advance(MINUTE - 1)
+    assert labels.expired() == []
+    assert labels.label("a", heard) == "2 minutes ago"
+    assert labels.stats["hits"] == 2
+
+    clock.advance(1)
+    assert labels.expired() == ["a"]
+    assert labels.expired() == []
+    assert labels.label("a", heard) == "3 minutes ago"
+    assert labels.stats["misses"] == 2
+
+
+def test_a_new_epoch_replaces_the_cached_label(clock):
+    labels = AgeLabels(clock=clock)
+    assert labels.label("a", clock.now - HOUR) == "an hour ago"
+    assert labels.label("a", clock.now) == "just now"
+    assert labels.stats["misses"] == 2
+
+    # The hour old label's expiry is stale and doesn't report the key, the new one's does
+    clock.advance(10)
+    assert labels.expired() == ["a"]
+    clock.advance(HOUR)
+    assert labels.expired() == []
+
+
+def test_expired_reports_keys_in_the_order_they_run_out(clock):
+    labels = AgeLabels(clock=clock)
+    labels.label("minutes", clock.now - 5 * MINUTE)
+    labels.label("seconds", clock.now - 20)
+    labels.label("days", clock.now - 3 * DAY)
+    clock.advance(DAY)
+    assert labels.expired() == ["seconds", "minutes", "days"]
+
+
+def test_discarded_keys_are_not_reported(clock):
+    labels = AgeLabels(clock=clock)
+    labels.label("a", clock.now)
+    labels.discard("a")
+    labels.discard("unknown")
+    clock.advance(MINUTE)
+    assert labels.expired() == []
+    assert labels.stats["labels"] == 0
+
+
+def test_expiry_heap_is_compacted(clock):
+    labels = AgeLabels(clock=clock)
+    # Every new epoch leaves a stale heap entry behind
+    for epoch in range(1000):
+        labels.label("a", epoch)
+    assert len(labels._expiry) <= 4 * len(labels._items) + 64
+    clock.advance(YEAR)
+    assert labels.expired() == ["a"]
@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+
+from meshChatLib.search import HistorySearch, SearchQuery, tokens
+from meshChatLib.writer import BatchedWriter
+
+START = datetime.datetime(2024, 5, 1, 12, 0)
+MESSAGES = [
+    ("!00000001", "^all", "Net check tonight at 8"),
+    ("!00000002", "^all", "checking in from the summit"),
+    ("!00000001", "!00000002", "Café at the trailhead?"),
+    ("!00000003", "^all", "NOT a drill, net is up"),
+    ("!00000002", "^all", 'she said "hello" twice'),
+]
+
+
+def message(number: int) -> dict:
+    from_radio_id, to_channel, msg_text = MESSAGES[number]
+    return {"from_radio_id": from_radio_id, "to_channel": to_channel, "msg_text": msg_text,
+            "time_rx": START + datetime.timedelta(hours=number), "packet_id": number + 1}
+
+
+@pytest.fixture
+def history(engine):
+    writer = BatchedWriter(engine)
+    for number in range(len(MESSAGES)):
+        writer.add_message(**message(number))
+    writer.close()
+    return HistorySearch(engine, resolve_sender={"Summit": "!00000002"}.get)
+
+
+def texts(rows) -> list:
+    return [row.msg_text for row in rows]
+
+
+def test_parse_words_phrases_and_filters():
+    query = SearchQuery.parse('net "check in" pre* FROM:!00000001 channel:^all since:2024-05-01')
+    assert query.terms == ["net", "check in", "pre*"]
+    assert (query.sender, query.channel) == ("!00000001", "^all")
+    assert query.since is not None and query.until is None
+    assert query.match == '"net" "check in" "pre"*'
+
+
+def test_parse_while_still_typing():
+    # An unclosed quote and a half typed date don't stop the search
+    assert SearchQuery.parse('"net che').terms == ["net", "che"]
+    query = SearchQuery.parse("net since:2024-1")
+    assert query.since is None and query.terms == ["net"]
+    assert not SearchQuery.parse("  ")
+    assert not SearchQuery.parse("*")
+
+
+def test_operators_and_quotes_are_searched_for():
+    assert SearchQuery.parse("NOT OR").match == '"NOT" "OR"'
+    assert SearchQuery(terms=['say "hi"']).match == '"say ""hi"""'
+
+
+def test_tokens_match_the_fts_tokenizer():
+    assert tokens("Café at the trail_head, !a1b2") == ["cafe", "at", "the", "trail", "head", "a1b2"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("net", [3, 0]),
+    ("NET", [3, 0]),
+    ("check", [0]),
+    ("check*", [1, 0]),
+    ('"net check"', [0]),
+    ('"check net"', []),
+    ("cafe", [2]),
+    ("not drill", [3]),
+    ('"hello"', [4]),
+    ("from:!00000001", [2, 0]),
+    ("from:Summit", [4, 1]),
+    ("from:!00000001 net", [0]),
+    ("channel:!00000002", [2]),
+    ("since:2024-05-01T13:00:00+00:00 until:2024-05-01T15:00:00+00:00", [2, 1]),
+])
+def test_search_and_in_memory_matching_agree(history, query, expected):
+    assert texts(history.search(query)) == [MESSAGES[number][2] for number in expected]
+    parsed = SearchQuery.parse(query)
+    sender = {"Summit": "!00000002"}.get(parsed.sender or "")
+    matched = [number for number in range(len(MESSAGES)) if parsed.matches(message(number), sender=sender)]
+    assert sorted(matched, reverse=True) == expected
+
+
+def test_newest_first_up_to_the_limit(history):
+    assert texts(history.search("from:!00000002", limit=1)) == [MESSAGES[4][2]]
+
+
+def test_index_follows_inserts_updates_and_deletes(engine, history):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO channel_history (msg_text, time_rx) VALUES "
+                                   "('rendezvous at the lake', '2024-05-02 12:00:00.000000')")
+    assert texts(history.search("rendezvous")) == ["rendezvous at the lake"]
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE channel_history SET msg_text = 'rendezvous at the pass' "
+                                   "WHERE msg_text = 'rendezvous at the lake'")
+    assert texts(history.search("lake")) == []
+    assert texts(history.search("pass")) == ["rendezvous at the pass"]
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM channel_history WHERE msg_text LIKE 'rendezvous%'")
+    assert texts(history.search("rendezvous")) == []
+    with engine.connect() as connection:
+        # The external content index still agrees with its table
+        connection.exec_driver_sql("INSERT INTO channel_history_fts(channel_history_fts) VALUES ('integrity-check')")
+
+
+def test_queued_messages_are_found_without_a_flush(engine, history):
+    writer = BatchedWriter(engine, flush_interval=3600)
+    writer.add_message(from_radio_id="!00000004", to_channel="^all", msg_text="net control here",
+                       time_rx=START + datetime.timedelta(days=1), packet_id=99)
+
+    rows = history.search("net", pending=writer.pending("message"))
+    assert texts(rows) == ["net control here", MESSAGES[3][2], MESSAGES[0][2]]
+    assert rows[0].id is None
+    assert writer.stats["flushed_rows"] == 0
+
+    writer.flush()
+    # Committed and still reported as pending while the batch is in flight, listed once
+    rows = history.search("net", pending=[dict(from_radio_id="!00000004", to_channel="^all",
+                                               msg_text="net control here",
+                                               time_rx=START + datetime.timedelta(days=1))])
+    assert texts(rows) == ["net control here", MESSAGES[3][2], MESSAGES[0][2]]
+    assert rows[0].id is not None
+    writer.close()
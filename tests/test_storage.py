@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import inspect
+
+from meshChatLib.storage import MIGRATIONS, open_engine, schema_version
+
+# The tables as the first meshLibTest.py made them, before any migration
+BASELINE_SCHEMA = """
+CREATE TABLE nodes (
+    id INTEGER NOT NULL, created_at DATETIME, last_seen DATETIME, local_radio BOOLEAN, radio_num VARCHAR(50),
+    radio_id VARCHAR(50) NOT NULL, "longName" VARCHAR(50) NOT NULL, "shortName" VARCHAR(10) NOT NULL,
+    macaddr VARCHAR(20) NOT NULL, "hwModel" VARCHAR(100) NOT NULL, role VARCHAR(50), snr VARCHAR(50),
+    "lastHeard" VARCHAR(50), "batteryLevel" INTEGER, voltage FLOAT, "channelUtilization" FLOAT, "airUtilTx" FLOAT,
+    "latitudeI" FLOAT, "longitudeI" FLOAT, altitude INTEGER, time VARCHAR(75), latitude FLOAT, longitude FLOAT,
+    PRIMARY KEY (id), UNIQUE (radio_id), UNIQUE (macaddr)
+);
+CREATE TABLE channel_history (
+    id INTEGER NOT NULL, from_radio_id VARCHAR(50), to_channel VARCHAR(50), msg_text VARCHAR(50) NOT NULL,
+    time_rx DATETIME, PRIMARY KEY (id), FOREIGN KEY(from_radio_id) REFERENCES node (radio_id)
+);
+INSERT INTO nodes (radio_id, "longName", "shortName", macaddr, "hwModel", "lastHeard")
+    VALUES ('!00000001', 'Base camp', 'BASE', 'mac-1', 'TBEAM', '1700000000'),
+           ('!00000002', 'Never heard', 'NONE', 'mac-2', 'TBEAM', '');
+INSERT INTO channel_history (from_radio_id, to_channel, msg_text, time_rx)
+    VALUES ('!00000001', '^all', 'radio check', '2024-01-01 12:00:00.000000'),
+           ('!00000002', '^all', 'anyone on the summit', '2024-01-01 12:05:00.000000');
+"""
+
+
+def baseline_database(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.close()
+    return path
+
+
+def test_new_database_is_at_the_latest_version(engine):
+    with engine.connect() as connection:
+        assert schema_version(connection) == len(MIGRATIONS)
+        assert inspect(connection).has_table("channel_history_fts")
+
+
+def test_baseline_database_is_migrated_with_its_data(tmp_path):
+    engine = open_engine(baseline_database(tmp_path / "old.db"))
+    with engine.connect() as connection:
+        assert schema_version(connection) == len(MIGRATIONS)
+        foreign = inspect(connection).get_foreign_keys("channel_history")
+        assert [key["referred_table"] for key in foreign] == ["nodes"]
+        assert {"packet_id", "rx_radio"} <= {column["name"] for column in
+                                              inspect(connection).get_columns("channel_history")}
+
+        nodes = connection.exec_driver_sql(
+            'SELECT radio_id, "lastHeard", typeof("lastHeard") FROM nodes ORDER BY id').fetchall()
+        assert [tuple(row) for row in nodes] == [("!00000001", 1700000000, "integer"), ("!00000002", None, "null")]
+
+        messages = connection.exec_driver_sql("SELECT msg_text FROM channel_history ORDER BY id").scalars().all()
+        assert messages == ["radio check", "anyone on the summit"]
+        # The messages already there are indexed for search
+        found = connection.exec_driver_sql(
+            "SELECT rowid FROM channel_history_fts WHERE channel_history_fts MATCH 'summit'").scalars().all()
+        assert found == [2]
+    engine.dispose()
+
+
+def test_migrating_again_changes_nothing(tmp_path):
+    path = baseline_database(tmp_path / "old.db")
+    open_engine(path).dispose()
+    engine = open_engine(path)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT count(*) FROM channel_history").scalar() == 2
+        assert connection.exec_driver_sql("SELECT count(*) FROM channel_history_fts").scalar() == 2
+    engine.dispose()
+
+
+def test_fts_triggers_follow_inserts_updates_and_deletes(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO channel_history (msg_text) VALUES ('meet at the trailhead')")
+        connection.exec_driver_sql("UPDATE channel_history SET msg_text = 'meet at the lake'")
+
+    def search(term: str) -> int:
+        with engine.connect() as connection:
+            return connection.exec_driver_sql(
+                "SELECT count(*) FROM channel_history_fts WHERE channel_history_fts MATCH ?", (term,)).scalar()
+
+    assert search("trailhead") == 0
+    assert search("lake") == 1
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM channel_history")
+    assert search("lake") == 0
+
+
+def test_newer_schema_is_refused(tmp_path):
+    path = tmp_path / "future.db"
+    connection = sqlite3.connect(path)
+    connection.execute(f"PRAGMA user_version={len(MIGRATIONS) + 1}")
+    connection.close()
+    with pytest.raises(RuntimeError):
+        open_engine(path)
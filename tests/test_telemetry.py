@@ -0,0 +1,126 @@
+import datetime
+
+import pytest
+from sqlalchemy.orm import Session
+
+from meshChatLib.telemetry import RingBuffer, TelemetryStore
+from meshChatLib.writer import BatchedWriter
+
+RADIO_ID = "!00000001"
+
+
+def utc(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+
+
+@pytest.fixture
+def clock(clock):
+    # Telemetry timestamps are epoch seconds, start on an hour
+    clock.now = 1700002800.0
+    return clock
+
+
+def test_ring_buffer_wraps_keeping_the_newest():
+    ring = RingBuffer(3)
+    for timestamp in range(5):
+        ring.append(timestamp, {"batteryLevel": 50 + timestamp})
+    assert len(ring) == 3
+    assert ring.series("batteryLevel") == [(2, 52), (3, 53), (4, 54)]
+
+
+def test_ring_buffer_skips_missing_metrics():
+    ring = RingBuffer(4)
+    ring.append(1, {"batteryLevel": 80, "voltage": 3.9})
+    ring.append(2, {"batteryLevel": 79})
+    assert ring.series("batteryLevel") == [(1, 80), (2, 79)]
+    assert ring.series("voltage") == [(1, pytest.approx(3.9))]
+    assert ring.series("airUtilTx") == []
+
+
+def test_samples_roll_up_into_minute_and_hour_buckets(clock):
+    rollups = list()
+    store = TelemetryStore(on_rollup=rollups.append)
+    for level in (80, 70, 90):
+        store.add(RADIO_ID, clock(), {"batteryLevel": level})
+        clock.advance(20)
+    assert rollups == []
+
+    # The next minute closes the first minute bucket, the hour stays open
+    store.add(RADIO_ID, clock(), {"batteryLevel": 60})
+    assert len(rollups) == 1
+    rollup = rollups[0]
+    assert (rollup["radio_id"], rollup["metric"], rollup["resolution"]) == (RADIO_ID, "batteryLevel", 60)
+    assert rollup["bucket_start"] == utc(1700002800)
+    assert (rollup["min_value"], rollup["max_value"], rollup["avg_value"], rollup["samples"]) == (70, 90, 80, 3)
+
+    hour, = store.trend(RADIO_ID, "batteryLevel", resolution=3600)
+    assert (hour.min, hour.max, hour.count) == (60, 90, 4)
+    assert [bucket.avg for bucket in store.trend(RADIO_ID, "batteryLevel", resolution=60)] == [80, 60]
+
+
+def test_bucket_boundaries(clock):
+    store = TelemetryStore(on_rollup=None)
+    # The last second of a minute and the first of the next
+    store.add(RADIO_ID, clock() + 59.9, {"voltage": 3.7})
+    store.add(RADIO_ID, clock() + 60, {"voltage": 3.8})
+    starts = [bucket.start for bucket in store.trend(RADIO_ID, "voltage", resolution=60)]
+    assert starts == [1700002800, 1700002860]
+    assert len(store.trend(RADIO_ID, "voltage", resolution=3600)) == 1
+
+
+def test_late_samples_only_reach_the_ring(clock):
+    store = TelemetryStore()
+    store.add(RADIO_ID, clock() + 120, {"batteryLevel": 50})
+    store.add(RADIO_ID, clock(), {"batteryLevel": 10})
+    assert [(bucket.start, bucket.count) for bucket in store.trend(RADIO_ID, "batteryLevel", resolution=60)] == [
+        (1700002920, 1)]
+    assert len(store.recent(RADIO_ID, "batteryLevel")) == 2
+
+
+def test_closed_history_is_bounded(clock):
+    store = TelemetryStore(history=2, resolutions=(60,))
+    for minute in range(5):
+        store.add(RADIO_ID, clock() + minute * 60, {"airUtilTx": minute})
+    # Two closed and the open one
+    assert [bucket.avg for bucket in store.trend(RADIO_ID, "airUtilTx", resolution=60)] == [2, 3, 4]
+
+
+def test_close_buckets_hands_over_the_partial_periods(clock):
+    rollups = list()
+    store = TelemetryStore(on_rollup=rollups.append)
+    store.add(RADIO_ID, clock(), {"batteryLevel": 80, "voltage": 3.9})
+    store.add("!00000002", clock(), {"channelUtilization": 12.5})
+    assert store.close_buckets() == 6
+    assert {(rollup["radio_id"], rollup["metric"], rollup["resolution"]) for rollup in rollups} == {
+        (RADIO_ID, "batteryLevel", 60), (RADIO_ID, "batteryLevel", 3600), (RADIO_ID, "voltage", 60),
+        (RADIO_ID, "voltage", 3600), ("!00000002", "channelUtilization", 60),
+        ("!00000002", "channelUtilization", 3600)}
+    assert store.close_buckets() == 0
+
+
+def test_rollups_persist_merge_and_warm(engine, clock):
+    writer = BatchedWriter(engine)
+    store = TelemetryStore(on_rollup=writer.add_rollup)
+    store.add(RADIO_ID, clock(), {"batteryLevel": 80})
+    store.add(RADIO_ID, clock() + 10, {"batteryLevel": 60})
+    store.close_buckets()
+    writer.flush()
+
+    # Restarted within the same hour: the rest of the period is merged into the stored row
+    store = TelemetryStore(on_rollup=writer.add_rollup)
+    store.add(RADIO_ID, clock() + 1800, {"batteryLevel": 40})
+    store.close_buckets()
+    writer.close()
+    with engine.connect() as connection:
+        row = connection.exec_driver_sql(
+            "SELECT min_value, max_value, avg_value, samples FROM telemetry_rollup "
+            "WHERE resolution = 3600 AND metric = 'batteryLevel'").one()
+    assert tuple(row) == (40, 80, pytest.approx(60), 3)
+    assert writer.stats["failed_rows"] == 0
+
+    warmed = TelemetryStore()
+    with Session(engine) as session:
+        assert warmed.warm(session) == 1
+    bucket, = warmed.trend(RADIO_ID, "batteryLevel")
+    assert (bucket.start, bucket.min, bucket.max, bucket.count) == (1700002800, 40, 80, 3)
+    assert warmed.radio_ids() == [RADIO_ID]
@@ -0,0 +1,118 @@
+import datetime
+
+import pytest
+
+from meshChatLib.utils import (AdminMsg, NodeParser, PositionMsg, Routing, TelemetryMsg, TextMsg, Utils,
+                               sender_id)
+
+
+def packet(decoded: dict, **fields) -> dict:
+    base = {"from": 0x1234abcd, "to": 0xFFFFFFFF, "fromId": "!1234abcd", "toId": "^all", "id": 77,
+            "rxTime": 1700000000, "rxSnr": 6.25, "rxRssi": -40, "hopLimit": 3, "priority": "RELIABLE",
+            "channel": 1, "decoded": decoded}
+    base.update(fields)
+    return base
+
+
+def test_text_message_fields():
+    msg = TextMsg(raw_msg=packet({"portnum": "TEXT_MESSAGE_APP", "payload": b"hi", "text": "hi"}))
+    assert (msg.text, msg.portnum, msg.payload) == ("hi", "TEXT_MESSAGE_APP", b"hi")
+    assert (msg.from_radio_id, msg.to_radio_id, msg.from_radio_num, msg.to_radio_num) == (
+        "!1234abcd", "^all", 0x1234abcd, 0xFFFFFFFF)
+    assert (msg.msg_id, msg.rxTime, msg.rx_time, msg.rxSnr, msg.rxRssi, msg.hopLimit, msg.priority, msg.channel) == (
+        77, 1700000000, 1700000000, 6.25, -40, 3, "RELIABLE", 1)
+    assert "text='hi'" in repr(msg)
+
+
+def test_missing_fields_are_none():
+    msg = TextMsg(raw_msg={})
+    assert msg.text is None and msg.portnum is None and msg.from_radio_id is None
+    # Channel 0 isn't sent by meshtastic
+    assert msg.channel == 0
+    assert TextMsg(raw_msg={"decoded": None}).text is None
+
+
+def test_sender_falls_back_to_the_node_number():
+    raw = packet({"portnum": "TEXT_MESSAGE_APP", "text": "hi"})
+    del raw["fromId"]
+    assert TextMsg(raw_msg=raw).from_radio_id == "!1234abcd"
+    assert sender_id({"fromId": "!00000001"}) == "!00000001"
+    assert sender_id({}) is None
+
+
+def test_messages_have_no_dict():
+    msg = TelemetryMsg(raw_msg={})
+    with pytest.raises(AttributeError):
+        msg.anything_else = 1
+
+
+def test_telemetry_device_metrics():
+    msg = TelemetryMsg(raw_msg=packet({"portnum": "TELEMETRY_APP", "telemetry": {
+        "time": 1700000100, "deviceMetrics": {"batteryLevel": 90, "voltage": 4.1, "channelUtilization": 12.5,
+                                              "airUtilTx": 1.5}}}))
+    assert (msg.timestamp, msg.batteryLevel, msg.voltage, msg.channelUtilization, msg.airUtilTx) == (
+        1700000100, 90, 4.1, 12.5, 1.5)
+
+
+def test_telemetry_without_device_metrics():
+    msg = TelemetryMsg(raw_msg=packet({"portnum": "TELEMETRY_APP", "telemetry": {
+        "environmentMetrics": {"temperature": 21.0}}}))
+    assert (msg.timestamp, msg.batteryLevel, msg.voltage, msg.channelUtilization, msg.airUtilTx) == (
+        None, None, None, None, None)
+
+
+def test_position_in_degrees():
+    msg = PositionMsg(raw_msg=packet({"portnum": "POSITION_APP", "position": {
+        "latitude": 40.5, "longitude": -74.25, "latitudeI": 405000000, "longitudeI": -742500000, "altitude": 10,
+        "time": 1700000200}}))
+    assert (msg.latitude, msg.longitude, msg.altitude, msg.time) == (40.5, -74.25, 10, 1700000200)
+
+
+def test_position_from_the_integer_form():
+    msg = PositionMsg(raw_msg=packet({"portnum": "POSITION_APP", "position": {
+        "latitudeI": 405000000, "longitudeI": -742500000}}))
+    assert msg.latitude == pytest.approx(40.5)
+    assert msg.longitude == pytest.approx(-74.25)
+    assert msg.altitude is None and msg.time is None
+
+
+def test_position_without_a_fix():
+    msg = PositionMsg(raw_msg=packet({"portnum": "POSITION_APP", "position": {}}))
+    assert msg.latitude is None and msg.longitude is None
+
+
+def test_admin_and_routing():
+    assert AdminMsg(raw_msg=packet({"portnum": "ADMIN_APP", "admin": {"getChannelRequest": 1}})).admin == {
+        "getChannelRequest": 1}
+    assert Routing(raw_msg=packet({"portnum": "ROUTING_APP", "routing": {"errorReason": "NO_ROUTE"}})
+                   ).errorReason == "NO_ROUTE"
+    assert Routing(raw_msg=packet({"portnum": "ROUTING_APP"})).errorReason is None
+
+
+def test_node_parser_as_dict():
+    node = NodeParser({"num": 0x1234abcd, "snr": 5.5, "lastHeard": 1700000000,
+                       "user": {"id": "!1234abcd", "longName": "Summit", "shortName": "SUMT", "macaddr": "mac-1",
+                                "hwModel": "TBEAM", "role": "ROUTER"},
+                       "deviceMetrics": {"batteryLevel": 80, "voltage": 3.9, "channelUtilization": 12.5,
+                                         "airUtilTx": 1.5},
+                       "position": {"latitudeI": 405000000, "longitudeI": -742500000, "altitude": 10,
+                                    "time": 1700000000, "latitude": 40.5, "longitude": -74.25}})
+    assert node.as_dict() == {
+        "radio_num": 0x1234abcd, "radio_id": "!1234abcd", "longName": "Summit", "shortName": "SUMT",
+        "macaddr": "mac-1", "hwModel": "TBEAM", "role": "ROUTER", "snr": 5.5, "lastHeard": 1700000000,
+        "batteryLevel": 80, "voltage": 3.9, "channelUtilization": 12.5, "airUtilTx": 1.5, "latitudeI": 405000000,
+        "longitudeI": -742500000, "altitude": 10, "time": 1700000000, "latitude": 40.5, "longitude": -74.25}
+
+
+def test_node_parser_with_only_a_user():
+    values = NodeParser({"user": {"id": "!00000001", "macaddr": "mac-1"}}).as_dict()
+    assert set(values) == set(NodeParser.FIELDS)
+    assert values["radio_id"] == "!00000001"
+    assert all(values[field] is None for field in NodeParser.FIELDS if field not in ("radio_id", "macaddr"))
+    assert NodeParser({}).as_dict()["macaddr"] is None
+
+
+def test_time_prefix_is_local_time_of_a_utc_datetime():
+    when = datetime.datetime(2024, 5, 1, 12, 0, 0)
+    expected = when.replace(tzinfo=datetime.timezone.utc).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+    assert Utils.time_prefix(when) == expected.ljust(20)
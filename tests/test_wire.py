@@ -0,0 +1,88 @@
+import io
+import struct
+
+import pytest
+
+from meshChatLib.wire import (FRAME_EVENT, FRAME_HEADER, MAX_FRAME, T_BIGINT, T_INT64, T_STR8, T_STR32, T_UINT8,
+                              frame, pack, read_frame, unpack)
+
+
+class FakeProtobuf(object):
+    def SerializeToString(self) -> bytes:
+        return b""
+
+
+PACKET = {"from": 0x1234abcd, "to": 0xFFFFFFFF, "fromId": "!1234abcd", "toId": "^all", "id": 3054110301,
+          "rxTime": 1700000000, "rxSnr": 6.25, "rxRssi": -40, "hopLimit": 3, "channel": 0, "viaMqtt": False,
+          "wantAck": True, "relayNode": None,
+          "decoded": {"portnum": "TEXT_MESSAGE_APP", "payload": b"hi \xf0\x9f\x93\xa1", "text": "hi \U0001f4e1",
+                      "bitfield": 1}}
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, 255, 256, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 63, -2 ** 64, 10 ** 254, 0.0, -1.5, 1e300,
+    "", "x" * 255, "x" * 256, "héllo", b"", b"\x00" * 255, b"\x00" * 256, [], list(range(300)), {}, PACKET,
+    {i: i for i in range(300)}, [{"a": [None, {"b": b"c"}]}],
+])
+def test_round_trip(value):
+    assert unpack(pack(value)) == value
+
+
+def test_ints_use_the_smallest_tag():
+    assert pack(255)[0] == T_UINT8
+    assert pack(256)[0] == T_INT64
+    assert pack(-1)[0] == T_INT64
+    assert pack(2 ** 63)[0] == T_BIGINT
+
+
+def test_bigint_length_is_a_single_byte():
+    largest = 10 ** 255 - 1
+    data = pack(largest)
+    assert data[:2] == bytes([T_BIGINT, 255])
+    assert unpack(data) == largest
+    with pytest.raises(ValueError):
+        pack(10 ** 255)
+
+
+def test_strings_switch_to_a_32_bit_length_at_256_bytes():
+    assert pack("x" * 255)[:2] == bytes([T_STR8, 255])
+    assert pack("x" * 256)[:5] == bytes([T_STR32]) + struct.pack(">I", 256)
+
+
+def test_tuples_come_back_as_lists_and_protobufs_are_dropped():
+    assert unpack(pack((1, 2))) == [1, 2]
+    assert unpack(pack({"decoded": {"text": "hi"}, "raw": FakeProtobuf()})) == {"decoded": {"text": "hi"}}
+    assert unpack(pack([FakeProtobuf()])) == [None]
+
+
+def test_bool_and_int_subclasses_keep_their_values():
+    import enum
+
+    class Priority(enum.IntEnum):
+        RELIABLE = 70
+
+    assert unpack(pack({"priority": Priority.RELIABLE, "ok": True})) == {"priority": 70, "ok": True}
+
+
+def test_bad_input_is_rejected():
+    with pytest.raises(TypeError):
+        pack(object())
+    with pytest.raises(ValueError):
+        unpack(b"\xff")
+    with pytest.raises(ValueError):
+        unpack(pack(1) + b"\x00")
+
+
+def test_frames_read_back_in_order():
+    stream = io.BytesIO(frame(FRAME_EVENT, PACKET) + frame(FRAME_EVENT, body=pack("again")))
+    assert read_frame(stream) == (FRAME_EVENT, PACKET)
+    assert read_frame(stream) == (FRAME_EVENT, "again")
+    assert read_frame(stream) == (None, None)
+
+
+def test_truncated_and_oversized_frames():
+    data = frame(FRAME_EVENT, PACKET)
+    assert read_frame(io.BytesIO(data[:-1])) == (None, None)
+    assert read_frame(io.BytesIO(data[:2])) == (None, None)
+    with pytest.raises(ValueError):
+        read_frame(io.BytesIO(FRAME_HEADER.pack(MAX_FRAME + 1, FRAME_EVENT)))
@@ -0,0 +1,59 @@
+from meshChatLib.writer import BatchedWriter
+
+
+def node(radio_id: str, macaddr: str, long_name: str = "Node") -> dict:
+    return {"radio_id": radio_id, "macaddr": macaddr, "longName": long_name, "shortName": long_name[:4],
+            "hwModel": "TBEAM"}
+
+
+def stored_nodes(engine) -> list:
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("SELECT id, radio_id, macaddr, longName FROM nodes ORDER BY id").fetchall()
+
+
+def test_node_upsert_merges_on_macaddr(engine):
+    writer = BatchedWriter(engine)
+    writer.upsert_node(node("!00000001", "mac-1", "Old name"))
+    writer.flush()
+    writer.upsert_node(node("!00000001", "mac-1", "New name"))
+    writer.close()
+    assert [tuple(row)[1:] for row in stored_nodes(engine)] == [("!00000001", "mac-1", "New name")]
+    assert writer.stats["failed_rows"] == 0
+
+
+def test_radio_id_moving_to_a_new_macaddr_moves_the_row(engine):
+    writer = BatchedWriter(engine)
+    writer.upsert_node(node("!00000001", "mac-1"))
+    writer.flush()
+    (old_id, _, _, _), = stored_nodes(engine)
+
+    writer.upsert_node(node("!00000001", "mac-2", "Reflashed"))
+    writer.close()
+
+    # Same row, so created_at and the id are kept
+    assert [tuple(row) for row in stored_nodes(engine)] == [(old_id, "!00000001", "mac-2", "Reflashed")]
+    assert writer.stats["failed_rows"] == 0
+
+
+def test_radio_id_moving_onto_a_stored_macaddr_drops_the_stale_row(engine):
+    writer = BatchedWriter(engine)
+    writer.upsert_node(node("!00000001", "mac-1"))
+    writer.upsert_node(node("!00000002", "mac-2"))
+    writer.flush()
+
+    writer.upsert_node(node("!00000001", "mac-2", "Swapped"))
+    writer.close()
+
+    assert [tuple(row)[1:] for row in stored_nodes(engine)] == [("!00000001", "mac-2", "Swapped")]
+    assert writer.stats["failed_rows"] == 0
+
+
+def test_pending_rows_are_visible_until_flushed(engine):
+    writer = BatchedWriter(engine, flush_interval=3600)
+    writer.add_message(from_radio_id="!00000001", to_channel="^all", msg_text="hello", packet_id=1)
+    writer.upsert_node(node("!00000001", "mac-1"))
+
+    assert [values["msg_text"] for values in writer.pending("message")] == ["hello"]
+    writer.flush()
+    assert writer.pending("message") == []
+    writer.close()